@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""End-to-end latency of bindit command line invocations. Puts a stub docker executable
+on PATH (with configurable version, --help output and simulated latency), times full
+invocations of the installed bindit and bindit_partial entry points, and reports
+percentiles across repeated runs. Run with
+
+    $ python benchmarks/cli_latency.py --repeats 50
+
+Scenarios:
+    import: cold python -c "import bindit.cli" (interpreter start and imports)
+    infer: bindit --dryrun docker run with an empty cache and a docker version without
+        a bundled table, so the docker CLI is inferred from docker run --help
+    plan: bindit --dryrun docker run with a warm cache
+    launch: bindit docker run, including launching the stub docker run
+    partial: bindit_partial bindit docker run (which plans the wrapped command
+        in-process, with the same settings as bindit --dryrun)
+
+Use --json to save the results for comparison over time."""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+import pathlib
+import bindit.docker
+
+SCENARIOS = ["import", "infer", "plan", "launch", "partial"]
+PERCENTILES = [50, 90, 99]
+# a docker version that is not in the bundled tables, so bindit has to infer the CLI
+UNKNOWN_VERSION = "99.0.0"
+STUB_DOCKER = """#!/bin/sh
+if [ "$1" = "--version" ]; then
+    echo "Docker version {version}, build bindit"
+    exit 0
+fi
+if [ "$1" = "run" ] && [ "$2" = "--help" ]; then
+    sleep {help_latency}
+    cat "{help_file}"
+    exit 0
+fi
+sleep {run_latency}
+exit 0
+"""
+
+
+def docker_help_text(version="20.10"):
+    """return docker run --help style output for the bundled docker run table for
+    version. Shorthand letters are paired with the first long flag of the same type
+    that starts with the same letter, which is close enough for timing purposes."""
+    valid_args, _ = bindit.docker.bundled_docker_cli(version)
+    long_flags = sorted(key for key in valid_args if key.startswith("--"))
+    pairs = {}
+    for letter in sorted(key for key in valid_args if not key.startswith("--")):
+        for key in long_flags:
+            if (
+                key[2] == letter[1].lower()
+                and valid_args[key] == valid_args[letter]
+                and key not in pairs
+            ):
+                pairs[key] = letter
+                break
+    rows = ["", "Usage:  docker run [OPTIONS] IMAGE [COMMAND] [ARG...]", "", "Options:"]
+    for key in long_flags:
+        flag = f"{pairs[key]}, {key}" if key in pairs else f"    {key}"
+        rows.append(f"  {flag} {valid_args[key]}".rstrip() + "  description")
+    return "\n".join(rows) + "\n"
+
+
+def write_stub_docker(directory, version, help_latency, run_latency):
+    """write a stub docker executable (and its --help output) to directory."""
+    directory = pathlib.Path(directory)
+    help_file = directory / "docker_run_help.txt"
+    help_file.write_text(docker_help_text())
+    stub = directory / "docker"
+    stub.write_text(
+        STUB_DOCKER.format(
+            version=version,
+            help_file=help_file,
+            help_latency=help_latency,
+            run_latency=run_latency,
+        )
+    )
+    stub.chmod(0o755)
+    return stub
+
+
+def percentile(samples, pct):
+    """nearest-rank percentile of samples."""
+    ordered = sorted(samples)
+    rank = max(1, -(-pct * len(ordered) // 100))
+    return ordered[int(rank) - 1]
+
+
+def time_command(command, env, cwd, repeats, setup=None):
+    """run command repeats times and return the wall times in milliseconds. setup (if
+    provided) is called before each run, outside the timing."""
+    times = []
+    for _ in range(repeats):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        subprocess.run(
+            command,
+            env=env,
+            cwd=cwd,
+            check=True,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        times.append((time.perf_counter() - start) * 1000)
+    return times
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description=__doc__.split("\n\n")[0],
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("-n", "--repeats", type=int, default=20)
+    parser.add_argument(
+        "--scenario",
+        action="append",
+        choices=SCENARIOS,
+        help="scenario to run (can be repeated, default all)",
+    )
+    parser.add_argument(
+        "--docker-version",
+        default="20.10.17",
+        help="version reported by the stub docker in the plan, launch and partial "
+        f"scenarios (the infer scenario always uses {UNKNOWN_VERSION})",
+    )
+    parser.add_argument(
+        "--help-latency",
+        type=float,
+        default=0.1,
+        help="simulated docker run --help latency in seconds",
+    )
+    parser.add_argument(
+        "--run-latency",
+        type=float,
+        default=0.0,
+        help="simulated docker run latency in seconds",
+    )
+    parser.add_argument("--json", default=None, help="also write results to this file")
+    args = parser.parse_args(argv)
+    scenarios = args.scenario or SCENARIOS
+    executables = {name: shutil.which(name) for name in ["bindit", "bindit_partial"]}
+    missing = [name for name, path in executables.items() if path is None]
+    if missing:
+        parser.error(f"not on path (pip install -e . first?): {', '.join(missing)}")
+
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="bindit_latency_") as workdir:
+        workdir = pathlib.Path(workdir)
+        cache_dir = workdir / "cache"
+        data_dir = workdir / "data"
+        data_dir.mkdir()
+        (data_dir / "input.txt").write_text("bindit\n")
+        env = {
+            key: value
+            for key, value in os.environ.items()
+            if key not in ["BINDIT_DOCKER_VERSION", "BINDIT_SOCKET"]
+        }
+        env["BINDIT_CACHE_DIR"] = str(cache_dir)
+
+        def stub_env(version):
+            stub_dir = workdir / f"stub-{version}"
+            stub_dir.mkdir(exist_ok=True)
+            write_stub_docker(stub_dir, version, args.help_latency, args.run_latency)
+            return dict(env, PATH=f"{stub_dir}{os.pathsep}{env['PATH']}")
+
+        def clear_cache():
+            shutil.rmtree(cache_dir, ignore_errors=True)
+
+        docker_run = ["docker", "run", "alpine:latest", "cat", "data/input.txt"]
+        commands = {
+            "import": ([sys.executable, "-c", "import bindit.cli"], None),
+            "infer": ([executables["bindit"], "--dryrun"] + docker_run, clear_cache),
+            "plan": ([executables["bindit"], "--dryrun"] + docker_run, None),
+            "launch": ([executables["bindit"]] + docker_run, None),
+            "partial": ([executables["bindit_partial"], "bindit"] + docker_run, None),
+        }
+        for scenario in scenarios:
+            command, setup = commands[scenario]
+            version = UNKNOWN_VERSION if scenario == "infer" else args.docker_version
+            run_env = stub_env(version)
+            if setup is None:
+                # warm up (fills the cache, pulls the interpreter into the page cache)
+                time_command(command, run_env, workdir, 1)
+            times = time_command(command, run_env, workdir, args.repeats, setup=setup)
+            results[scenario] = {
+                "min": min(times),
+                "max": max(times),
+                **{f"p{pct}": percentile(times, pct) for pct in PERCENTILES},
+                "repeats": len(times),
+            }
+
+    columns = ["min"] + [f"p{pct}" for pct in PERCENTILES] + ["max"]
+    print(f"{'scenario':<10}" + "".join(f"{column + ' (ms)':>12}" for column in columns))
+    for scenario, result in results.items():
+        print(
+            f"{scenario:<10}"
+            + "".join(f"{result[column]:>12.1f}" for column in columns)
+        )
+    if args.json:
+        with open(args.json, "w") as file_handle:
+            json.dump(
+                {
+                    "bindit_version": bindit.__version__,
+                    "python": sys.version.split()[0],
+                    "options": {
+                        key: value for key, value in vars(args).items() if key != "json"
+                    },
+                    "results": results,
+                },
+                file_handle,
+                indent=2,
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""Synthetic workloads for the bindit benchmarks. Everything lives in a temporary
+directory, so the benchmarks need nothing external (in particular, no docker)."""
+import logging
+import pathlib
+import pytest
+import bindit
+import bindit.docker
+
+# number of image arguments in the small, medium and large workloads (the large ones
+# take minutes, so they only run with --benchmark-large)
+LARGE = 100000
+SIZES = [10, 1000, pytest.param(LARGE, marks=pytest.mark.large)]
+# number of (existing) directories that the paths in a workload are spread across
+N_DIRS = 100
+# number of extra path components above those directories in the deep tree
+DEEP_DEPTH = 16
+# number of manual binds / ignore paths in the 'many' variants
+N_MANY = 1000
+DOCKER_VERSION = "20.10"
+
+
+def make_tree(root, depth):
+    """create N_DIRS directories under depth levels of nesting in root, and return
+    them."""
+    base = pathlib.Path(root).joinpath(*(f"level{ind}" for ind in range(depth)))
+    dirs = [base / f"dir{ind}" for ind in range(N_DIRS)]
+    for this_dir in dirs:
+        this_dir.mkdir(parents=True)
+    return dirs
+
+
+def image_args(dirs, n_args):
+    """return n_args distinct absolute file paths spread across dirs (the files do not
+    need to exist, since absolute paths are always rebased)."""
+    return [str(dirs[ind % len(dirs)] / f"file{ind}.txt") for ind in range(n_args)]
+
+
+def container_args(n_args):
+    """return roughly n_args docker run arguments (environment variables, volumes and
+    flags) followed by an image name."""
+    args = []
+    while len(args) < n_args:
+        ind = len(args)
+        args += ["-e", f"VAR{ind}=value{ind}", "-v", f"/src{ind}:/dest{ind}", "-it"]
+    return args[:n_args] + ["alpine:latest"]
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--benchmark-large",
+        action="store_true",
+        default=False,
+        help=f"also run the large ({LARGE} argument) bindit workloads",
+    )
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "large: large workload (see --benchmark-large)")
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("--benchmark-large"):
+        return
+    skip = pytest.mark.skip(reason="large workload, use --benchmark-large to run")
+    for item in items:
+        if "large" in item.keywords:
+            item.add_marker(skip)
+
+
+@pytest.fixture(scope="session", autouse=True)
+def quiet_logging():
+    """debug logging would dominate the timings."""
+    level = bindit.LOGGER.level
+    bindit.LOGGER.setLevel(logging.WARNING)
+    yield
+    bindit.LOGGER.setLevel(level)
+
+
+@pytest.fixture(scope="session")
+def docker_schema():
+    """docker run (valid_args, valid_letters) from the bundled tables."""
+    return bindit.docker.bundled_docker_cli(DOCKER_VERSION)
+
+
+@pytest.fixture(scope="session", params=["shallow", "deep"])
+def tree(request, tmp_path_factory):
+    """existing directories in a shallow or deep tree."""
+    depth = 0 if request.param == "shallow" else DEEP_DEPTH
+    return make_tree(tmp_path_factory.mktemp(f"bindit_{request.param}_"), depth)
+
+
+@pytest.fixture(params=["no", "many"])
+def manual_binds(request, tree):
+    """no manual binds, or N_MANY manual binds (of which only the first few match any
+    paths in tree)."""
+    if request.param == "no":
+        return {}
+    binds = {
+        pathlib.Path(f"/nonexistent/bind{ind}"): pathlib.PosixPath(f"/manual{ind}")
+        for ind in range(N_MANY)
+    }
+    for ind, this_dir in enumerate(tree[:10]):
+        binds[this_dir] = pathlib.PosixPath(f"/manual/dir{ind}")
+    return binds
+
+
+@pytest.fixture(params=["default", "many"])
+def ignore_index(request):
+    """the default IGNORE_PATH index, or one with N_MANY extra (non-matching) paths."""
+    paths = list(bindit.IGNORE_PATH)
+    if request.param == "many":
+        paths += [pathlib.Path(f"/nonexistent/ignore{ind}") for ind in range(N_MANY)]
+    return bindit.PathTrie(paths)
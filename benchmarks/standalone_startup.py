@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Startup time of the standalone bindit builds (see buildapp) against a regular
+install. Each format is timed on bindit --version (which goes through the full command
+line interface) and on a dryrun docker run (the fast path, with a bundled docker run
+table so no docker is needed), and percentiles across repeated runs are reported. Run
+with
+
+    $ ./buildapp onefile; ./buildapp onedir; ./buildapp zipapp
+    $ python benchmarks/standalone_startup.py --repeats 50
+
+Formats that have not been built are skipped. PyInstaller onefile builds unpack
+themselves to TMPDIR on every call, so use --tmpdir to see what that costs on a
+particular file system (e.g., a network home directory)."""
+import os
+import sys
+import shutil
+import argparse
+import tempfile
+import pathlib
+from cli_latency import PERCENTILES, percentile, time_command
+
+# format name -> path of the bindit executable relative to the dist directory
+FORMATS = {
+    "onefile": "standalone/bindit",
+    "onedir": "standalone_onedir/bindit/bindit",
+    "zipapp": "standalone_zipapp/bindit",
+}
+DOCKER_VERSION = "20.10"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description=__doc__.split("\n\n")[0],
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("-n", "--repeats", type=int, default=20)
+    parser.add_argument(
+        "--dist", default="dist", help="buildapp output directory (default dist)"
+    )
+    parser.add_argument(
+        "--format",
+        action="append",
+        metavar="NAME=PATH",
+        help="time the bindit executable at PATH as NAME instead of the buildapp "
+        "outputs (can be repeated)",
+    )
+    parser.add_argument(
+        "--tmpdir", default=None, help="TMPDIR for the timed runs (default unchanged)"
+    )
+    args = parser.parse_args(argv)
+    if args.format:
+        executables = dict(spec.split("=", 1) for spec in args.format)
+    else:
+        executables = {"install": shutil.which("bindit")}
+        executables.update(
+            {name: pathlib.Path(args.dist) / path for name, path in FORMATS.items()}
+        )
+    env = dict(os.environ, BINDIT_DOCKER_VERSION=DOCKER_VERSION)
+    if args.tmpdir:
+        env["TMPDIR"] = args.tmpdir
+
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="bindit_startup_") as workdir:
+        commands = {
+            "version": ["--version"],
+            "docker run": ["--dryrun", "docker", "run", "alpine:latest", "ls", workdir],
+        }
+        for name, executable in executables.items():
+            if not executable or not os.access(executable, os.X_OK):
+                print(f"skipping {name}: not built ({executable})", file=sys.stderr)
+                continue
+            for command_name, command in commands.items():
+                command = [str(executable)] + command
+                # warm up (page cache, bytecode cache for the regular install)
+                time_command(command, env, workdir, 1)
+                times = time_command(command, env, workdir, args.repeats)
+                results[(name, command_name)] = times
+
+    columns = ["min"] + [f"p{pct}" for pct in PERCENTILES] + ["max"]
+    print(
+        f"{'format':<10}{'command':<12}"
+        + "".join(f"{column + ' (ms)':>12}" for column in columns)
+    )
+    for (name, command_name), times in results.items():
+        values = [min(times)] + [percentile(times, pct) for pct in PERCENTILES]
+        values.append(max(times))
+        print(
+            f"{name:<10}{command_name:<12}"
+            + "".join(f"{value:>12.1f}" for value in values)
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""Benchmarks of the bindit parsing and rewriting hot paths, at 10, 1k and 100k
+arguments (see conftest.py for the workloads). Run with
+
+    $ py.test benchmarks --benchmark-autosave
+
+and compare against an earlier run with --benchmark-compare (see pytest-benchmark). Add
+--benchmark-large to include the 100k argument workloads. Each call gets a new
+PathResolver, so file system queries are included in the timings."""
+import functools
+import pathlib
+import pytest
+import bindit
+import bindit.docker
+from conftest import LARGE, SIZES, N_DIRS, image_args, container_args
+
+# the large workloads take up to a minute per call, so don't let pytest-benchmark
+# calibrate
+LARGE_ROUNDS = 1
+
+
+def run(benchmark, function, n_args, setup=None):
+    """benchmark function, with a fixed number of rounds for the large workloads.
+    setup (if provided) returns the arguments for each call."""
+    if n_args >= LARGE or setup is not None:
+        if setup is None:
+            setup = lambda: ((), {})  # noqa: E731
+        return benchmark.pedantic(
+            function,
+            setup=setup,
+            rounds=LARGE_ROUNDS if n_args >= LARGE else 100,
+            iterations=1,
+        )
+    return benchmark(function)
+
+
+@pytest.mark.parametrize("n_args", SIZES)
+def test_arg_pairs(benchmark, n_args):
+    args = [f"arg{ind}" for ind in range(n_args)]
+    pairs = run(benchmark, lambda: list(bindit.arg_pairs(args)), n_args)
+    assert len(pairs) == n_args
+
+
+@pytest.mark.parametrize("n_args", SIZES)
+def test_parse_container_args(benchmark, docker_schema, n_args):
+    valid_args, valid_letters = docker_schema
+    args = container_args(n_args)
+
+    def parse():
+        return bindit.parse_container_args(
+            bindit.arg_pairs(args),
+            bind_parser=bindit.docker.BIND_PARSER,
+            valid_args=valid_args,
+            valid_letters=valid_letters,
+        )
+
+    _, _, container_name = run(benchmark, parse, n_args)
+    assert container_name == "alpine:latest"
+
+
+@pytest.mark.parametrize("n_args", SIZES)
+def test_arg_to_file_paths(benchmark, tree, ignore_index, n_args):
+    args = image_args(tree, n_args)
+
+    def detect():
+        resolver = bindit.PathResolver()
+        return [
+            path
+            for arg in args
+            for path in bindit.arg_to_file_paths(
+                arg, resolver=resolver, ignore_index=ignore_index
+            )
+        ]
+
+    assert len(run(benchmark, detect, n_args)) == n_args
+
+
+@pytest.mark.parametrize("n_args", SIZES)
+def test_parse_image_args(benchmark, tree, manual_binds, n_args):
+    args = image_args(tree, n_args)
+
+    def parse():
+        return bindit.parse_image_args(bindit.arg_pairs(args), manual_binds)
+
+    out_args, new_binds = run(benchmark, parse, n_args)
+    assert len(out_args) == n_args
+    assert len(new_binds) <= N_DIRS
+
+
+@pytest.mark.parametrize("n_args", SIZES)
+@pytest.mark.parametrize("separator", [",", ":"])
+def test_rebase_arg_path_list(benchmark, tree, separator, n_args):
+    # a single argument with n_args paths (e.g., --inputs=a,b,c,...)
+    arg = "--inputs=" + separator.join(image_args(tree, n_args))
+
+    def rebase():
+        return bindit.rebase_arg(arg, bindit.PathTrie(), {})
+
+    out_arg = run(benchmark, rebase, n_args)
+    assert out_arg.count("/bindit/") == n_args
+
+
+@pytest.mark.parametrize("n_args", SIZES)
+def test_parse_image_args_arg_cache(benchmark, tree, n_args):
+    # repeated invocations with the same arguments (e.g., bindit docker batch), with a
+    # warm cache but a new resolver for each call
+    args = image_args(tree, n_args)
+    arg_cache = bindit.ArgCache(maxsize=n_args)
+    bindit.parse_image_args(bindit.arg_pairs(args), {}, arg_cache=arg_cache)
+
+    def parse():
+        return bindit.parse_image_args(
+            bindit.arg_pairs(args),
+            {},
+            resolver=bindit.PathResolver(),
+            arg_cache=arg_cache,
+        )
+
+    out_args, new_binds = run(benchmark, parse, n_args)
+    assert len(out_args) == n_args
+    assert arg_cache.counts["misses"] == n_args
+
+
+@pytest.mark.parametrize("n_args", SIZES)
+def test_remove_redundant_binds(benchmark, n_args):
+    # a mix of top-level directories and their sub-directories
+    binds = {}
+    for ind in range(n_args):
+        path = pathlib.Path(f"/top{ind % 100}").joinpath(
+            *(f"sub{ind}" for _ in range(ind % 4))
+        )
+        binds[path] = pathlib.PosixPath("/bindit") / path.relative_to("/")
+
+    def setup():
+        return (dict(binds),), {}
+
+    run(benchmark, bindit.remove_redundant_binds, n_args, setup=setup)
+
+
+@pytest.mark.parametrize("n_args", SIZES)
+def test_coalesce_binds(benchmark, n_args):
+    # one bind per leaf directory of a three-level tree, merged down to 10 binds
+    binds = {}
+    for ind in range(n_args):
+        path = pathlib.Path(f"/top{ind % 10}/mid{ind % 100}/leaf{ind}")
+        binds[path] = pathlib.PosixPath("/bindit") / path.relative_to("/")
+
+    def setup():
+        return (dict(binds), 10, bindit.PathTrie(bindit.IGNORE_PATH)), {}
+
+    run(benchmark, bindit.coalesce_binds, n_args, setup=setup)
+
+
+@pytest.mark.parametrize("n_args", SIZES)
+def test_bind_dict_to_arg(benchmark, tree, n_args):
+    binds = {
+        tree[ind % len(tree)] / f"sub{ind}": pathlib.PosixPath(f"/bindit/sub{ind}")
+        for ind in range(n_args)
+    }
+
+    def convert():
+        mapper = functools.partial(
+            bindit.docker.volume_bind_args, resolver=bindit.PathResolver()
+        )
+        return list(bindit.bind_dict_to_arg(mapper, binds))
+
+    assert len(run(benchmark, convert, n_args)) == 2 * n_args
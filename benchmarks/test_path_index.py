@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""Benchmarks of ignore path / manual bind lookups: the linear scan that bindit used to
+do against bindit.PathTrie. The trie lookup time should stay flat as the number of
+indexed paths grows."""
+import pathlib
+import random
+import pytest
+import bindit
+
+N_QUERIES = 1000
+# the linear scan gets very slow with many entries, so time it on fewer queries
+N_LINEAR_QUERIES = 20
+DEPTH = 8
+
+
+def random_path(rng, depth):
+    return pathlib.Path("/").joinpath(*(f"d{rng.randrange(20)}" for _ in range(depth)))
+
+
+def linear_lookup(entries, path):
+    """the old approach: scan every entry against every parent of path."""
+    return next(
+        (entry for entry in entries if entry == path or entry in path.parents), None
+    )
+
+
+@pytest.fixture(params=[10, 100, 1000, 10000])
+def entries(request):
+    rng = random.Random(request.param)
+    return [random_path(rng, rng.randrange(2, DEPTH)) for _ in range(request.param)]
+
+
+@pytest.fixture(scope="module")
+def queries():
+    rng = random.Random(0)
+    return [random_path(rng, DEPTH) for _ in range(N_QUERIES)]
+
+
+def test_linear_lookup(benchmark, entries, queries):
+    queries = queries[:N_LINEAR_QUERIES]
+    benchmark.extra_info["queries"] = len(queries)
+    benchmark(lambda: [linear_lookup(entries, query) for query in queries])
+
+
+def test_trie_lookup(benchmark, entries, queries):
+    index = bindit.PathTrie(entries)
+    # check that both approaches agree before timing
+    for query in queries[:N_LINEAR_QUERIES]:
+        linear = linear_lookup(entries, query)
+        assert (linear is None) == (index.longest_prefix(query) is None)
+    benchmark.extra_info["queries"] = len(queries)
+    benchmark(lambda: [index.longest_prefix(query) for query in queries])
@@ -1,5 +1,16 @@
 # -*- coding: utf-8 -*-
+# first, so that bindit.timings.IMPORT_START covers the rest of the import
+from bindit import timings
+import os
+import stat
+import json
+import tempfile
+import fnmatch
+import contextlib
+import functools
 import logging
+import bisect
+import collections
 import itertools
 import pathlib
 import shlex
@@ -11,14 +22,12 @@ __author__ = """Johan Carlin"""
 __email__ = "johan.carlin@gmail.com"
 __version__ = "0.2.2"
 
-logging.basicConfig(
-    format="%(asctime)s %(filename)s %(funcName)s %(message)s",
-    datefmt="%Y/%m/%d %H:%M",
-    level="INFO",
-)
 LOGGER = logging.getLogger("bindit")
 DRY_RUN = False
+EXEC = False
 ABS_ONLY = False
+# write plans to this file (- for stdout) instead of running them (see bindit.planfile)
+PLAN_OUTPUT = None
 IGNORE_PATH = [
     pathlib.Path(p)
     for p in [
@@ -32,6 +41,244 @@ IGNORE_PATH = [
     ]
 ]
 ARG_SPLIT_PATTERN = "|".join("=:,")
+# see shell_tokens (same as shlex in POSIX mode)
+SHELL_WHITESPACE = " \t\r\n"
+SHELL_SPECIAL = set("'\"\\")
+SHELL_WORD = re.compile(f"[^{SHELL_WHITESPACE}]+")
+# file name patterns (fnmatch) of path list files, whose listed paths are bound too (see
+# scan_path_list)
+SCAN_LISTS = []
+# pass rebased copies of path list files to the container, rather than binding the
+# listed paths at their host paths (see scan_path_list)
+REBASE_LISTS = True
+# rebased copies of path list files written since the last take_rebased_lists
+REBASED_LISTS = []
+# directories that container images provide, and that listed paths must therefore not
+# be bound over at their host paths (nor may top-level directories, see rebase_dir)
+CONTAINER_PATHS = [
+    pathlib.Path(p)
+    for p in [
+        "/bin",
+        "/boot",
+        "/dev",
+        "/etc",
+        "/home",
+        "/lib",
+        "/lib32",
+        "/lib64",
+        "/libx32",
+        "/opt",
+        "/proc",
+        "/root",
+        "/run",
+        "/sbin",
+        "/sys",
+        "/usr",
+        "/var",
+    ]
+]
+# number of path list lines that share a PathResolver
+SCAN_CHUNK = 10000
+# default maximum number of arguments that an ArgCache remembers
+ARG_CACHE_SIZE = 10000
+# maximum number of bind mounts (manual and new), or None for no limit (see
+# coalesce_binds)
+MAX_BINDS = None
+# image argument flags (fnmatch patterns) that take output paths, which are outputs
+# even if they exist (see is_output)
+OUTPUT_FLAGS = ["-o", "--out*", "-out*"]
+
+
+def configure_logging(loglevel="INFO"):
+    """set up log messages for the command line interfaces (importing bindit as a
+    library leaves logging configuration to the application)."""
+    logging.basicConfig(
+        format="%(asctime)s %(filename)s %(funcName)s %(message)s",
+        datefmt="%Y/%m/%d %H:%M",
+        level="INFO",
+    )
+    LOGGER.setLevel(loglevel)
+
+
+def read_package_data(resource):
+    """return the contents (bytes) of a bindit package data file (e.g.,
+    data/docker_run.json). Goes through the package loader like pkgutil.get_data (so it
+    works from zipapps and frozen builds too), without the cost of importing pkgutil."""
+    return __spec__.loader.get_data(os.path.join(os.path.dirname(__file__), resource))
+
+
+class PathResolver(object):
+    """Memoizes the file system queries that bindit makes (resolve, exists, is_dir).
+    Create one per invocation and pass it to parse_container_args, parse_image_args
+    and the bind builders (e.g., bindit.docker.volume_bind_args), so that each distinct
+    path is resolved and stat'ed at most once. Relative paths are memoized as given, so
+    a resolver should not outlive a change of working directory. counts holds the number
+    of resolve and stat calls, and how many of them reached the file system (realpath
+    and os_stat)."""
+
+    def __init__(self):
+        self._resolved = {}
+        self._stat = {}
+        self.counts = collections.Counter()
+
+    def resolve(self, path):
+        """return the memoized pathlib.Path.resolve() of path."""
+        self.counts["resolve"] += 1
+        path = pathlib.Path(path)
+        try:
+            return self._resolved[path]
+        except KeyError:
+            pass
+        # same as path.resolve(), minus the extra stat call pathlib makes to detect
+        # symlink loops
+        self.counts["realpath"] += 1
+        resolved = pathlib.Path(os.path.realpath(path))
+        self._resolved[path] = resolved
+        # resolving an already resolved path is a no-op
+        self._resolved[resolved] = resolved
+        return resolved
+
+    def stat(self, path):
+        """return the memoized os.stat result for the resolved path, or None if it does
+        not exist."""
+        self.counts["stat"] += 1
+        resolved = self.resolve(path)
+        try:
+            return self._stat[resolved]
+        except KeyError:
+            pass
+        self.counts["os_stat"] += 1
+        try:
+            result = os.stat(resolved)
+        except (OSError, ValueError):
+            result = None
+        self._stat[resolved] = result
+        return result
+
+    def exists(self, path):
+        """return True if the resolved path exists."""
+        return self.stat(path) is not None
+
+    def is_dir(self, path):
+        """return True if the resolved path is a directory."""
+        result = self.stat(path)
+        return result is not None and stat.S_ISDIR(result.st_mode)
+
+
+class PathTrie(object):
+    """Index of paths by their components. Answers "what is the deepest indexed path
+    that is this path or one of its parents" in O(depth), independent of the number of
+    indexed paths. Used for IGNORE_PATH and manual bind lookups."""
+
+    # parts are always str, so None can't collide with a path component
+    _ENTRY = None
+
+    def __init__(self, paths=()):
+        self._root = {}
+        self._len = 0
+        for path in paths:
+            self.add(path)
+
+    def __len__(self):
+        return self._len
+
+    def add(self, path, value=None):
+        """index path (with an optional value to return on lookup)."""
+        path = pathlib.Path(path)
+        node = self._root
+        for part in path.parts:
+            node = node.setdefault(part, {})
+        if self._ENTRY not in node:
+            self._len += 1
+        node[self._ENTRY] = (path, value)
+
+    def longest_prefix(self, path):
+        """return (indexed path, value) for the deepest indexed path that is path or
+        one of its parents, or None if there is no such path."""
+        node = self._root
+        found = None
+        for part in pathlib.PurePath(path).parts:
+            node = node.get(part)
+            if node is None:
+                break
+            found = node.get(self._ENTRY, found)
+        return found
+
+    def has_subtree(self, path):
+        """return True if path or any path under it is indexed."""
+        node = self._root
+        for part in pathlib.PurePath(path).parts:
+            node = node.get(part)
+            if node is None:
+                return False
+        # nodes only exist on the way to indexed paths
+        return True
+
+
+class RunPlan(
+    collections.namedtuple(
+        "RunPlan",
+        [
+            "runner",
+            "container_args",
+            "bind_args",
+            "container_name",
+            "image_args",
+            "manual_binds",
+            "new_binds",
+            "env",
+        ],
+        defaults=[None],
+    )
+):
+    """A planned container runner invocation (see e.g. bindit.docker.plan_run). Fields
+    are lists of arguments, except container_name (str), manual_binds and new_binds
+    (dicts as returned by parse_container_args and parse_image_args), and env (optional
+    dict of environment variables to set for the container runner)."""
+
+    __slots__ = ()
+
+    def command(self):
+        """return the final container runner command as a list."""
+        return (
+            self.runner
+            + self.container_args
+            + self.bind_args
+            + [self.container_name]
+            + self.image_args
+        )
+
+    def command_line(self):
+        """return the final command as a quoted shell string, with any environment
+        variables as assignments in front of it."""
+        assignments = [
+            f"{key}={shlex.quote(str(value))}" for key, value in (self.env or {}).items()
+        ]
+        return " ".join(
+            assignments + [shlex.quote(str(arg)) for arg in self.command()]
+        )
+
+
+def manifest_args(line):
+    """Return the list of arguments in a manifest line (see read_manifest), or None for
+    empty lines and lines starting with #. Raises ValueError for malformed lines."""
+    line = line.strip()
+    if not line or line.startswith("#"):
+        return None
+    if line.startswith("["):
+        return [str(arg) for arg in json.loads(line)]
+    return shlex.split(line)
+
+
+def read_manifest(lines):
+    """Generator that returns a list of arguments for each line in lines (e.g., an open
+    manifest file). Lines are either a JSON list of arguments (JSONL) or shell-quoted
+    arguments (split with shlex.split). Empty lines and lines starting with # are
+    skipped."""
+    for line in lines:
+        args = manifest_args(line)
+        if args is not None:
+            yield args
 
 
 def arg_pairs(args):
@@ -45,15 +292,110 @@ def arg_pairs(args):
 
 
 def remove_redundant_binds(binds):
-    """Remove entries in the dict binds that are sub-directories of another key.
-    Operates in-place.
+    """Remove entries in the dict binds that are sub-directories of another key, and
+    that the parent bind already makes available at the same destination (so that e.g.
+    a sub-directory that is bound at its host path stays if the parent is bound under
+    /bindit). Destinations of None are treated as consistent. Operates in-place.
     """
-    sources = set(binds.keys())
-    for candidate in sources:
-        remaining = sources ^ set([candidate])
-        # if a parent of candidate is already bound, we can safely remove it
-        if any([test in candidate.parents for test in remaining]):
-            del binds[candidate]
+    # sorting by path components places every directory immediately before its
+    # sub-directories, so a single sweep over a stack of kept ancestors finds all
+    # redundant entries in O(n log n)
+    kept = []
+    for candidate in sorted(binds.keys(), key=lambda path: path.parts):
+        parts = candidate.parts
+        while kept and parts[: len(kept[-1].parts)] != kept[-1].parts:
+            kept.pop()
+        if kept:
+            parent = kept[-1]
+            dest = binds[candidate]
+            if dest is None or binds[parent] is None:
+                consistent = True
+            else:
+                consistent = dest == binds[parent] / candidate.relative_to(parent)
+            if consistent:
+                # a parent of candidate is already bound, so we can safely remove it
+                del binds[candidate]
+                continue
+        kept.append(candidate)
+    return
+
+
+def merged_dest(binds, sources, parent):
+    """Return the destination for binding parent in place of sources (keys in the dict
+    binds, all under parent) that keeps every source at its current destination, or
+    None if there is no such destination (e.g., because some sources are bound under
+    /bindit and others at their host paths)."""
+    found = None
+    for source in sources:
+        dest = binds[source]
+        if dest is None:
+            continue
+        rel = source.parts[len(parent.parts) :]
+        if rel and dest.parts[-len(rel) :] != rel:
+            return None
+        base = dest.parts[: len(dest.parts) - len(rel)]
+        if found is not None and base != found:
+            return None
+        found = base
+    if found is None or len(found) < 2:
+        # no destination to go on, or the container root
+        return None
+    return pathlib.PosixPath(*found)
+
+
+def coalesce_binds(binds, max_binds, ignore_index=None):
+    """Merge entries in the dict binds (source: dest, see remove_redundant_binds) into
+    their nearest common parent directories until there are at most max_binds. Parents
+    are merged deepest first, so that as little of the host tree as possible is exposed
+    beyond what was bound before. Parents that are (or contain) a path in ignore_index
+    (PathTrie, default built from IGNORE_PATH) or the root are never bound, and nor are
+    parents that can't keep every merged source at its current destination (see
+    merged_dest), so paths that were already rebased onto binds stay valid. Operates
+    in-place."""
+    if len(binds) <= max_binds:
+        return
+    if ignore_index is None:
+        ignore_index = PathTrie(IGNORE_PATH)
+    sources = sorted(binds.keys(), key=lambda path: path.parts)
+    source_parts = [source.parts for source in sources]
+    # every branching point is the common parent of two neighbours in sorted order
+    parents = set()
+    for first, second in zip(source_parts, source_parts[1:]):
+        common = os.path.commonprefix([first, second])
+        if len(common) > 1:
+            parents.add(common)
+    # deepest first (in path order at each depth, so the result is deterministic)
+    for parts in sorted(parents, key=lambda parts: (-len(parts), parts)):
+        if len(binds) <= max_binds:
+            break
+        parent = pathlib.Path(*parts)
+        # never expose ignored paths, or bind under them
+        if ignore_index.has_subtree(parent):
+            continue
+        if ignore_index.longest_prefix(parent) is not None:
+            continue
+        start = bisect.bisect_left(source_parts, parts)
+        stop = start
+        while (
+            stop < len(source_parts)
+            and source_parts[stop][: len(parts)] == parts
+        ):
+            stop += 1
+        merged = sources[start:stop]
+        dest = merged_dest(binds, merged, parent)
+        if dest is None:
+            LOGGER.debug(f"can't merge {len(merged)} binds into {parent}")
+            continue
+        for source in merged:
+            del binds[source]
+        binds[parent] = dest
+        LOGGER.debug(f"merged {len(merged)} binds into {parent}:{dest}")
+        sources[start:stop] = [parent]
+        source_parts[start:stop] = [parts]
+    if len(binds) > max_binds:
+        LOGGER.warning(
+            f"could not merge binds down to {max_binds} (left with {len(binds)})"
+        )
     return
 
 
@@ -76,8 +418,29 @@ def bind_dict_to_arg(mapper, new_binds):
     )
 
 
+@functools.lru_cache(maxsize=None)
+def accepts_resolver(function):
+    """Return True if function takes a resolver keyword argument (e.g., the bind_parser
+    functions in bindit.docker.BIND_PARSER), or arbitrary keyword arguments."""
+    code = getattr(function, "__code__", None)
+    if code is not None:
+        # plain functions, without importing inspect on the docker run hot path
+        names = code.co_varnames[: code.co_argcount + code.co_kwonlyargcount]
+        # 0x08 is inspect.CO_VARKEYWORDS (**kwargs)
+        return "resolver" in names or bool(code.co_flags & 0x08)
+    import inspect
+
+    try:
+        parameters = inspect.signature(function).parameters
+    except (TypeError, ValueError):
+        return False
+    return "resolver" in parameters or any(
+        parameter.kind == parameter.VAR_KEYWORD for parameter in parameters.values()
+    )
+
+
 def parse_container_args(
-    args_iter, bind_parser=None, valid_args=None, valid_letters=None
+    args_iter, bind_parser=None, valid_args=None, valid_letters=None, resolver=None
 ):
     """Parse arguments to container runner (e.g., docker run). Typically used as the
     first pass of a CLI application (e.g., bindit.docker.docker).
@@ -85,13 +448,17 @@ def parse_container_args(
     Args:
         args_iter (iterator): arg_pairs iterator of arguments
         bind_parser (dict): keys as bind mount flags and values as handles to functions
-            that parse such flags into a {source: dest} dict. See e.g.
-            bindit.docker.BIND_PARSER
+            that parse such flags into a {source: dest} dict. Called as
+            bind_parser[key](val, resolver=resolver) if the function takes a resolver
+            argument (see accepts_resolver), otherwise as bind_parser[key](val). See
+            e.g. bindit.docker.BIND_PARSER
         valid_args (dict) : keys as valid container runner arguments and values as the
             expected type of the argument (or non for boolean flags). See e.g.
             bindit.docker.ARGS
         valid_letters (set): single-letter boolean flags. Used to detect arbitrary
             combinations of letters (e.g., docker run -it)
+        resolver (PathResolver): memoizes file system queries, and is passed on to
+            bind_parser functions (default new instance)
 
     Returns:
         tuple: (list: detected args to the container runner (DOES NOT include any new
@@ -99,6 +466,8 @@ def parse_container_args(
             (manual_binds[source] = dest), str: detected container image)
 
     """
+    if resolver is None:
+        resolver = PathResolver()
     container_args = []
     manual_binds = {}
     gotkv = False
@@ -106,7 +475,11 @@ def parse_container_args(
         if key in bind_parser:
             # here's a user-defined volume bind. Let's make sure we don't mess with it
             # if it appears in the container image arguments
-            user_bind = bind_parser[key](val)
+            parser = bind_parser[key]
+            if accepts_resolver(parser):
+                user_bind = parser(val, resolver=resolver)
+            else:
+                user_bind = parser(val)
             manual_binds.update(user_bind)
             LOGGER.debug(f"added user-defined bind to manual_binds: {user_bind}")
         if key in valid_args:
@@ -138,41 +511,487 @@ def parse_container_args(
     return container_args, manual_binds, container_name
 
 
-def arg_to_file_paths(arg):
+def shell_tokens(arg):
+    """Generator that splits arg like shlex.split (POSIX mode, no comments), returning
+    (token, positions) tuples where positions[i] is the index in arg of token[i]. Quotes
+    and escape characters are removed from the token, so positions can skip. Raises
+    ValueError for unbalanced quotes and trailing escapes, like shlex.split."""
+    if not (SHELL_SPECIAL & set(arg)):
+        # nothing to unquote (the common case), so tokens map straight onto arg
+        for match in SHELL_WORD.finditer(arg):
+            start, end = match.span()
+            yield match.group(), range(start, end)
+        return
+    token, positions = [], []
+    # None between tokens, "a" in a word, or the open quote character
+    state = None
+    ind = 0
+    while ind < len(arg):
+        char = arg[ind]
+        if state in ("'", '"'):
+            if char == state:
+                state = "a"
+            elif char == "\\" and state == '"':
+                if ind + 1 == len(arg):
+                    raise ValueError("No escaped character")
+                # inside double quotes, only quotes and escapes can be escaped
+                if arg[ind + 1] in ('"', "\\"):
+                    ind += 1
+                else:
+                    token.append(char)
+                    positions.append(ind)
+                    ind += 1
+                token.append(arg[ind])
+                positions.append(ind)
+            else:
+                token.append(char)
+                positions.append(ind)
+        elif char in SHELL_WHITESPACE:
+            if state is not None:
+                yield "".join(token), positions
+                token, positions = [], []
+                state = None
+        elif char in ("'", '"'):
+            state = char
+        elif char == "\\":
+            if ind + 1 == len(arg):
+                raise ValueError("No escaped character")
+            ind += 1
+            token.append(arg[ind])
+            positions.append(ind)
+            state = "a"
+        else:
+            token.append(char)
+            positions.append(ind)
+            state = "a"
+        ind += 1
+    if state in ("'", '"'):
+        raise ValueError("No closing quotation")
+    if state is not None:
+        yield "".join(token), positions
+
+
+def arg_spans(arg):
+    """Generator that splits arg according to shell characters (see shell_tokens) and
+    on ARG_SPLIT_PATTERN, returning (start, end, text) tuples for each non-empty part,
+    where arg[start:end] is where the part came from (including any quotes or escapes
+    inside it)."""
+    for token, positions in shell_tokens(arg):
+        start = 0
+        # a final zero-width 'separator' at the end of the token
+        ends = itertools.chain(
+            (match.span() for match in re.finditer(ARG_SPLIT_PATTERN, token)),
+            [(len(token), len(token))],
+        )
+        for end, next_start in ends:
+            # skip empty parts since these get mapped as valid '.' paths
+            if end > start:
+                yield positions[start], positions[end - 1] + 1, token[start:end]
+            start = next_start
+
+
+def arg_to_file_path_spans(arg, resolver=None, ignore_index=None):
+    """Generator that returns (start, end, path) tuples for the valid file paths in the
+    input arg, where arg[start:end] is the text of the path (see arg_spans). Paths are
+    valid if they exist, are absolute (if ABS_ONLY), and do not have any IGNORE_PATH as
+    parents. File system queries go through resolver (PathResolver, default new
+    instance), and ignore_index (PathTrie, default built from IGNORE_PATH) is used to
+    look up ignored paths.
+
+    """
+    if resolver is None:
+        resolver = PathResolver()
+    if ignore_index is None:
+        ignore_index = PathTrie(IGNORE_PATH)
+    for start, end, this_split in arg_spans(arg):
+        this_path = pathlib.Path(this_split)
+        abs_ok = this_path.is_absolute() or not ABS_ONLY
+        # check that this_path is not in an ignored path or its sub-directories
+        resolved_path = resolver.resolve(this_path)
+        ignore_ok = ignore_index.longest_prefix(resolved_path) is None
+        # any non-existent path is fine as long as it's absolute
+        # but relative paths must exist to control false positives
+        exist_ok = this_path.is_absolute() or resolver.exists(resolved_path)
+        if exist_ok:
+            LOGGER.debug(f"detected path {this_path}")
+            LOGGER.debug(f"absolute path pass={abs_ok}")
+            LOGGER.debug(f"ignore path pass={ignore_ok}")
+        if exist_ok and abs_ok and ignore_ok:
+            yield start, end, this_path
+
+
+def arg_to_file_paths(arg, resolver=None, ignore_index=None):
     """Generator that returns valid file paths in the input arg, splitting according to
-    shell characters (with shlex.split) and on ARG_SPLIT_PATTERN. Paths are valid if
-    they exist, are absolute (if ABS_ONLY), and do not have any IGNORE_PATH as
-    parents.
+    shell characters (like shlex.split) and on ARG_SPLIT_PATTERN (see
+    arg_to_file_path_spans).
 
     """
-    for candidate in shlex.split(arg):
-        for this_split in re.split(ARG_SPLIT_PATTERN, candidate):
-            if not this_split:
-                # skip empty str since these get mapped as valid '.' paths
-                continue
-            this_path = pathlib.Path(this_split)
-            abs_ok = this_path.is_absolute() or not ABS_ONLY
-            # check that this_path is not in an ignored path or its sub-directories
-            resolved_path = this_path.resolve()
-            ignore_ok = all(
-                [
-                    not this_ignore == resolved_path
-                    and this_ignore not in resolved_path.parents
-                    for this_ignore in IGNORE_PATH
-                ]
+    for _, _, this_path in arg_to_file_path_spans(
+        arg, resolver=resolver, ignore_index=ignore_index
+    ):
+        yield this_path
+
+
+def classify_arg(in_arg, resolver=None, ignore_index=None):
+    """Return a tuple of (start, end, path, resolved path, is_dir) tuples for the valid
+    file paths in in_arg (see arg_to_file_path_spans)."""
+    if resolver is None:
+        resolver = PathResolver()
+    paths = []
+    for start, end, this_path in arg_to_file_path_spans(
+        in_arg, resolver=resolver, ignore_index=ignore_index
+    ):
+        full_path = resolver.resolve(this_path)
+        paths.append((start, end, this_path, full_path, resolver.is_dir(full_path)))
+    return tuple(paths)
+
+
+class ArgCache(object):
+    """Bounded LRU memo of classify_arg for processes that see the same arguments over
+    and over (e.g., bindit docker batch and the daemon). Entries are keyed on the
+    argument, ABS_ONLY, IGNORE_PATH and the working directory, and are discarded when
+    the modification time of the (unresolved) parent directory of any part of the
+    argument changes. As for bindit.server.ValidatingPathResolver, changes further up
+    the tree are not detected. Each lookup stats the parent directories of the cached
+    argument, which is much cheaper than resolving and stat'ing the paths themselves.
+    counts holds the number of hits, misses, stale entries (misses because a parent
+    directory changed) and evictions, for tuning maxsize (default ARG_CACHE_SIZE)."""
+
+    def __init__(self, maxsize=None):
+        self.maxsize = ARG_CACHE_SIZE if maxsize is None else maxsize
+        self._entries = collections.OrderedDict()
+        self.counts = collections.Counter()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def _mtime(directory):
+        try:
+            return os.stat(directory).st_mtime_ns
+        except OSError:
+            return None
+
+    def classify(self, in_arg, resolver=None, ignore_index=None):
+        """return classify_arg(in_arg, resolver, ignore_index), from the cache if
+        possible. ignore_index should be built from IGNORE_PATH (the default)."""
+        cwd = os.getcwd()
+        key = (in_arg, ABS_ONLY, tuple(IGNORE_PATH), cwd)
+        entry = self._entries.get(key)
+        if entry is not None:
+            paths, stamps = entry
+            if all(self._mtime(parent) == stamp for parent, stamp in stamps):
+                self._entries.move_to_end(key)
+                self.counts["hits"] += 1
+                return paths
+            self.counts["stale"] += 1
+        self.counts["misses"] += 1
+        parents = {
+            os.path.dirname(os.path.join(cwd, text)) for _, _, text in arg_spans(in_arg)
+        }
+        # stamp before classifying, so that a change in between invalidates the entry
+        stamps = tuple((parent, self._mtime(parent)) for parent in sorted(parents))
+        paths = classify_arg(in_arg, resolver=resolver, ignore_index=ignore_index)
+        self._entries[key] = (paths, stamps)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.counts["evictions"] += 1
+        return paths
+
+
+class UnsafeBindError(ValueError):
+    """A directory can't be bound at its host path inside the container, because it
+    would shadow the container's own files (see rebase_dir)."""
+
+
+def rebase_dir(this_dir, manual_index, new_binds, identity=False):
+    """Return the in-container path (pathlib.PosixPath) of the host directory this_dir.
+    Manual binds (manual_index, a PathTrie of source: dest) are used if one covers
+    this_dir (the deepest one wins). Otherwise a new bind is added to new_binds, under
+    /bindit, or (if identity) at the same path as on the host. Raises UnsafeBindError
+    if identity and this_dir is the root, a top-level directory, or in
+    CONTAINER_PATHS."""
+    manual_match = manual_index.longest_prefix(this_dir)
+    if manual_match is not None:
+        manual_parent, manual_dest = manual_match
+        # use the manual_bind to map (inserting any additional sub-directories as
+        # necessary)
+        new_base = manual_dest / this_dir.relative_to(manual_parent)
+        if not identity or new_base == pathlib.PosixPath(this_dir):
+            LOGGER.debug(f"rebasing on manual bind: {new_base}")
+            return new_base
+    LOGGER.debug(f"no manual bind matches: {this_dir}")
+    # no manual binds match, so the remaining possibility is that it's a new bind
+    if this_dir not in new_binds:
+        if identity:
+            if (
+                len(this_dir.parts) < 3
+                or PathTrie(CONTAINER_PATHS).longest_prefix(this_dir) is not None
+            ):
+                raise UnsafeBindError(
+                    f"can't bind {this_dir} at its host path, since it would shadow "
+                    "files in the container (rebase path lists instead, without "
+                    "--no-rebase-lists)"
+                )
+            new_binds[this_dir] = pathlib.PosixPath(this_dir)
+        else:
+            new_binds[this_dir] = pathlib.PosixPath(
+                "/bindit"
+            ) / this_dir.relative_to(this_dir.anchor)
+        LOGGER.debug(f"creating new bind: {new_binds[this_dir]}")
+    elif identity and new_binds[this_dir] != pathlib.PosixPath(this_dir):
+        LOGGER.warning(
+            f"{this_dir} is already bound at {new_binds[this_dir]}, so listed paths "
+            "in it are not available at their host paths (try without "
+            "--no-rebase-lists)"
+        )
+    # NB indent - the bind might already exist
+    return new_binds[this_dir]
+
+
+def is_output(full_path, flag=None, resolver=None):
+    """Return True if full_path looks like an output of the container rather than an
+    input: if it does not exist yet, or if it is the value of a flag that matches one
+    of the OUTPUT_FLAGS patterns (e.g., -o existing.txt)."""
+    if resolver is None:
+        resolver = PathResolver()
+    if flag is not None and any(
+        fnmatch.fnmatchcase(flag, pattern) for pattern in OUTPUT_FLAGS
+    ):
+        return True
+    return not resolver.exists(full_path)
+
+
+def writable_binds(binds, output_dirs):
+    """Return the set of keys in the dict binds (source: dest) that hold any of the
+    directories in output_dirs (see parse_image_args). The other binds only hold input
+    paths, so they can be mounted read-only."""
+    index = PathTrie(binds)
+    writable = set()
+    for output_dir in output_dirs:
+        match = index.longest_prefix(output_dir)
+        if match is not None:
+            writable.add(match[0])
+    return writable
+
+
+def is_path_list(path):
+    """Return True if the file name of path matches any SCAN_LISTS pattern."""
+    return any(fnmatch.fnmatch(path.name, pattern) for pattern in SCAN_LISTS)
+
+
+def rebased_list_path(list_path):
+    """Return a new path for a rebased copy of the path list file list_path, in the
+    lists directory of the bindit cache (see bindit.cache.lists_dir). Names are unique
+    to each call (<stem>.<random>.bindit<suffix>), so concurrent calls that rebase the
+    same list never write the same file, and the list's own directory may be read-only.
+    Unless DRY_RUN, the (empty) file is created."""
+    from bindit import cache
+
+    lists_dir = cache.lists_dir()
+    prefix = f"{list_path.stem}."
+    suffix = f".bindit{list_path.suffix}"
+    if DRY_RUN:
+        LOGGER.warning(
+            f"dryrun: the rebased copy of {list_path} is not written, so the command "
+            "refers to a file that does not exist. Use bindit plan to keep the copy "
+            "for later, or --no-rebase-lists."
+        )
+        return lists_dir / f"{prefix}XXXXXXXX{suffix}"
+    lists_dir.mkdir(parents=True, exist_ok=True)
+    handle, path = tempfile.mkstemp(dir=lists_dir, prefix=prefix, suffix=suffix)
+    os.close(handle)
+    return pathlib.Path(path)
+
+
+def take_rebased_lists():
+    """Return the rebased copies of path list files written since the last call (see
+    scan_path_list), and forget them. Callers that plan and launch a container remove
+    the copies once it has exited (see remove_rebased_lists)."""
+    taken = list(REBASED_LISTS)
+    REBASED_LISTS.clear()
+    return taken
+
+
+def remove_rebased_lists(paths):
+    """Remove the rebased copies of path list files in paths (see
+    take_rebased_lists)."""
+    for path in paths:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        LOGGER.debug(f"removed rebased path list {path}")
+
+
+def rebase_arg(
+    in_arg,
+    manual_index,
+    new_binds,
+    resolver=None,
+    ignore_index=None,
+    identity=False,
+    scan_lists=True,
+    arg_cache=None,
+    output_dirs=None,
+    flag=None,
+):
+    """Return in_arg with the file paths in it (see arg_to_file_paths) rebased to their
+    in-container locations, binding directories as necessary (see rebase_dir). If
+    scan_lists, path list files (see SCAN_LISTS) are scanned too (see
+    scan_path_list). The paths in in_arg are looked up in arg_cache (ArgCache) if
+    provided. If output_dirs (set) is provided, the directories of output paths (see
+    is_output, where flag is the preceding image argument, or the --flag= part of
+    in_arg) are added to it."""
+    if resolver is None:
+        resolver = PathResolver()
+    if arg_cache is not None:
+        paths = arg_cache.classify(in_arg, resolver=resolver, ignore_index=ignore_index)
+    else:
+        paths = classify_arg(in_arg, resolver=resolver, ignore_index=ignore_index)
+    # rebuild in_arg in a single pass from the unchanged text between paths and the
+    # rebased paths (rather than replacing each path in turn, which rescans the whole
+    # in_arg and can hit the wrong path if one is a substring of another)
+    parts = []
+    last_end = 0
+    # handle potentially multiple paths in this in_arg
+    for start, end, this_path, full_path, full_path_is_dir in paths:
+        # we have a path that needs to be remapped
+        if (
+            scan_lists
+            and SCAN_LISTS
+            and not full_path_is_dir
+            and resolver.exists(full_path)
+            and is_path_list(full_path)
+        ):
+            output_path = rebased_list_path(full_path) if REBASE_LISTS else None
+            scan_path_list(
+                full_path,
+                manual_index,
+                new_binds,
+                ignore_index=ignore_index,
+                output_path=output_path,
+                output_dirs=output_dirs,
             )
-            # any non-existent path is fine as long as it's absolute
-            # but relative paths must exist to control false positives
-            exist_ok = this_path.is_absolute() or resolved_path.exists()
-            if exist_ok:
-                LOGGER.debug(f"detected path {this_path}")
-                LOGGER.debug(f"absolute path pass={abs_ok}")
-                LOGGER.debug(f"ignore path pass={ignore_ok}")
-            if exist_ok and abs_ok and ignore_ok:
-                yield this_path
-
-
-def parse_image_args(args_iter, manual_binds):
+            if output_path is not None:
+                # pass the rebased copy instead
+                full_path = output_path
+        this_dir = full_path.parent
+        # can only bind directories
+        if full_path_is_dir:
+            this_dir = full_path
+        if output_dirs is not None:
+            path_flag = flag
+            if in_arg.startswith("-") and "=" in in_arg[:start]:
+                path_flag = in_arg[: in_arg.index("=")]
+            if is_output(full_path, flag=path_flag, resolver=resolver):
+                LOGGER.debug(f"output path: {full_path}")
+                output_dirs.add(this_dir)
+        new_base = rebase_dir(this_dir, manual_index, new_binds, identity=identity)
+        # and we now need to remap the original in_arg accordingly
+        new_path = new_base / full_path.name
+        if full_path_is_dir:
+            # avoid repeating the directory name twice (the one edge case where the
+            # old os.path.split made more sense than pathlib)
+            new_path = new_base
+        LOGGER.debug(f"rebasing in_arg path: {this_path}:{new_path}")
+        new_text = str(new_path)
+        if in_arg[start:end].endswith("/") and not new_text.endswith("/"):
+            # keep trailing slashes, which matter to e.g. rsync and cp
+            new_text += "/"
+        if pathlib.Path(in_arg[start:end]) != this_path:
+            # quotes or escapes inside the path, which we can't carry over, so quote
+            # the new path instead
+            new_text = shlex.quote(new_text)
+        parts += [in_arg[last_end:start], new_text]
+        last_end = end
+    if not parts:
+        return in_arg
+    parts.append(in_arg[last_end:])
+    return "".join(parts)
+
+
+def scan_path_list(
+    list_path,
+    manual_index,
+    new_binds,
+    ignore_index=None,
+    output_path=None,
+    output_dirs=None,
+):
+    """Bind the directories of the paths listed in the text file list_path (detected
+    line by line with the same rules as for image arguments, see arg_to_file_paths).
+    The file is streamed, so lists of any length can be scanned in constant memory
+    (apart from the binds themselves). If output_path is given, a copy of the list with
+    every detected path rebased to its in-container location is written there
+    atomically (unless DRY_RUN), and directories are bound as usual. Otherwise,
+    directories are bound at their host paths, so that the list itself is valid inside
+    the container. output_dirs is as for rebase_arg. Returns the number of lines
+    scanned."""
+    n_lines = 0
+    resolver = PathResolver()
+    temp_path = None
+    try:
+        with contextlib.ExitStack() as stack:
+            lines = stack.enter_context(
+                open(list_path, "r", errors="surrogateescape")
+            )
+            output = None
+            if output_path is not None and not DRY_RUN:
+                handle, temp_path = tempfile.mkstemp(
+                    dir=output_path.parent,
+                    prefix=f".{output_path.name}.",
+                    suffix=".tmp",
+                )
+                output = stack.enter_context(
+                    os.fdopen(handle, "w", errors="surrogateescape")
+                )
+            for line in lines:
+                n_lines += 1
+                if not n_lines % SCAN_CHUNK:
+                    # bound the memory use of the resolver
+                    resolver = PathResolver()
+                try:
+                    new_line = rebase_arg(
+                        line,
+                        manual_index,
+                        new_binds,
+                        resolver=resolver,
+                        ignore_index=ignore_index,
+                        identity=output_path is None,
+                        scan_lists=False,
+                        output_dirs=output_dirs,
+                    )
+                except UnsafeBindError:
+                    raise
+                except ValueError as err:
+                    # e.g., unbalanced quotes (see shlex.split)
+                    LOGGER.debug(f"skipping line {n_lines} of {list_path}: {err}")
+                    new_line = line
+                if output is not None:
+                    output.write(new_line)
+        if temp_path is not None:
+            os.replace(temp_path, output_path)
+            REBASED_LISTS.append(output_path)
+    except BaseException:
+        if temp_path is not None and os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+    LOGGER.info(f"scanned {n_lines} lines in path list {list_path}")
+    if temp_path is not None:
+        LOGGER.info(f"wrote rebased path list {output_path}")
+    return n_lines
+
+
+def parse_image_args(
+    args_iter,
+    manual_binds,
+    resolver=None,
+    ignore_index=None,
+    arg_cache=None,
+    output_dirs=None,
+):
     """Parse arguments to the container image, rebasing binds as necessary to make paths
     available inside the container. Typically used as the second pass of a CLI
     application (following parse_container_args, see e.g., bindit.docker.docker).
@@ -182,6 +1001,13 @@ def parse_image_args(args_iter, manual_binds):
             would use in parse_container_args to make sure you're in the right place)
         manual_binds (dict): defines user-provided bind mounts
             (manual_binds[source] = dest)
+        resolver (PathResolver): memoizes file system queries (default new instance)
+        ignore_index (PathTrie): index of paths to ignore (default built from
+            IGNORE_PATH)
+        arg_cache (ArgCache): memoizes the paths in each argument across calls
+            (default None, no memo)
+        output_dirs (set): if provided, the directories of output paths (see
+            is_output) are added to it (see writable_binds)
 
     Returns:
         tuple: (list: args to the image (DOES include rebasing of any args that are
@@ -189,62 +1015,44 @@ def parse_image_args(args_iter, manual_binds):
             (new_binds[source] = dest))
 
     """
+    if resolver is None:
+        resolver = PathResolver()
+    if ignore_index is None:
+        ignore_index = PathTrie(IGNORE_PATH)
+    manual_index = PathTrie()
+    for source, dest in manual_binds.items():
+        manual_index.add(source, dest)
     image_args = []
     new_binds = {}
     # So we continue working on the same iterator...  but now we don't care about
     # key/value - we just want the keys (and because we added a final None, the final _
     # is always irrelevant)
+    flag = None
     for in_arg, _ in args_iter:
         if in_arg is None:
             # special case - container with no image_args
             continue
-        # handle potentially multiple paths in this in_arg
-        for this_path in arg_to_file_paths(in_arg):
-            # we have a path that needs to be remapped
-            full_path = this_path.resolve()
-            this_dir = full_path.parent
-            # can only bind directories
-            if full_path.is_dir():
-                this_dir = full_path
-            # detect manual binds that have a shared base
-            try:
-                # pick the first manually-specified bind that matches
-                manual_parent = next(
-                    this_manual_bind
-                    for this_manual_bind in manual_binds.keys()
-                    if this_manual_bind == this_dir
-                    or this_manual_bind in this_dir.parents
-                )
-                # use the manual_bind to map (inserting any additional sub-directories
-                # as necessary)
-                new_base = manual_binds[manual_parent] / this_dir.relative_to(
-                    manual_parent
-                )
-                LOGGER.debug(f"rebasing on manual bind: {new_base}")
-            except StopIteration:
-                LOGGER.debug(f"none of these manual binds match: {manual_binds.keys()}")
-                # no manual binds match, so the remaining possibility is that it's a new
-                # bind
-                if this_dir not in new_binds:
-                    new_binds[this_dir] = pathlib.PosixPath(
-                        "/bindit"
-                    ) / this_dir.relative_to(this_dir.anchor)
-                    LOGGER.debug(f"creating new bind: {new_binds[this_dir]}")
-                # NB indent - the bind might already exist
-                new_base = new_binds[this_dir]
-            except:
-                # something else went wrong with that tricky generator expression
-                raise
-            # and we now need to remap the original in_arg accordingly
-            new_path = new_base / full_path.name
-            if full_path.is_dir():
-                # avoid repeating the directory name twice (the one edge case where the
-                # old os.path.split made more sense than pathlib)
-                new_path = new_base
-            LOGGER.debug(f"rebasing in_arg path: {this_path}:{new_path}")
-            in_arg = in_arg.replace(str(this_path), str(new_path))
-        # NB indent - in all cases in_arg needs to be added to image_args
-        image_args.append(in_arg)
+        # NB in all cases in_arg needs to be added to image_args
+        image_args.append(
+            rebase_arg(
+                in_arg,
+                manual_index,
+                new_binds,
+                resolver=resolver,
+                ignore_index=ignore_index,
+                arg_cache=arg_cache,
+                output_dirs=output_dirs,
+                flag=flag,
+            )
+        )
+        # a flag that takes the next argument as its value
+        flag = in_arg if in_arg.startswith("-") and "=" not in in_arg else None
     # avoid binding the same path twice (ie, parent and sub-directory)
-    remove_redundant_binds(new_binds)
+    with timings.phase("remove_redundant_binds"):
+        remove_redundant_binds(new_binds)
+    if MAX_BINDS is not None:
+        with timings.phase("coalesce_binds"):
+            coalesce_binds(
+                new_binds, max(MAX_BINDS - len(manual_binds), 0), ignore_index
+            )
     return image_args, new_binds
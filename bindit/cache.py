@@ -0,0 +1,118 @@
+"""on-disk cache routines. Entries are JSON files that store the key they were computed
+for, so a stale or colliding entry is never returned. Writes go to a temporary file in
+the cache directory which is then atomically renamed into place, so concurrent processes
+can read and refresh the cache without locking."""
+import os
+import json
+import time
+import hashlib
+import pathlib
+import tempfile
+import bindit
+
+CACHE_SUFFIX = ".json"
+# rebased path lists are normally removed once their container exits, but are left
+# behind by exec, plans and the daemon. clear only removes those older than this (in
+# seconds), since running containers may still read newer ones
+LISTS_MAX_AGE = 7 * 24 * 60 * 60
+
+
+def cache_dir():
+    """return the bindit cache directory. Defaults to $XDG_CACHE_HOME/bindit (or
+    ~/.cache/bindit), but can be overridden with the BINDIT_CACHE_DIR environment
+    variable."""
+    override = os.environ.get("BINDIT_CACHE_DIR")
+    if override:
+        return pathlib.Path(override)
+    base = os.environ.get("XDG_CACHE_HOME") or pathlib.Path.home() / ".cache"
+    return pathlib.Path(base) / "bindit"
+
+
+def lists_dir():
+    """return the directory for rebased copies of path lists (see
+    bindit.rebased_list_path)."""
+    return cache_dir() / "lists"
+
+
+def entry_path(name, key):
+    """return the cache file for the entry name with the given (JSON-serialisable)
+    key."""
+    digest = hashlib.sha1(json.dumps(key, sort_keys=True).encode("utf-8")).hexdigest()
+    return cache_dir() / f"{name}-{digest[:16]}{CACHE_SUFFIX}"
+
+
+def load(name, key):
+    """return the data stored for name and key, or None if there is no valid entry."""
+    path = entry_path(name, key)
+    try:
+        with open(path, "r") as file_handle:
+            entry = json.load(file_handle)
+    except (OSError, ValueError):
+        # missing, unreadable or half-written by a process from an older version
+        return None
+    if entry.get("key") != json.loads(json.dumps(key)):
+        bindit.LOGGER.debug(f"ignoring cache entry with mismatched key: {path}")
+        return None
+    bindit.LOGGER.debug(f"cache hit: {path}")
+    return entry.get("data")
+
+
+def store(name, key, data):
+    """write data to the cache entry for name and key. Failures (e.g. a read-only home
+    directory) are logged and otherwise ignored, since the cache is only an
+    optimisation."""
+    path = entry_path(name, key)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        handle, temp_path = tempfile.mkstemp(
+            dir=path.parent, prefix=f".{path.name}.", suffix=".tmp"
+        )
+        try:
+            with os.fdopen(handle, "w") as file_handle:
+                json.dump({"name": name, "key": key, "data": data}, file_handle)
+            # atomic on POSIX, so readers see either the old or the new entry
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+    except OSError as err:
+        bindit.LOGGER.debug(f"could not write cache entry {path}: {err}")
+        return None
+    bindit.LOGGER.debug(f"cache store: {path}")
+    return path
+
+
+def entries():
+    """return a list of (path, entry name, key) tuples for the current cache
+    entries."""
+    found = []
+    for path in sorted(cache_dir().glob(f"*{CACHE_SUFFIX}")):
+        try:
+            with open(path, "r") as file_handle:
+                entry = json.load(file_handle)
+        except (OSError, ValueError):
+            entry = {}
+        found.append((path, entry.get("name"), entry.get("key")))
+    return found
+
+
+def clear():
+    """remove all cache entries, and the rebased path lists that are older than
+    LISTS_MAX_AGE. Returns the number of removed files."""
+    removed = 0
+    paths = [path for path, _, _ in entries()]
+    cutoff = time.time() - LISTS_MAX_AGE
+    for path in sorted(lists_dir().glob("*")):
+        try:
+            if path.stat().st_mtime < cutoff:
+                paths.append(path)
+        except FileNotFoundError:
+            pass
+    for path in paths:
+        try:
+            path.unlink()
+            removed += 1
+        except FileNotFoundError:
+            # another process got there first
+            pass
+    return removed
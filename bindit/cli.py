@@ -3,16 +3,88 @@ import sys
 import pathlib
 import click
 import bindit
-import bindit.docker
+import bindit.docker_commands
+import bindit.singularity
 
 """Main command line interface for bindit."""
 
 
-@click.command(context_settings=dict(ignore_unknown_options=True))
-@click.argument("singularity_args", nargs=-1, type=click.UNPROCESSED)
-def singularity(singularity_args):
-    print(singularity_args)
-    pass
+@click.group()
+def cache():
+    """inspect or clear the on-disk cache (e.g., parsed container runner arguments)."""
+    # the subcommands that are not on the docker run hot path import their modules on
+    # demand (see bindit.fast)
+    import bindit.cache
+
+
+@cache.command()
+def show():
+    """list cache entries."""
+    click.echo(f"cache directory: {bindit.cache.cache_dir()}")
+    for path, name, key in bindit.cache.entries():
+        click.echo(f"{path.name}\t{name}\t{key}")
+    return
+
+
+@cache.command()
+def clear():
+    """remove all cache entries (and rebased path lists older than a week)."""
+    removed = bindit.cache.clear()
+    click.echo(f"removed {removed} cache entries from {bindit.cache.cache_dir()}")
+    return
+
+
+@click.command()
+@click.option(
+    "--socket",
+    "socket_path",
+    default=None,
+    help="Unix socket to listen on (default $BINDIT_SOCKET, or bindit.sock in \
+        $XDG_RUNTIME_DIR)",
+)
+def serve(socket_path):
+    """run a bindit daemon that plans docker run commands for bindit_client. The daemon
+    keeps the docker CLI schema, ignore paths (-i) and path lookups warm in memory."""
+    import bindit.client
+    import bindit.server
+
+    if socket_path is None:
+        socket_path = bindit.client.default_socket_path()
+    return bindit.server.serve(socket_path)
+
+
+@click.group(name="plan")
+@click.option(
+    "-o",
+    "--output",
+    default="plan.json",
+    show_default=True,
+    help="Plan file to write (- for stdout)",
+)
+def plan(output):
+    """plan a container runner invocation without running it, and save the plan to a
+    file for bindit apply (e.g., bindit plan -o plan.json docker run ARGS...). The plan
+    records the files and directories it depends on."""
+    bindit.PLAN_OUTPUT = output
+
+
+@click.command()
+@click.option(
+    "--strict",
+    is_flag=True,
+    help="Exit with an error instead of re-planning if the plan is out of date",
+)
+@click.argument("plan_file", metavar="PLAN")
+def apply(strict, plan_file):
+    """run the container runner invocation in PLAN (see bindit plan, - for stdin). The
+    files and directories that the plan depends on are checked first, and if any of them
+    changed, the invocation is re-planned from the original arguments (and settings)."""
+    import bindit.planfile
+
+    try:
+        return bindit.planfile.apply(plan_file, strict=strict)
+    except (OSError, ValueError) as err:
+        raise click.ClickException(str(err))
 
 
 @click.option(
@@ -24,7 +96,46 @@ def singularity(singularity_args):
     is_flag=True,
     help="Return formatted shell command without invoking container runner",
 )
+@click.option(
+    "--exec",
+    "exec_",
+    is_flag=True,
+    help="Replace bindit with the container runner process instead of running it as a \
+        child process",
+)
 @click.option("-a", "--absonly", is_flag=True, help="Only rebase absolute paths.")
+@click.option(
+    "--scan-lists",
+    multiple=True,
+    metavar="PATTERN",
+    help="Also bind the paths listed in files (one or more per line) whose name \
+        matches PATTERN (e.g., '*.txt'). A rebased copy of each list is passed to the \
+        container instead. You can use this flag multiple times.",
+)
+@click.option(
+    "--rebase-lists/--no-rebase-lists",
+    default=True,
+    show_default=True,
+    help="Pass a rebased copy of each path list file (written to the bindit cache \
+        directory, see 'bindit cache show') to the container, or bind the listed \
+        paths at their host paths (not allowed for top-level and system \
+        directories, e.g. /etc or /home).",
+)
+@click.option(
+    "--max-binds",
+    type=click.IntRange(min=1),
+    default=None,
+    metavar="N",
+    help="Merge new binds into their nearest common parent directories (never \
+        exposing --ignorepath paths) until there are at most N binds in total",
+)
+@click.option(
+    "--timings",
+    default=None,
+    metavar="FILE",
+    help="Write the duration of each phase (and file system query counts) as JSON to \
+        FILE on exit (- for stderr)",
+)
 @click.option(
     "-i",
     "--ignorepath",
@@ -35,26 +146,44 @@ def singularity(singularity_args):
 )
 @click.group()
 @click.version_option(version=bindit.__version__, message="%(version)s")
-def main(loglevel, dryrun, absonly, ignorepath):
+def main(
+    loglevel,
+    dryrun,
+    exec_,
+    absonly,
+    scan_lists,
+    rebase_lists,
+    max_binds,
+    timings,
+    ignorepath,
+):
     """bindit is a wrapper for container runners that makes it easy to handle file input
     and output for containerized command-line applications. It works by detecting file
     paths in the container image arguments, and rebasing these as necessary onto new
     bind mounts.
     """
 
-    bindit.LOGGER.setLevel(loglevel)
+    bindit.configure_logging(loglevel)
     bindit.DRY_RUN = dryrun
+    bindit.EXEC = exec_
     bindit.ABS_ONLY = absonly
     bindit.IGNORE_PATH += [pathlib.Path(p) for p in ignorepath]
+    bindit.SCAN_LISTS += list(scan_lists)
+    bindit.REBASE_LISTS = rebase_lists
+    bindit.MAX_BINDS = max_binds
+    if timings:
+        bindit.timings.enable(timings)
     return
 
 
-main.add_command(bindit.docker.docker)
-main.add_command(singularity)
+main.add_command(bindit.docker_commands.docker)
+main.add_command(bindit.singularity.singularity)
+main.add_command(cache)
+main.add_command(serve)
+plan.add_command(bindit.docker_commands.docker)
+plan.add_command(bindit.singularity.singularity)
+main.add_command(plan)
+main.add_command(apply)
 
 if __name__ == "__main__":
     sys.exit(main())  # pragma: no cover
-
-if getattr(sys, "frozen", False):
-    # detect pyinstaller frozen app
-    main(*sys.argv[1:])
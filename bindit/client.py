@@ -0,0 +1,105 @@
+"""Thin client for the bindit daemon (see bindit serve). Sends docker run arguments over
+a Unix socket and runs the planned command, without importing the command line
+interface or inferring the docker CLI. Falls back to running bindit directly if the
+daemon is not available.
+
+Usage: bindit_client [-d, --dryrun] [--socket PATH] docker run ARGS..."""
+import os
+import sys
+import json
+import shlex
+import socket
+import struct
+
+USAGE = "usage: bindit_client [-d, --dryrun] [--socket PATH] docker run ARGS..."
+
+
+def default_socket_path():
+    """return the daemon socket path: BINDIT_SOCKET if set, otherwise bindit.sock in
+    XDG_RUNTIME_DIR (or a per-user file in /tmp)."""
+    override = os.environ.get("BINDIT_SOCKET")
+    if override:
+        return override
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        return os.path.join(runtime_dir, "bindit.sock")
+    return f"/tmp/bindit-{os.getuid()}.sock"
+
+
+def check_peer(sock, socket_path):
+    """raise PermissionError unless the daemon at the other end of sock (connected to
+    socket_path) runs as the current user. Otherwise, another user could create the
+    socket first (e.g., in /tmp) and have us run arbitrary commands."""
+    if hasattr(socket, "SO_PEERCRED"):
+        # Linux - the credentials of the process that is actually listening
+        credentials = sock.getsockopt(
+            socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i")
+        )
+        _, uid, _ = struct.unpack("3i", credentials)
+    else:
+        uid = os.stat(socket_path).st_uid
+    if uid != os.getuid():
+        raise PermissionError(
+            f"{socket_path} belongs to another user (uid {uid}), not connecting"
+        )
+
+
+def request_plan(runner, args, socket_path=None, cwd=None):
+    """send a planning request to the daemon and return the decoded response (a dict
+    with the final command under 'command', or an error message under 'error')."""
+    if socket_path is None:
+        socket_path = default_socket_path()
+    if cwd is None:
+        cwd = os.getcwd()
+    request = {"runner": runner, "args": list(args), "cwd": cwd}
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        check_peer(sock, socket_path)
+        sock.sendall((json.dumps(request) + "\n").encode("utf-8"))
+        with sock.makefile("r", encoding="utf-8") as file_handle:
+            return json.loads(file_handle.readline())
+
+
+def main(argv=None):
+    """parse argv (default sys.argv[1:]), request a plan from the daemon and run it."""
+    if argv is None:
+        argv = sys.argv[1:]
+    dryrun = False
+    socket_path = None
+    remaining = list(argv)
+    while remaining and remaining[0].startswith("-"):
+        option = remaining.pop(0)
+        if option in ("-d", "--dryrun"):
+            dryrun = True
+        elif option == "--socket" and remaining:
+            socket_path = remaining.pop(0)
+        else:
+            sys.stderr.write(USAGE + "\n")
+            return 2
+    if remaining[:2] != ["docker", "run"]:
+        sys.stderr.write(USAGE + "\n")
+        return 2
+    try:
+        response = request_plan("docker", remaining[2:], socket_path=socket_path)
+    except PermissionError as err:
+        sys.stderr.write(f"bindit_client: {err}\n")
+        response = None
+    except (OSError, ValueError):
+        response = None
+    if response is None:
+        # no (working) daemon, so do the full thing instead
+        fallback = ["bindit"] + (["--dryrun"] if dryrun else []) + remaining
+        os.execvp(fallback[0], fallback)
+    if "error" in response:
+        sys.stderr.write(f"bindit daemon error: {response['error']}\n")
+        return 1
+    command = response["command"]
+    sys.stdout.write(" ".join(shlex.quote(arg) for arg in command) + "\n")
+    if dryrun:
+        return 0
+    sys.stdout.flush()
+    os.execvp(command[0], command)
+
+
+if __name__ == "__main__":
+    sys.exit(main())  # pragma: no cover
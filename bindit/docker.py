@@ -1,29 +1,56 @@
 # -*- coding: utf-8 -*-
+import io
+import os
+import re
 import sys
+import json
+import shutil
+import functools
 import pathlib
-import click
 import bindit
 import bindit.shell
 
-"""docker-specific interface for bindit."""
+"""docker-specific interface for bindit. The click commands are in
+bindit.docker_commands (and available here as lazy attributes), so that the docker run
+hot path (see bindit.fast) does not import click."""
 
+# docker run argument tables for major docker releases, generated with
+# parse_docker_help from the docker run --help output of each release (see
+# bindit.read_package_data)
+BUNDLED_CLI_DATA = "data/docker_run.json"
+# how containers are launched: "cli" (the docker command) or "api" (the Docker Engine
+# API, see bindit.docker_api)
+BACKEND = "cli"
+# docker -v options (comma-separated, e.g. ro or ro,cached) for new binds that only
+# hold input paths, and for new binds that hold output paths (see bindit.is_output).
+# None leaves the docker default (read-write, with the default consistency)
+INPUT_MODE = None
+OUTPUT_MODE = None
+# options that docker accepts after the destination of a -v bind
+VOLUME_OPTIONS = [
+    "ro",
+    "rw",
+    "z",
+    "Z",
+    "nocopy",
+    "consistent",
+    "cached",
+    "delegated",
+    "shared",
+    "rshared",
+    "slave",
+    "rslave",
+    "private",
+    "rprivate",
+]
+# click commands in bindit.docker_commands
+COMMANDS = ["docker", "run", "batch", "run_many"]
 
-def infer_docker_cli():
-    """infer valid docker run arguments by parsing the output from docker run --help.
-    Returns a dict of key-value pairs and a set of single-letter flags (a quirk of the
-    docker API is that multiple letters can be combined under a single hyphen, e.g.
-    -it, but only if these are short-hand versions of boolean flags, so e.g. -v can't be
-    used in this way). Provides inputs for bindit.parse_container_args."""
-    try:
-        ret = bindit.shell.run("docker", "run", "--help")
-    except FileNotFoundError:
-        bindit.LOGGER.warning(
-            "WARNING: docker not on path, functionality will be limited."
-        )
-        return {}, set()
-    except:
-        raise
-    rows = ret.stdout.split("\n")
+
+def parse_docker_help(help_text):
+    """parse the output from docker run --help into a dict of key-value pairs and a set
+    of single-letter flags (see infer_docker_cli)."""
+    rows = help_text.split("\n")
     valid_args = {}
     # these can be arbitrarily combined (e.g. -it) so need to be parsed separately
     letters = ["-"]
@@ -53,44 +80,175 @@ def infer_docker_cli():
     return valid_args, set(letters)
 
 
-def volume_bind_args(source, dest):
-    """return tuple specifying a source:dest volume bind mount in docker format."""
+def infer_docker_cli():
+    """infer valid docker run arguments by parsing the output from docker run --help.
+    Returns a dict of key-value pairs and a set of single-letter flags (a quirk of the
+    docker API is that multiple letters can be combined under a single hyphen, e.g.
+    -it, but only if these are short-hand versions of boolean flags, so e.g. -v can't be
+    used in this way). Provides inputs for bindit.parse_container_args."""
+    try:
+        ret = bindit.shell.run("docker", "run", "--help")
+    except FileNotFoundError:
+        bindit.LOGGER.warning(
+            "WARNING: docker not on path, functionality will be limited."
+        )
+        return {}, set()
+    except:
+        raise
+    return parse_docker_help(ret.stdout)
+
+
+@functools.lru_cache(maxsize=None)
+def docker_version():
+    """return the docker client version string (e.g., '20.10.17'). Taken from the
+    BINDIT_DOCKER_VERSION environment variable if set (so no subprocess is needed),
+    otherwise parsed from docker --version. None if docker is not on path."""
+    version = os.environ.get("BINDIT_DOCKER_VERSION")
+    if not version:
+        if shutil.which("docker") is None:
+            return None
+        version = bindit.shell.run("docker", "--version").stdout
+    # accept both the bare version and the full 'Docker version 20.10.17, build x'
+    match = re.search(r"(\d+)\.(\d+)[\w.+-]*", version)
+    if not match:
+        bindit.LOGGER.warning(f"could not parse docker version: {version.strip()}")
+        return None
+    return match.group(0)
+
+
+def bundled_docker_cli(version):
+    """return (valid_args, valid_letters) from the tables bundled with bindit (see
+    BUNDLED_CLI_DATA) for the docker client version, or None if the version is unknown.
+    Tables are looked up by major.minor (e.g., 20.10), then by major release series
+    (e.g., 24)."""
+    if version is None:
+        return None
+    try:
+        tables = json.loads(bindit.read_package_data(BUNDLED_CLI_DATA))
+    except OSError:
+        bindit.LOGGER.debug(f"bundled docker run tables not found: {BUNDLED_CLI_DATA}")
+        return None
+    major, minor = version.split(".")[:2]
+    for series in [f"{major}.{minor}", major]:
+        if series in tables:
+            bindit.LOGGER.debug(f"using bundled docker run table: {series}")
+            return tables[series]["args"], set(tables[series]["letters"])
+    bindit.LOGGER.debug(f"no bundled docker run table for version: {version}")
+    return None
+
+
+def docker_cli_key():
+    """return a key that identifies the docker client on path (resolved binary path,
+    mtime and version string), or None if docker is not on path."""
+    binary = shutil.which("docker")
+    if binary is None:
+        return None
+    binary = pathlib.Path(binary).resolve()
+    return {
+        "binary": str(binary),
+        "mtime_ns": os.stat(binary).st_mtime_ns,
+        "version": docker_version(),
+    }
+
+
+def cached_docker_cli():
+    """infer_docker_cli, but using the on-disk cache (see bindit.cache) if there is an
+    entry for the current docker client."""
+    # imported on demand, like the other modules that the docker run hot path does not
+    # need (see bindit.fast)
+    import bindit.cache
+
+    key = docker_cli_key()
+    if key is None:
+        # nothing to key on, so let infer_docker_cli handle the missing binary
+        return infer_docker_cli()
+    cached = bindit.cache.load("docker_cli", key)
+    if cached is not None:
+        return cached["args"], set(cached["letters"])
+    valid_args, letters = infer_docker_cli()
+    if valid_args:
+        bindit.cache.store(
+            "docker_cli", key, {"args": valid_args, "letters": sorted(letters)}
+        )
+    return valid_args, letters
+
+
+@functools.lru_cache(maxsize=None)
+def docker_cli():
+    """return memoized (valid_args, valid_letters) for docker run. Nothing is inferred
+    until the first call, so commands that never parse container runner arguments do
+    not pay for the docker subprocess. Bundled tables are used for known docker versions
+    (see bundled_docker_cli), so infer_docker_cli is only called for unknown ones."""
+    bundled = bundled_docker_cli(docker_version())
+    if bundled is not None:
+        return bundled
+    return cached_docker_cli()
+
+
+def __getattr__(name):
+    """lazy module attributes. ARGS and LETTERS are only inferred on first access (see
+    docker_cli), and the click commands are only imported on first access (see
+    bindit.docker_commands)."""
+    if name == "ARGS":
+        return docker_cli()[0]
+    if name == "LETTERS":
+        return docker_cli()[1]
+    if name in COMMANDS:
+        from bindit import docker_commands
+
+        return getattr(docker_commands, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def volume_bind_args(source, dest, resolver=None, mode=None):
+    """return tuple specifying a source:dest volume bind mount in docker format, with
+    the options in mode (e.g., ro, see VOLUME_OPTIONS) if provided."""
+    if resolver is None:
+        resolver = bindit.PathResolver()
     # docker run struggle to follow symlinks on mac successfully, see
     # https://github.com/docker/for-mac/issues/1298
     # (and tempfile generates symlinked /var paths...)
-    source = pathlib.Path(source).resolve()
+    source = resolver.resolve(source)
+    if mode:
+        return "-v", f"{source}:{dest}:{mode}"
     return "-v", f"{source}:{dest}"
 
 
-def mount_bind_args(source, dest):
+def mount_bind_args(source, dest, resolver=None):
     """return tuple specifying a bind mount in docker format."""
-    source = pathlib.Path(source).resolve()
+    if resolver is None:
+        resolver = bindit.PathResolver()
+    source = resolver.resolve(source)
     return "--mount", f"source={source},destination={dest},type=bind"
 
 
-def parse_bind_mount(bind_arg):
+def parse_bind_mount(bind_arg, resolver=None):
     """unpack bind-mount bind_arg (e.g., src=/foo,dst=/bar) to dict where the key is a
     resolve pathlib.Path and the value is an unresolved (in-container)
     pathlib.PosixPath."""
+    if resolver is None:
+        resolver = bindit.PathResolver()
     mount_dict = dict([kv.split("=") for kv in bind_arg.split(",")])
     source_key = next(k for k in mount_dict if k in ["source", "src"])
     dest_key = next(k for k in mount_dict if k in ["destination", "dst", "target"])
     return {
-        pathlib.Path(mount_dict[source_key]).resolve(): pathlib.PosixPath(
+        resolver.resolve(mount_dict[source_key]): pathlib.PosixPath(
             mount_dict[dest_key]
         )
     }
 
 
-def parse_bind_volume(bind_arg):
+def parse_bind_volume(bind_arg, resolver=None):
     """unpack volume bind bind_arg (e.g., /foo:/bar) to dict where the key is a
     resolve pathlib.Path and the value is an unresolved (in-container)
     pathlib.PosixPath."""
+    if resolver is None:
+        resolver = bindit.PathResolver()
     # can be up to three, but we only want the first two
     bind_arg = bind_arg.split(":")
     src, dst = bind_arg[:2]
     assert len(bind_arg) < 4, "unexpected number of bind_arg"
-    return {pathlib.Path(src).resolve(): pathlib.PosixPath(dst)}
+    return {resolver.resolve(src): pathlib.PosixPath(dst)}
 
 
 BIND_PARSER = {
@@ -99,43 +257,153 @@ BIND_PARSER = {
     "--mount": parse_bind_mount,
 }
 
-ARGS, LETTERS = infer_docker_cli()
 
+def plan_run(run_args, resolver=None, ignore_index=None, arg_cache=None):
+    """plan a docker run invocation: parse run_args, detect paths in the image arguments
+    and rebase them onto new bind mounts as necessary.
+
+    Args:
+        run_args (sequence): arguments to docker run (container runner arguments,
+            image and image arguments)
+        resolver (bindit.PathResolver): memoizes file system queries (default new
+            instance)
+        ignore_index (bindit.PathTrie): index of paths to ignore (default built from
+            bindit.IGNORE_PATH)
+        arg_cache (bindit.ArgCache): memoizes the paths in image arguments across
+            calls (default None, no memo)
 
-@click.command(context_settings=dict(ignore_unknown_options=True))
-@click.argument("run_args", nargs=-1, required=True, type=click.UNPROCESSED)
-def run(run_args):
-    """click.command that casts run_args to lists and handles parsing of the arguments,
-    adding volume binds as necessary and running the container (if not DRY_RUN)."""
+    Returns:
+        bindit.RunPlan: the planned invocation (see RunPlan.command for the final
+            docker run command)
+
+    """
+    if resolver is None:
+        # shared by all passes so each path is only resolved and stat'ed once
+        resolver = bindit.PathResolver()
     args_iter = bindit.arg_pairs(run_args)
-    # handle arguments to the container runner
-    container_args, manual_binds, container_name = bindit.parse_container_args(
-        args_iter, bind_parser=BIND_PARSER, valid_args=ARGS, valid_letters=LETTERS
-    )
+    # handle arguments to the container runner (first use infers the docker CLI)
+    with bindit.timings.phase("infer_docker_cli"):
+        valid_args, valid_letters = docker_cli()
+    with bindit.timings.phase("parse_container_args", resolver=resolver):
+        container_args, manual_binds, container_name = bindit.parse_container_args(
+            args_iter,
+            bind_parser=BIND_PARSER,
+            valid_args=valid_args,
+            valid_letters=valid_letters,
+            resolver=resolver,
+        )
+    # only classify paths as inputs and outputs if the binds are tagged
+    output_dirs = None
+    if INPUT_MODE or OUTPUT_MODE:
+        output_dirs = set()
     # handle arguments to the image, including any rebasing of paths
-    image_args, new_binds = bindit.parse_image_args(args_iter, manual_binds)
+    with bindit.timings.phase(
+        "parse_image_args", resolver=resolver, arg_cache=arg_cache
+    ):
+        image_args, new_binds = bindit.parse_image_args(
+            args_iter,
+            manual_binds,
+            resolver=resolver,
+            ignore_index=ignore_index,
+            arg_cache=arg_cache,
+            output_dirs=output_dirs,
+        )
 
     # construct new binds in docker format
-    bind_args = list(bindit.bind_dict_to_arg(volume_bind_args, new_binds))
+    writable = set()
+    if output_dirs is not None:
+        writable = bindit.writable_binds(new_binds, output_dirs)
 
-    # generate the final command by inserting the new binds
-    final_command = (
-        ["docker", "run"] + container_args + bind_args + [container_name] + image_args
+    def mapper(source, dest):
+        mode = OUTPUT_MODE if source in writable else INPUT_MODE
+        return volume_bind_args(source, dest, resolver=resolver, mode=mode)
+
+    bind_args = list(bindit.bind_dict_to_arg(mapper, new_binds))
+    plan = bindit.RunPlan(
+        runner=["docker", "run"],
+        container_args=container_args,
+        bind_args=bind_args,
+        container_name=container_name,
+        image_args=image_args,
+        manual_binds=manual_binds,
+        new_binds=new_binds,
     )
+    if BACKEND == "api":
+        from bindit import docker_api
 
-    # write out to stdout with appropriate escapes
-    sys.stdout.write(bindit.shell.join_and_quote(final_command) + "\n")
-    if bindit.DRY_RUN:
-        return 0
+        # raise ValueError for arguments the backend can't handle now, rather than
+        # after the command has been written out
+        docker_api.plan_to_config(plan)
+    return plan
 
-    # run the beast
-    ret = bindit.shell.run(*final_command, interactive=True)
+
+def launch(plan, exec_=False, check=True):
+    """run a planned docker run invocation (bindit.RunPlan) with the selected BACKEND.
+    If exec_, the cli backend replaces the current process with docker. If check, exits
+    with the container's exit code if it is non-zero. Returns the exit code."""
+    if BACKEND == "api":
+        from bindit import docker_api
+
+        with bindit.timings.phase("launch"):
+            returncode = docker_api.run_plan(plan)
+        if returncode and check:
+            sys.exit(returncode)
+        return returncode
+    final_command = plan.command()
+    if exec_:
+        # hand the process over to docker (does not return, so no exit handlers run)
+        bindit.timings.write()
+        bindit.shell.execute(*final_command)
+    with bindit.timings.phase("launch"):
+        ret = bindit.shell.run(*final_command, interactive=True, check=check)
     return ret.returncode
 
 
-@click.group()
-def docker():
-    pass
+def launch_captured(plan):
+    """run a planned docker run invocation with the selected BACKEND, capturing its
+    output. Unlike launch, this never exits. Returns (exit code, output str)."""
+    with bindit.timings.phase("launch"):
+        if BACKEND == "api":
+            from bindit import docker_api
+
+            output = io.StringIO()
+            # one decoder per stream, since their frames are interleaved
+            stdout = docker_api.DecodingWriter(output)
+            stderr = docker_api.DecodingWriter(output)
+            try:
+                returncode = docker_api.run_plan(plan, stdout=stdout, stderr=stderr)
+            finally:
+                stdout.close()
+                stderr.close()
+            return returncode, output.getvalue()
+        ret = bindit.shell.run(*plan.command(), check=False)
+    return ret.returncode, ret.stdout + ret.stderr
 
 
-docker.add_command(run)
+def run_command(run_args):
+    """plan a docker run invocation from run_args, write the final command to stdout
+    and run it (if not DRY_RUN). If PLAN_OUTPUT, the plan is saved there instead (see
+    bindit.planfile). Returns the exit code."""
+    resolver = bindit.PathResolver()
+    plan = plan_run(run_args, resolver=resolver)
+    rebased_lists = bindit.take_rebased_lists()
+    if bindit.PLAN_OUTPUT is not None:
+        from bindit import planfile
+
+        planfile.save(bindit.PLAN_OUTPUT, "docker", "run", run_args, plan, resolver)
+        return 0
+    # generate the final command by inserting the new binds
+    final_command = plan.command()
+
+    # write out to stdout with appropriate escapes
+    sys.stdout.write(bindit.shell.join_and_quote(final_command) + "\n")
+    if bindit.DRY_RUN:
+        return 0
+
+    # run the beast
+    sys.stdout.flush()
+    try:
+        return launch(plan, exec_=bindit.EXEC)
+    finally:
+        # the container has exited (or, with exec_, this never runs)
+        bindit.remove_rebased_lists(rebased_lists)
@@ -0,0 +1,381 @@
+"""Docker Engine API backend for bindit. Creates and starts containers over the local
+docker socket with a pooled keep-alive HTTP connection, instead of shelling out to the
+docker CLI. Binds are passed as structured HostConfig.Binds and HostConfig.Mounts."""
+import os
+import sys
+import json
+import queue
+import socket
+import codecs
+import struct
+import functools
+import http.client
+import urllib.parse
+import bindit
+
+DEFAULT_SOCKET = "/var/run/docker.sock"
+
+# docker run flags that map onto the container create API, as (section, field), where
+# section is the create config, its HostConfig, or None for bindit's own options. Flags
+# not listed here raise an error rather than being silently dropped.
+VALUE_FLAGS = {
+    "-e": ("config", "Env"),
+    "--env": ("config", "Env"),
+    "-w": ("config", "WorkingDir"),
+    "--workdir": ("config", "WorkingDir"),
+    "-u": ("config", "User"),
+    "--user": ("config", "User"),
+    "-h": ("config", "Hostname"),
+    "--hostname": ("config", "Hostname"),
+    "--entrypoint": ("config", "Entrypoint"),
+    "-l": ("config", "Labels"),
+    "--label": ("config", "Labels"),
+    "-v": ("host", "Binds"),
+    "--volume": ("host", "Binds"),
+    "--mount": ("host", "Mounts"),
+    "--network": ("host", "NetworkMode"),
+    "--net": ("host", "NetworkMode"),
+    "--name": (None, "name"),
+}
+BOOLEAN_FLAGS = {
+    "-t": ("config", "Tty"),
+    "--tty": ("config", "Tty"),
+    "-i": ("config", "OpenStdin"),
+    "--interactive": ("config", "OpenStdin"),
+    "--rm": ("host", "AutoRemove"),
+    "--init": ("host", "Init"),
+    "--privileged": ("host", "Privileged"),
+    "--read-only": ("host", "ReadonlyRootfs"),
+    "-d": (None, "detach"),
+    "--detach": (None, "detach"),
+}
+
+
+class DockerAPIError(OSError):
+    """error response from the Docker Engine API (an OSError, like the errors from
+    failing to reach the daemon, and like urllib.error.HTTPError)."""
+
+    def __init__(self, status, message):
+        super().__init__(f"docker API error {status}: {message}")
+        self.status = status
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTPConnection over a Unix socket."""
+
+    def __init__(self, socket_path, timeout=None):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        self.sock = sock
+
+
+class ConnectionPool(object):
+    """Pool of keep-alive UnixHTTPConnections to socket_path."""
+
+    def __init__(self, socket_path, maxsize=4):
+        self.socket_path = socket_path
+        self._idle = queue.LifoQueue(maxsize=maxsize)
+
+    def _get(self):
+        try:
+            return self._idle.get_nowait(), True
+        except queue.Empty:
+            return UnixHTTPConnection(self.socket_path), False
+
+    def _put(self, conn):
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def request(self, method, path, body=None, headers=None):
+        """send a request and return an http.client.HTTPResponse. Call release with the
+        response once it has been read, to return the connection to the pool."""
+        headers = dict(headers or {})
+        if body is not None and not isinstance(body, bytes):
+            body = json.dumps(body).encode("utf-8")
+            headers["Content-Type"] = "application/json"
+        conn, reused = self._get()
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+        except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+            conn.close()
+            if not reused:
+                raise
+            # the daemon closed an idle keep-alive connection - try a fresh one
+            conn = UnixHTTPConnection(self.socket_path)
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+        response.bindit_conn = conn
+        return response
+
+    def send(self, method, path):
+        """send a request on a new connection without waiting for the response, and
+        return the connection. Call receive with it to get the response (e.g., after
+        other requests on other connections)."""
+        conn = UnixHTTPConnection(self.socket_path)
+        conn.request(method, path)
+        return conn
+
+    def receive(self, conn):
+        """block until the response to the request sent with send arrives, and return
+        it. Call release once it has been read, as for request."""
+        response = conn.getresponse()
+        response.bindit_conn = conn
+        return response
+
+    def release(self, response):
+        """return the connection behind a fully read response to the pool."""
+        conn = response.bindit_conn
+        if response.will_close or not response.isclosed():
+            conn.close()
+        else:
+            self._put(conn)
+
+
+class DockerAPI(object):
+    """Minimal Docker Engine API client (just what bindit needs to run containers)."""
+
+    def __init__(self, socket_path=DEFAULT_SOCKET):
+        self.pool = ConnectionPool(socket_path)
+
+    def call(self, method, path, body=None, query=None):
+        """make a request and return the decoded JSON response (None if empty)."""
+        if query:
+            path += "?" + urllib.parse.urlencode(query)
+        return self.result(self.pool.request(method, path, body=body))
+
+    def result(self, response):
+        """read response and return the decoded JSON (None if empty)."""
+        payload = response.read()
+        self.pool.release(response)
+        if response.status >= 400:
+            try:
+                message = json.loads(payload)["message"]
+            except (ValueError, KeyError):
+                message = payload.decode("utf-8", "replace")
+            raise DockerAPIError(response.status, message)
+        if not payload:
+            return None
+        return json.loads(payload)
+
+    def pull(self, image):
+        """pull image (reading the progress stream to the end)."""
+        name, _, tag = image.partition("@")[0].rpartition(":")
+        if not name or "/" in tag:
+            name, tag = image, "latest"
+        bindit.LOGGER.info(f"pulling image: {image}")
+        response = self.pool.request(
+            "POST",
+            "/images/create?" + urllib.parse.urlencode({"fromImage": name, "tag": tag}),
+        )
+        payload = response.read()
+        self.pool.release(response)
+        if response.status >= 400:
+            raise DockerAPIError(response.status, payload.decode("utf-8", "replace"))
+
+    def create(self, config, name=None):
+        """create a container from config and return its id, pulling the image if
+        necessary."""
+        query = {"name": name} if name else None
+        try:
+            return self.call("POST", "/containers/create", body=config, query=query)[
+                "Id"
+            ]
+        except DockerAPIError as err:
+            if err.status != 404:
+                raise
+        self.pull(config["Image"])
+        return self.call("POST", "/containers/create", body=config, query=query)["Id"]
+
+    def start(self, container_id):
+        self.call("POST", f"/containers/{container_id}/start")
+
+    def wait(self, container_id):
+        """block until the container exits and return its exit code."""
+        return self.call("POST", f"/containers/{container_id}/wait")["StatusCode"]
+
+    def wait_later(self, container_id, condition="next-exit"):
+        """send a wait request for the container on its own connection, and return a
+        function that blocks until the container meets condition and returns its exit
+        code. Send this before starting the container, so that the daemon can't exit
+        (or remove, with condition 'removed') the container before the request
+        arrives."""
+        conn = self.pool.send(
+            "POST",
+            f"/containers/{container_id}/wait?"
+            + urllib.parse.urlencode({"condition": condition}),
+        )
+
+        def join():
+            return self.result(self.pool.receive(conn))["StatusCode"]
+
+        return join
+
+    def kill(self, container_id, signal="SIGINT"):
+        self.call("POST", f"/containers/{container_id}/kill", query={"signal": signal})
+
+    def logs(self, container_id, tty=False):
+        """Generator that follows the container output, returning (stream number,
+        bytes) tuples (1 for stdout, 2 for stderr)."""
+        response = self.pool.request(
+            "GET",
+            f"/containers/{container_id}/logs?follow=1&stdout=1&stderr=1",
+        )
+        if response.status >= 400:
+            payload = response.read()
+            self.pool.release(response)
+            raise DockerAPIError(response.status, payload.decode("utf-8", "replace"))
+        while True:
+            if tty:
+                # raw stream
+                stream, chunk = 1, response.read1(65536)
+            else:
+                # multiplexed stream - 8 byte header with stream number and size
+                header = response.read(8)
+                if len(header) < 8:
+                    break
+                stream, size = struct.unpack(">BxxxL", header)
+                chunk = response.read(size)
+            if not chunk:
+                break
+            yield stream, chunk
+        self.pool.release(response)
+
+
+class DecodingWriter(object):
+    """binary stream stand-in (see run_plan) that decodes what is written to it as UTF-8
+    and writes the text to the text stream text. The decoder is incremental, so
+    characters that are split across writes (e.g., log frames) come out whole. Call
+    close to decode any incomplete character at the end."""
+
+    def __init__(self, text):
+        self.text = text
+        self.decoder = codecs.getincrementaldecoder("utf-8")("replace")
+
+    def write(self, data):
+        self.text.write(self.decoder.decode(data))
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.text.write(self.decoder.decode(b"", final=True))
+
+
+@functools.lru_cache(maxsize=None)
+def client():
+    """return a shared DockerAPI for DOCKER_HOST (if a unix:// address) or the default
+    docker socket."""
+    host = os.environ.get("DOCKER_HOST", "")
+    if host.startswith("unix://"):
+        return DockerAPI(host[len("unix://"):])
+    return DockerAPI(DEFAULT_SOCKET)
+
+
+def plan_to_config(plan):
+    """translate a bindit.RunPlan to a container create config. Returns (config, name,
+    detach)."""
+    config = {"Image": plan.container_name, "Cmd": plan.image_args, "Env": []}
+    host_config = {"Binds": [], "Mounts": []}
+    options = {"name": None, "detach": False}
+    sections = {"config": config, "host": host_config, None: options}
+    args = list(plan.container_args)
+    while args:
+        key = args.pop(0)
+        if key in BOOLEAN_FLAGS:
+            section, field = BOOLEAN_FLAGS[key]
+            sections[section][field] = True
+        elif key in VALUE_FLAGS:
+            section, field = VALUE_FLAGS[key]
+            target = sections[section]
+            value = args.pop(0)
+            if field in ("Env", "Binds"):
+                target[field].append(value)
+            elif field == "Mounts":
+                target[field].append(mount_to_api(value))
+            elif field == "Labels":
+                label, _, label_value = value.partition("=")
+                target.setdefault(field, {})[label] = label_value
+            elif field == "Entrypoint":
+                target[field] = [value]
+            else:
+                target[field] = value
+        elif key.startswith("-") and not key.startswith("--") and len(key) > 2:
+            # combined boolean letters (-it), so expand and parse again
+            args = [f"-{letter}" for letter in key[1:]] + args
+        else:
+            raise ValueError(
+                f"docker run argument {key} is not supported by the api backend, "
+                "use the cli backend instead"
+            )
+    if config.get("OpenStdin") and not options["detach"]:
+        raise ValueError(
+            "attaching stdin (-i without -d) is not supported by the api backend, "
+            "use the cli backend instead"
+        )
+    # new binds, with their options (see bindit.docker.volume_bind_args)
+    host_config["Binds"] += plan.bind_args[1::2]
+    config["HostConfig"] = host_config
+    return config, options["name"], options["detach"]
+
+
+def mount_to_api(mount_arg):
+    """translate a docker --mount argument (e.g., type=bind,src=/foo,dst=/bar) to an
+    API Mounts entry."""
+    mount_dict = dict(
+        kv.split("=", 1) if "=" in kv else (kv, "true") for kv in mount_arg.split(",")
+    )
+    source = next(mount_dict[k] for k in mount_dict if k in ["source", "src"])
+    target = next(
+        mount_dict[k] for k in mount_dict if k in ["destination", "dst", "target"]
+    )
+    return {
+        "Type": mount_dict.get("type", "volume"),
+        "Source": source,
+        "Target": target,
+        "ReadOnly": mount_dict.get("readonly", mount_dict.get("ro")) in ("true", "1"),
+    }
+
+
+def run_plan(plan, api=None, stdout=None, stderr=None):
+    """create and start the container for plan (bindit.RunPlan) through the Docker
+    Engine API, streaming its output as is to the binary streams stdout and stderr
+    (default sys.stdout.buffer and sys.stderr.buffer, see DecodingWriter for text)
+    unless detached. Returns the exit code."""
+    if api is None:
+        api = client()
+    if stdout is None or stderr is None:
+        # anything already written as text goes first
+        sys.stdout.flush()
+        sys.stderr.flush()
+    outputs = {1: stdout or sys.stdout.buffer, 2: stderr or sys.stderr.buffer}
+    config, name, detach = plan_to_config(plan)
+    container_id = api.create(config, name=name)
+    if detach:
+        api.start(container_id)
+        outputs[1].write(f"{container_id}\n".encode("utf-8"))
+        outputs[1].flush()
+        return 0
+    # an auto-removed container may be gone by the time its logs end, so wait for the
+    # removal, with the request in place before the container starts
+    condition = "removed" if config["HostConfig"].get("AutoRemove") else "next-exit"
+    join = api.wait_later(container_id, condition=condition)
+    api.start(container_id)
+    try:
+        for stream, chunk in api.logs(container_id, tty=config.get("Tty", False)):
+            out = outputs.get(stream, outputs[1])
+            out.write(chunk)
+            out.flush()
+        return join()
+    except KeyboardInterrupt:
+        # pass the interrupt on, like the docker CLI's signal proxy
+        api.kill(container_id, signal="SIGINT")
+        return join()
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import concurrent.futures
+import click
+import bindit
+import bindit.shell
+import bindit.docker
+
+"""click commands for bindit docker (see bindit.docker)."""
+
+
+@click.command(context_settings=dict(ignore_unknown_options=True))
+@click.argument("run_args", nargs=-1, required=True, type=click.UNPROCESSED)
+def run(run_args):
+    """click.command that casts run_args to lists and handles parsing of the arguments,
+    adding volume binds as necessary and running the container (if not DRY_RUN).
+    Planning errors (e.g., unsafe binds, or arguments the api backend does not support)
+    and errors from the Docker Engine API are reported as click errors."""
+    try:
+        return bindit.docker.run_command(run_args)
+    except (ValueError, OSError) as err:
+        raise click.ClickException(str(err))
+
+
+def plan_manifest(manifest, fresh_resolvers=False):
+    """Generator that plans the docker run invocation on each line of manifest (see
+    batch), sharing the ignore path index, argument cache and (unless fresh_resolvers)
+    file system queries across lines. Returns (line number, plan, rebased path lists)
+    tuples (see bindit.take_rebased_lists), where plan is None if the line could not be
+    parsed or planned (the error is logged)."""
+    resolver = bindit.PathResolver()
+    ignore_index = bindit.PathTrie(bindit.IGNORE_PATH)
+    arg_cache = bindit.ArgCache()
+    for line, text in enumerate(manifest, start=1):
+        if fresh_resolvers:
+            resolver = bindit.PathResolver()
+        try:
+            run_args = bindit.manifest_args(text)
+            if run_args is None:
+                continue
+            plan = bindit.docker.plan_run(
+                run_args,
+                resolver=resolver,
+                ignore_index=ignore_index,
+                arg_cache=arg_cache,
+            )
+        except (ValueError, OSError) as err:
+            # e.g., unbalanced quotes, or unsafe binds
+            bindit.LOGGER.error(f"line {line} failed ({type(err).__name__}: {err})")
+            bindit.remove_rebased_lists(bindit.take_rebased_lists())
+            yield line, None, []
+            continue
+        yield line, plan, bindit.take_rebased_lists()
+    bindit.LOGGER.debug(f"argument cache: {dict(arg_cache.counts)}")
+
+
+@click.command()
+@click.argument("manifest", type=click.File("r"))
+def batch(manifest):
+    """run docker for each line in MANIFEST (use - for stdin). Each line holds the
+    arguments you would pass to bindit docker run, either shell-quoted or as a JSON list
+    (JSONL). The docker CLI inference and ignore path index are shared across all lines,
+    and so are file system queries in dryrun mode (when containers run, they may change
+    the file system, so each line gets fresh queries). Each docker run command is
+    written to stdout and run in turn (if not DRY_RUN, and ignoring EXEC). Arguments
+    that repeat across lines are looked up in a bindit.ArgCache (validated against
+    parent directory modification times, so it is kept even when containers run). A
+    line that can't be planned or a failed container doesn't stop the batch. Failed
+    lines are reported individually, and the exit code is 1 if any line failed."""
+    if bindit.PLAN_OUTPUT is not None:
+        raise click.UsageError("plan one docker run at a time (see bindit plan --help)")
+    n_lines = 0
+    failed = []
+    lines = plan_manifest(manifest, fresh_resolvers=not bindit.DRY_RUN)
+    for line, plan, rebased_lists in lines:
+        n_lines += 1
+        if plan is None:
+            failed.append(line)
+            continue
+        command = bindit.shell.join_and_quote(plan.command())
+        sys.stdout.write(command + "\n")
+        if bindit.DRY_RUN:
+            continue
+        # flush so the command is written before the container's output
+        sys.stdout.flush()
+        try:
+            returncode = bindit.docker.launch(plan, check=False)
+            error = f"exit code {returncode}"
+        except Exception as err:
+            returncode, error = None, f"{type(err).__name__}: {err}"
+        bindit.remove_rebased_lists(rebased_lists)
+        if returncode != 0:
+            failed.append(line)
+            bindit.LOGGER.error(f"line {line} failed ({error}): {command}")
+    if failed:
+        bindit.LOGGER.error(f"{len(failed)} of {n_lines} lines failed: {failed}")
+        sys.exit(1)
+    return 0
+
+
+@click.command(name="run-many")
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=os.cpu_count() or 1,
+    show_default=True,
+    help="Maximum number of containers to run at the same time",
+)
+@click.argument("manifest", type=click.File("r"), default="-")
+def run_many(jobs, manifest):
+    """run docker for each line in MANIFEST (default stdin) concurrently. MANIFEST has
+    the same format as for batch. All lines are planned up front with shared state,
+    their docker run commands are written to stdout, and (if not DRY_RUN) the containers
+    are then run by a pool of at most JOBS workers. The output of each container is
+    written out when it finishes. Jobs (manifest lines) that can't be planned or fail
+    are reported individually without stopping the others, and the exit code is 1 if
+    any job failed."""
+    if bindit.PLAN_OUTPUT is not None:
+        raise click.UsageError("plan one docker run at a time (see bindit plan --help)")
+    jobs_planned = {}
+    failed = []
+    n_jobs = 0
+    for line, plan, rebased_lists in plan_manifest(manifest):
+        n_jobs += 1
+        if plan is None:
+            failed.append(line)
+            continue
+        jobs_planned[line] = (plan, rebased_lists)
+        sys.stdout.write(bindit.shell.join_and_quote(plan.command()) + "\n")
+    if not bindit.DRY_RUN:
+        sys.stdout.flush()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+            futures = {
+                executor.submit(bindit.docker.launch_captured, plan): line
+                for line, (plan, _) in jobs_planned.items()
+            }
+            for future in concurrent.futures.as_completed(futures):
+                line = futures[future]
+                try:
+                    returncode, output = future.result()
+                except Exception as err:
+                    returncode, output = None, f"{type(err).__name__}: {err}\n"
+                bindit.remove_rebased_lists(jobs_planned[line][1])
+                sys.stdout.write(output)
+                sys.stdout.flush()
+                if returncode == 0:
+                    bindit.LOGGER.info(f"line {line} finished")
+                else:
+                    failed.append(line)
+                    bindit.LOGGER.error(f"line {line} failed (exit code {returncode})")
+    if failed:
+        bindit.LOGGER.error(f"{len(failed)} of {n_jobs} lines failed: {sorted(failed)}")
+        sys.exit(1)
+    return 0
+
+
+def validate_mode(ctx, param, value):
+    """click callback that checks the docker -v options in value (see
+    bindit.docker.VOLUME_OPTIONS)."""
+    if value is None:
+        return value
+    unknown = [
+        option
+        for option in value.split(",")
+        if option not in bindit.docker.VOLUME_OPTIONS
+    ]
+    if unknown:
+        raise click.BadParameter(
+            f"unknown docker -v options: {', '.join(unknown)} (expected "
+            f"{', '.join(bindit.docker.VOLUME_OPTIONS)})"
+        )
+    return value
+
+
+@click.group()
+@click.option(
+    "-b",
+    "--backend",
+    type=click.Choice(["cli", "api"]),
+    default="cli",
+    show_default=True,
+    help="Launch containers with the docker command (cli) or directly through the \
+        Docker Engine API on the local socket (api, supports common docker run \
+        arguments only)",
+)
+@click.option(
+    "--input-mode",
+    default=None,
+    metavar="OPTIONS",
+    callback=validate_mode,
+    help="docker -v options (comma-separated, e.g. ro or ro,cached) for new binds that \
+        only hold existing paths (inputs)",
+)
+@click.option(
+    "--output-mode",
+    default=None,
+    metavar="OPTIONS",
+    callback=validate_mode,
+    help="docker -v options (e.g. delegated) for new binds that hold paths that don't \
+        exist yet, or follow an output flag (outputs)",
+)
+@click.option(
+    "--output-flag",
+    multiple=True,
+    metavar="PATTERN",
+    help="Image argument flags (e.g. '--save*') whose values are outputs, in addition \
+        to -o, --out* and -out*. You can use this flag multiple times.",
+)
+def docker(backend, input_mode, output_mode, output_flag):
+    bindit.docker.BACKEND = backend
+    bindit.docker.INPUT_MODE = input_mode
+    bindit.docker.OUTPUT_MODE = output_mode
+    bindit.OUTPUT_FLAGS += list(output_flag)
+
+
+docker.add_command(run)
+docker.add_command(batch)
+docker.add_command(run_many)
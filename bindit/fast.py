@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import pathlib
+import bindit
+
+"""Fast-start entry point for bindit (the bindit console script). The common
+bindit [OPTIONS] docker run ARGS... and bindit [OPTIONS] apply PLAN calls are handled
+without importing click or the modules that other commands need (the daemon, the Docker
+Engine API backend, the cache). Everything else, including --help, --version and options
+that this module does not know about, goes to the full command line interface in
+bindit.cli."""
+
+# global options (see bindit.cli.main) that take a value, and boolean flags
+VALUE_OPTIONS = {
+    "-l": "loglevel",
+    "--loglevel": "loglevel",
+    "-i": "ignorepath",
+    "--ignorepath": "ignorepath",
+    "--timings": "timings",
+    "--scan-lists": "scan_lists",
+    "--max-binds": "max_binds",
+}
+# VALUE_OPTIONS that can be given multiple times
+MULTIPLE_OPTIONS = ["ignorepath", "scan_lists"]
+FLAG_OPTIONS = {
+    "-d": "dryrun",
+    "--dryrun": "dryrun",
+    "--exec": "exec_",
+    "-a": "absonly",
+    "--absonly": "absonly",
+    "--rebase-lists": "rebase_lists",
+}
+# FLAG_OPTIONS that turn the option off
+NEGATED_FLAG_OPTIONS = {"--no-rebase-lists": "rebase_lists"}
+
+
+def parse_global_options(argv):
+    """return (options dict, remaining arguments) for the global options at the start of
+    argv, or None if there are options that the fast path does not handle."""
+    options = {
+        "loglevel": "INFO",
+        "dryrun": False,
+        "exec_": False,
+        "absonly": False,
+        "timings": None,
+        "ignorepath": [],
+        "scan_lists": [],
+        "rebase_lists": True,
+        "max_binds": None,
+    }
+    remaining = list(argv)
+    while remaining and remaining[0].startswith("-"):
+        option = remaining.pop(0)
+        if option in FLAG_OPTIONS:
+            options[FLAG_OPTIONS[option]] = True
+        elif option in NEGATED_FLAG_OPTIONS:
+            options[NEGATED_FLAG_OPTIONS[option]] = False
+        elif option in VALUE_OPTIONS and remaining:
+            value = remaining.pop(0)
+            name = VALUE_OPTIONS[option]
+            if name == "ignorepath" and not os.path.exists(value):
+                # let click report the error
+                return None
+            if name == "max_binds":
+                if not value.isdigit() or int(value) < 1:
+                    return None
+                value = int(value)
+            if name in MULTIPLE_OPTIONS:
+                options[name].append(value)
+            else:
+                options[name] = value
+        else:
+            # combined flags (-da), --option=value and such
+            return None
+    if "--help" in remaining:
+        # click handles --help anywhere on the command line
+        return None
+    return options, remaining
+
+
+def parse_fast_args(argv):
+    """return (options dict, docker run arguments) if argv is a docker run call that
+    the fast path can handle, otherwise None."""
+    parsed = parse_global_options(argv)
+    if parsed is None:
+        return None
+    options, remaining = parsed
+    if remaining[:2] != ["docker", "run"] or len(remaining) < 3:
+        return None
+    return options, remaining[2:]
+
+
+def parse_fast_apply(argv):
+    """return (options dict, plan file, strict) if argv is a bindit apply call that
+    the fast path can handle, otherwise None."""
+    parsed = parse_global_options(argv)
+    if parsed is None:
+        return None
+    options, remaining = parsed
+    if remaining[:1] != ["apply"]:
+        return None
+    strict = remaining[1:2] == ["--strict"]
+    if strict:
+        del remaining[1]
+    if len(remaining) != 2 or (remaining[1].startswith("-") and remaining[1] != "-"):
+        return None
+    return options, remaining[1], strict
+
+
+def configure(options):
+    """apply the global options (same as bindit.cli.main)."""
+    bindit.configure_logging(options["loglevel"])
+    bindit.DRY_RUN = options["dryrun"]
+    bindit.EXEC = options["exec_"]
+    bindit.ABS_ONLY = options["absonly"]
+    bindit.IGNORE_PATH += [pathlib.Path(p) for p in options["ignorepath"]]
+    bindit.SCAN_LISTS += options["scan_lists"]
+    bindit.REBASE_LISTS = options["rebase_lists"]
+    bindit.MAX_BINDS = options["max_binds"]
+    if options["timings"]:
+        bindit.timings.enable(options["timings"])
+
+
+def main(argv=None):
+    """run bindit with argv (default sys.argv[1:]), taking the fast path if possible."""
+    if argv is None:
+        argv = sys.argv[1:]
+    parsed = parse_fast_args(argv)
+    if parsed is not None:
+        options, run_args = parsed
+        configure(options)
+        from bindit import docker
+
+        try:
+            docker.run_command(run_args)
+        except bindit.UnsafeBindError as err:
+            sys.stderr.write(f"Error: {err}\n")
+            return 1
+        return 0
+    parsed = parse_fast_apply(argv)
+    if parsed is not None:
+        options, plan_file, strict = parsed
+        configure(options)
+        from bindit import planfile
+
+        try:
+            planfile.apply(plan_file, strict=strict)
+        except (OSError, ValueError) as err:
+            # same as click.ClickException
+            sys.stderr.write(f"Error: {err}\n")
+            return 1
+        return 0
+    from bindit import cli
+
+    return cli.main(args=argv, prog_name="bindit")
+
+
+if __name__ == "__main__":
+    sys.exit(main())  # pragma: no cover
@@ -1,43 +1,211 @@
+import io
 import sys
+import json
+import shlex
+import pathlib
+import contextlib
 import click
 import bindit
+import bindit.cli
+import bindit.fast
 import bindit.shell
+import bindit.planfile
 
 """Auxiliary command line interface for creating containerized apps with bindit. This
 tool draws its name from its inspiration, functools.partial in the standard library."""
 
 
-@click.command(context_settings=dict(ignore_unknown_options=True))
-@click.option(
-    "--output_file",
-    default=None,
-    show_default=True,
-    help="Output to file instead of standard out",
-)
-@click.option(
-    "--shebang",
-    default="#!/bin/bash",
-    show_default=True,
-    help="Shell interpreter directive",
-)
-@click.option(
-    "--vararg_pattern",
-    default='"$@"',
-    show_default=True,
-    help='vararg pattern (try "$argv" for csh/tcsh)',
-)
-@click.argument("script_arg", nargs=-1, required=True, type=click.UNPROCESSED)
-@click.version_option(version=bindit.__version__, message="%(version)s")
-def main(output_file, shebang, vararg_pattern, script_arg):
-    """bindit_partial constructs a shell script wrapper for bindit (or your container
-    runner directly) that can be used as a command line interface for the container. It
-    works a bit like functools.partial in the standard library - you can offload some
-    default parameters (e.g. for volume binds mounts) to the script in order to obtain a
-    cleaner API for the container.
+# POSIX shell rewriter for --fastpath scripts. Arguments are split on the same
+# characters as bindit.ARG_SPLIT_PATTERN, and each part that bindit would treat as a
+# path is resolved (with cd -P, in a subshell) and mapped through the embedded binds
+# (bindit_bind). Anything the rewriter is not sure about goes to bindit_fallback.
+FASTPATH_REWRITER = r"""bindit_part() {
+    # set bindit_new to the in-container form of $1, or return 1 if bindit is needed
+    bindit_new=$1
+    [ -n "$1" ] || return 0
+    case $1 in
+        /*) ;;
+        *) %(relative)s ;;
+    esac
+    if [ -d "$1" ]; then
+        bindit_full=$(CDPATH= cd -P -- "$1" 2>/dev/null && pwd -P) || return 1
+    else
+        # bindit binds the target of symlinks to files
+        [ -L "$1" ] && return 1
+        case $1 in
+            */*) bindit_dir=${1%%/*} bindit_name=${1##*/} ;;
+            *) bindit_dir=. bindit_name=$1 ;;
+        esac
+        case $bindit_name in
+            "" | . | ..) return 1 ;;
+        esac
+        bindit_full=$(CDPATH= cd -P -- "${bindit_dir:-/}" 2>/dev/null && pwd -P) ||
+            return 1
+        bindit_full=${bindit_full%%/}/$bindit_name
+    fi
+    bindit_ignored "$bindit_full" && return 0
+    bindit_bind "$bindit_full" || return 1
+    bindit_new=$bindit_dest
+}
 
-    For main documentation, see bindit.
-    """
+bindit_arg() {
+    # set bindit_out to $1 with every part rewritten, or return 1 if bindit is needed
+    bindit_rest=$1
+    bindit_out=
+    while :; do
+        bindit_head=${bindit_rest%%%%[=:,]*}
+        bindit_part "$bindit_head" || return 1
+        bindit_out=$bindit_out$bindit_new
+        [ "$bindit_head" = "$bindit_rest" ] && return 0
+        bindit_rest=${bindit_rest#"$bindit_head"}
+        bindit_out=$bindit_out${bindit_rest%%"${bindit_rest#?}"}
+        bindit_rest=${bindit_rest#?}
+    done
+}
+
+bindit_args=
+bindit_shown=
+for bindit_this in "$@"; do
+    case $bindit_this in
+        # quotes, escapes and white space are split by bindit (see bindit.shell_tokens)
+        *[[:space:]]* | *\'* | *\"* | *\\*) bindit_fallback "$@" ;;
+    esac
+    bindit_arg "$bindit_this" || bindit_fallback "$@"
+    bindit_args="$bindit_args '$bindit_out'"
+    # quoted like shlex.quote, as bindit writes the final command to stdout
+    case $bindit_out in
+        "" | *[!A-Za-z0-9@%%+=:,./_-]*) bindit_out="'$bindit_out'" ;;
+    esac
+    bindit_shown="$bindit_shown $bindit_out"
+done
+eval "set -- $bindit_args"
+"""
+
+
+def case_pattern(path):
+    """return a shell case pattern for path and everything under it."""
+    quoted = shlex.quote(str(path))
+    return f"{quoted} | {quoted}/*"
+
+
+def fastpath_script(shebang, fallback_line, docker_line, binds, ignore_path, abs_only):
+    """return the lines of a --fastpath wrapper script (see main). fallback_line is the
+    bindit command to run for arguments that the shell rewriter can't handle, and
+    docker_line the docker command to run otherwise (both shell-quoted, without the
+    trailing arguments). binds (dict) maps resolved host directories to their
+    in-container paths, and ignore_path and abs_only are as bindit.IGNORE_PATH and
+    bindit.ABS_ONLY."""
+    lines = [
+        shebang,
+        "# generated by bindit_partial --fastpath. Arguments whose paths are all under",
+        "# the binds below are rewritten here, everything else goes to bindit.",
+        "bindit_fallback() {",
+        f'    exec {fallback_line} "$@"',
+        "}",
+        "",
+        "bindit_bind() {",
+        "    # map the resolved host path $1 to bindit_dest (deepest bind first)",
+        "    case $1 in",
+    ]
+    for source in sorted(binds, key=lambda path: len(path.parts), reverse=True):
+        dest = binds[source]
+        if "'" in f"{source}{dest}" or len(source.parts) < 2 or len(dest.parts) < 2:
+            # can't be quoted for the rewriter's eval, or binds the root
+            continue
+        lines.append(
+            f"        {case_pattern(source)}) "
+            f"bindit_dest={shlex.quote(str(dest))}${{1#{shlex.quote(str(source))}}} ;;"
+        )
+    lines += [
+        "        *) return 1 ;;",
+        "    esac",
+        "}",
+        "",
+        "bindit_ignored() {",
+        "    case $1 in",
+    ]
+    lines += [f"        {case_pattern(path)}) return 0 ;;" for path in ignore_path]
+    lines += [
+        "    esac",
+        "    return 1",
+        "}",
+        "",
+    ]
+    # relative paths are only paths if they exist (and not at all if abs_only)
+    relative = "return 0" if abs_only else '[ -e "$1" ] || return 0'
+    lines += (FASTPATH_REWRITER % {"relative": relative}).splitlines()
+    lines.append(f"printf '%s\\n' {shlex.quote(docker_line)}\"$bindit_shown\"")
+    lines.append(f'exec {docker_line} "$@"')
+    return [line + "\n" for line in lines]
+
+
+def plan_command(bindit_args):
+    """plan bindit_args (bindit global options followed by a docker run, singularity
+    exec or singularity run command) in this process, and return the plan file record
+    (dict, see bindit.planfile.save). The settings that the global and runner options
+    change are restored afterwards, so this can be called many times in one process
+    (with the container runner CLI lookups cached across calls)."""
+    saved = {
+        name: bindit.planfile.settings(name) for name in ["docker", "singularity"]
+    }
+    saved_flags = bindit.DRY_RUN, bindit.EXEC, bindit.PLAN_OUTPUT
+    output = io.StringIO()
+    try:
+        # bindit writes the plan instead of running anything
+        bindit.PLAN_OUTPUT = "-"
+        with contextlib.redirect_stdout(output):
+            bindit.cli.main.main(
+                args=list(bindit_args), prog_name="bindit", standalone_mode=False
+            )
+    finally:
+        for name, recorded in saved.items():
+            bindit.planfile.restore_settings(name, recorded)
+        bindit.DRY_RUN, bindit.EXEC, bindit.PLAN_OUTPUT = saved_flags
+    if not output.getvalue():
+        raise click.UsageError(
+            "bindit_partial wraps docker run, singularity exec and singularity run"
+        )
+    return json.loads(output.getvalue())
+
+
+def fastpath_lines(shebang, vararg_pattern, script_arg, record):
+    """return the lines of a --fastpath wrapper for script_arg (a bindit docker run
+    command line, without --dryrun), where record is its plan (see plan_command)."""
+    if vararg_pattern != '"$@"':
+        raise click.UsageError("--fastpath generates POSIX shell scripts only")
+    parsed = bindit.fast.parse_global_options(script_arg[1:])
+    if parsed is None or record["runner_module"] != "docker":
+        raise click.UsageError(
+            "--fastpath supports bindit docker run with the -a, -i and -l options only"
+        )
+    _, remaining = parsed
+    global_options = list(script_arg[1 : len(script_arg) - len(remaining)])
+    plan = bindit.planfile.plan_from_dict(record["plan"])
+    docker_line = plan.command_line()
+    fallback_line = bindit.shell.join_and_quote(["bindit"] + global_options)
+    fallback_line += " " + docker_line
+    settings = record["settings"]
+    if settings["scan_lists"]:
+        # path lists have to be scanned by bindit
+        bindit.LOGGER.warning("--fastpath has no effect with --scan-lists")
+        return [shebang + "\n", fallback_line + ' "$@"\n']
+    return fastpath_script(
+        shebang,
+        fallback_line,
+        docker_line,
+        {**plan.manual_binds, **plan.new_binds},
+        [pathlib.Path(path) for path in settings["ignore_path"]],
+        settings["abs_only"],
+    )
 
+
+def wrapper_lines(
+    script_arg, shebang="#!/bin/bash", vararg_pattern='"$@"', fastpath=False
+):
+    """return the lines of a wrapper script for script_arg (see main, which writes the
+    lines to a file or stdout). The command is planned in this process (see
+    plan_command), so generating many wrappers in one process only pays for the
+    container runner CLI lookup once."""
     script_arg = list(script_arg)
     # detect dryrun mode, and remove that arg. Re-insert it later. (ie, you can generate
     # a dryrun app if that's your thing)
@@ -66,14 +234,66 @@ def main(output_file, shebang, vararg_pattern, script_arg):
     if script_arg[0] == "bindit":
         start_ind = 1
         line = "bindit "
-    ret = bindit.shell.run(
-        "bindit", "--dryrun", *script_arg[start_ind:], interactive=False
-    )
+    elif fastpath:
+        raise click.UsageError("--fastpath needs a bindit command to fall back on")
+    record = plan_command(script_arg[start_ind:])
     if dry_index:
         line += "--dryrun "
-    # last line (in case you are using verbose bindit args)
-    line += ret.stdout.split("\n")[-2]
+    line += bindit.planfile.plan_from_dict(record["plan"]).command_line()
     all_lines = [shebang + "\n", line + " " + vararg_pattern + "\n"]
+    if fastpath and dry_index:
+        # dryrun wrappers print the command, which bindit does best
+        bindit.LOGGER.warning("--fastpath has no effect with --dryrun")
+    elif fastpath:
+        all_lines = fastpath_lines(shebang, vararg_pattern, script_arg, record)
+    return all_lines
+
+
+@click.command(context_settings=dict(ignore_unknown_options=True))
+@click.option(
+    "--output_file",
+    default=None,
+    show_default=True,
+    help="Output to file instead of standard out",
+)
+@click.option(
+    "--shebang",
+    default="#!/bin/bash",
+    show_default=True,
+    help="Shell interpreter directive",
+)
+@click.option(
+    "--vararg_pattern",
+    default='"$@"',
+    show_default=True,
+    help='vararg pattern (try "$argv" for csh/tcsh)',
+)
+@click.option(
+    "--fastpath",
+    is_flag=True,
+    help="Embed the binds in the script, and rewrite arguments in the shell (calling \
+        docker directly) when all their paths are under these binds. bindit docker run \
+        wrappers only",
+)
+@click.argument("script_arg", nargs=-1, required=True, type=click.UNPROCESSED)
+@click.version_option(version=bindit.__version__, message="%(version)s")
+def main(output_file, shebang, vararg_pattern, fastpath, script_arg):
+    """bindit_partial constructs a shell script wrapper for bindit (or your container
+    runner directly) that can be used as a command line interface for the container. It
+    works a bit like functools.partial in the standard library - you can offload some
+    default parameters (e.g. for volume binds mounts) to the script in order to obtain a
+    cleaner API for the container.
+
+    With --fastpath, the script only calls bindit when it sees a path that is not
+    under one of the binds it already has (see the bindit_partial documentation), and
+    otherwise runs docker without starting Python.
+
+    For main documentation, see bindit.
+    """
+
+    all_lines = wrapper_lines(
+        script_arg, shebang=shebang, vararg_pattern=vararg_pattern, fastpath=fastpath
+    )
     if output_file:
         with open(output_file, "w") as file_handle:
             file_handle.writelines(all_lines)
@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import json
+import stat
+import pathlib
+import tempfile
+import importlib
+import bindit
+
+"""Reusable bind plans (see bindit plan and bindit apply). A plan file stores a planned
+container runner invocation (bindit.RunPlan) together with the arguments and settings it
+was planned from, and the file system state it depended on: every path that was resolved
+and stat'ed during planning, with its type and inode (and modification time, for
+scanned path list files). Applying a plan only stats those paths, so repeated launches
+(e.g., thousands of array tasks on a cluster) skip argument parsing, path resolution and
+the container runner CLI lookup. Plans whose dependencies changed are re-planned from
+the recorded arguments (or rejected, if strict)."""
+
+# 2: dependencies no longer record device numbers
+PLAN_VERSION = 2
+# dependency kinds. Paths that existed are recorded as dir or file (with their inode,
+# which must match). Device numbers are left out, since they differ between hosts for
+# the same network file system (NFS, Lustre), and plans are often made on one host
+# (e.g., a login node) and applied on others. Absolute paths that did not exist are
+# recorded as missing, and may since have been created as regular files (e.g., the
+# output of an earlier array task). Relative paths that did not exist are recorded as absent, and must still not
+# exist (otherwise they would now be bound).
+DIR, FILE, MISSING, ABSENT = "dir", "file", "missing", "absent"
+
+
+def dependencies(resolver, cwd):
+    """return a sorted list of [absolute path, kind, ...] dependencies (see DIR, FILE,
+    MISSING and ABSENT) for the paths that were resolved and stat'ed with resolver
+    (bindit.PathResolver) in the working directory cwd."""
+    found = {}
+    for path, resolved in resolver._resolved.items():
+        if resolved not in resolver._stat:
+            # only resolved (e.g., ignored paths), so the plan does not depend on it
+            continue
+        result = resolver._stat[resolved]
+        full_path = os.path.join(cwd, path)
+        if result is None:
+            kind = MISSING if path.is_absolute() else ABSENT
+            dependency = [full_path, kind]
+        else:
+            kind = DIR if stat.S_ISDIR(result.st_mode) else FILE
+            dependency = [full_path, kind, result.st_ino]
+            if kind == FILE and bindit.SCAN_LISTS and bindit.is_path_list(resolved):
+                # the listed paths are bound too, so the contents matter
+                dependency.append(result.st_mtime_ns)
+        if found.get(full_path, [None, None])[1] != ABSENT:
+            # a relative path and its resolved form can both be recorded, and the
+            # stricter absent has to win
+            found[full_path] = dependency
+    return sorted(found.values())
+
+
+def changed_dependency(dependencies):
+    """return the first dependency (see dependencies) that no longer holds, or None if
+    they all do."""
+    for dependency in dependencies:
+        path, kind = dependency[:2]
+        try:
+            result = os.stat(path)
+        except (OSError, ValueError):
+            result = None
+        if result is None:
+            holds = kind in (MISSING, ABSENT)
+        elif kind == ABSENT:
+            holds = False
+        elif kind == MISSING:
+            holds = stat.S_ISREG(result.st_mode)
+        else:
+            observed = [
+                path,
+                DIR if stat.S_ISDIR(result.st_mode) else FILE,
+                result.st_ino,
+            ]
+            if len(dependency) > 3:
+                observed.append(result.st_mtime_ns)
+            holds = observed == dependency
+        if not holds:
+            return dependency
+    return None
+
+
+def plan_to_dict(plan):
+    """return a JSON-serialisable dict for plan (bindit.RunPlan)."""
+    return {
+        "runner": [str(arg) for arg in plan.runner],
+        "container_args": [str(arg) for arg in plan.container_args],
+        "bind_args": [str(arg) for arg in plan.bind_args],
+        "container_name": plan.container_name,
+        "image_args": [str(arg) for arg in plan.image_args],
+        "manual_binds": [
+            [str(key), str(value)] for key, value in plan.manual_binds.items()
+        ],
+        "new_binds": [[str(key), str(value)] for key, value in plan.new_binds.items()],
+        "env": plan.env,
+    }
+
+
+def plan_from_dict(data):
+    """return a bindit.RunPlan from a plan_to_dict dict."""
+    data = dict(data)
+    for name in ["manual_binds", "new_binds"]:
+        data[name] = {
+            pathlib.Path(key): pathlib.PosixPath(value) for key, value in data[name]
+        }
+    return bindit.RunPlan(**data)
+
+
+def runner(runner_module):
+    """return the bindit module for runner_module (docker or singularity), imported on
+    demand so that applying a docker plan does not import click."""
+    return importlib.import_module(f"bindit.{runner_module}")
+
+
+def settings(runner_module):
+    """return the current settings that planning depends on (see restore_settings)."""
+    current = {
+        "abs_only": bindit.ABS_ONLY,
+        "ignore_path": [str(path) for path in bindit.IGNORE_PATH],
+        "scan_lists": list(bindit.SCAN_LISTS),
+        "rebase_lists": bindit.REBASE_LISTS,
+        "max_binds": bindit.MAX_BINDS,
+        "output_flags": list(bindit.OUTPUT_FLAGS),
+    }
+    module = runner(runner_module)
+    if runner_module == "docker":
+        current["backend"] = module.BACKEND
+        current["input_mode"] = module.INPUT_MODE
+        current["output_mode"] = module.OUTPUT_MODE
+    else:
+        current["runner"] = module.RUNNER
+        current["bind_mode"] = module.BIND_MODE
+    return current
+
+
+def restore_settings(runner_module, recorded):
+    """apply settings recorded with settings(runner_module)."""
+    bindit.ABS_ONLY = recorded["abs_only"]
+    bindit.IGNORE_PATH = [pathlib.Path(path) for path in recorded["ignore_path"]]
+    bindit.SCAN_LISTS = list(recorded["scan_lists"])
+    bindit.REBASE_LISTS = recorded["rebase_lists"]
+    # not recorded by earlier versions
+    bindit.MAX_BINDS = recorded.get("max_binds")
+    bindit.OUTPUT_FLAGS = list(recorded.get("output_flags", bindit.OUTPUT_FLAGS))
+    module = runner(runner_module)
+    if runner_module == "docker":
+        module.BACKEND = recorded["backend"]
+        module.INPUT_MODE = recorded.get("input_mode")
+        module.OUTPUT_MODE = recorded.get("output_mode")
+    else:
+        module.RUNNER = recorded["runner"]
+        module.BIND_MODE = recorded["bind_mode"]
+
+
+def save(path, runner_module, subcommand, run_args, plan, resolver):
+    """write plan (bindit.RunPlan, planned from run_args with resolver) to path (- for
+    stdout). runner_module is docker or singularity, and subcommand the runner
+    subcommand (run for docker, exec or run for singularity). Files are replaced
+    atomically, so tasks that apply the plan never see a partial file."""
+    cwd = os.getcwd()
+    for source in plan.new_binds:
+        # make sure the directories to bind are dependencies too
+        resolver.is_dir(source)
+    depends = dependencies(resolver, cwd)
+    text = json.dumps(
+        {
+            "bindit_version": bindit.__version__,
+            "plan_version": PLAN_VERSION,
+            "runner_module": runner_module,
+            "subcommand": subcommand,
+            "cwd": cwd,
+            "args": [str(arg) for arg in run_args],
+            "settings": settings(runner_module),
+            "plan": plan_to_dict(plan),
+            "dependencies": depends,
+        },
+        separators=(",", ":"),
+    )
+    if path == "-":
+        sys.stdout.write(text + "\n")
+        return
+    path = pathlib.Path(path)
+    handle, temp_path = tempfile.mkstemp(
+        dir=path.parent, prefix=f".{path.name}.", suffix=".tmp"
+    )
+    try:
+        with os.fdopen(handle, "w") as file_handle:
+            file_handle.write(text + "\n")
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+    bindit.LOGGER.info(
+        f"wrote plan with {len(plan.new_binds)} new binds and "
+        f"{len(depends)} dependencies to {path}"
+    )
+
+
+def load(path):
+    """return the plan file record (dict) at path (- for stdin)."""
+    if path == "-":
+        record = json.load(sys.stdin)
+    else:
+        with open(path, "r") as file_handle:
+            record = json.load(file_handle)
+    if record.get("plan_version") != PLAN_VERSION:
+        raise ValueError(
+            f"unsupported plan version {record.get('plan_version')} in {path} "
+            f"(expected {PLAN_VERSION}, re-run bindit plan)"
+        )
+    return record
+
+
+def check(record, strict=False):
+    """return the bindit.RunPlan in the plan file record if its dependencies still hold.
+    Otherwise, raise ValueError if strict, or re-plan from the recorded arguments (with
+    the recorded settings, see restore_settings)."""
+    problem = None
+    if os.getcwd() != record["cwd"]:
+        problem = f"working directory is not {record['cwd']}"
+    else:
+        with bindit.timings.phase("check_plan"):
+            changed = changed_dependency(record["dependencies"])
+        if changed is not None:
+            problem = f"{changed[0]} changed (planned as {changed[1]})"
+    if problem is None:
+        return plan_from_dict(record["plan"])
+    if strict:
+        raise ValueError(f"plan is out of date: {problem}")
+    bindit.LOGGER.warning(f"plan is out of date, re-planning: {problem}")
+    module = runner(record["runner_module"])
+    if record["runner_module"] == "docker":
+        return module.plan_run(record["args"])
+    return module.plan_run(record["subcommand"], record["args"])
+
+
+def apply(path, strict=False):
+    """load the plan file at path, check it (see check), write the final command to
+    stdout and launch it (if not DRY_RUN, and with EXEC). The settings recorded in the
+    plan replace the current ones. Returns the exit code."""
+    with bindit.timings.phase("load_plan"):
+        record = load(path)
+    restore_settings(record["runner_module"], record["settings"])
+    plan = check(record, strict=strict)
+    # only copies from re-planning, not those the plan file refers to
+    rebased_lists = bindit.take_rebased_lists()
+    sys.stdout.write(plan.command_line() + "\n")
+    if bindit.DRY_RUN:
+        return 0
+    sys.stdout.flush()
+    try:
+        return runner(record["runner_module"]).launch(plan, exec_=bindit.EXEC)
+    finally:
+        bindit.remove_rebased_lists(rebased_lists)
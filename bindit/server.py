@@ -0,0 +1,166 @@
+"""bindit daemon. Keeps the docker CLI schema, ignore path index, path resolution
+cache and argument cache warm, and plans docker run commands for clients (see
+bindit.client) over a Unix socket. Requests and responses are one JSON object per
+line."""
+import os
+import stat
+import pathlib
+import socketserver
+import json
+import bindit
+import bindit.docker
+
+
+class ValidatingPathResolver(bindit.PathResolver):
+    """PathResolver for long-running processes. Entries are keyed on the working
+    directory as well as the path, and are discarded when the modification time of the
+    (unresolved) parent directory changes, which catches paths that are created,
+    removed, renamed or replaced by symlinks (subject to the timestamp granularity of
+    the file system). Changes further up the tree (e.g. a parent directory that is
+    replaced by a symlink) are not detected. Call begin_request at the start of each
+    request; within a request, each parent directory is stat'ed at most once."""
+
+    # drop all entries when the cache grows beyond this many paths
+    MAX_ENTRIES = 100000
+
+    def __init__(self):
+        super().__init__()
+        self._cwd = os.getcwd()
+        self._stamps = {}
+
+    def begin_request(self):
+        """start a new request (picks up the current working directory, and re-checks
+        parent directory modification times)."""
+        self._cwd = os.getcwd()
+        self._stamps = {}
+        if len(self._resolved) + len(self._stat) > self.MAX_ENTRIES:
+            self._resolved = {}
+            self._stat = {}
+
+    def _stamp(self, path):
+        """return the modification time of the parent directory of path."""
+        parent = os.path.dirname(os.path.join(self._cwd, path))
+        try:
+            return self._stamps[parent]
+        except KeyError:
+            pass
+        try:
+            stamp = os.stat(parent).st_mtime_ns
+        except OSError:
+            stamp = None
+        self._stamps[parent] = stamp
+        return stamp
+
+    def resolve(self, path):
+        self.counts["resolve"] += 1
+        path = pathlib.Path(path)
+        key = (self._cwd, path)
+        stamp = self._stamp(path)
+        entry = self._resolved.get(key)
+        if entry is not None and entry[1] == stamp:
+            return entry[0]
+        self.counts["realpath"] += 1
+        resolved = pathlib.Path(os.path.realpath(path))
+        self._resolved[key] = (resolved, stamp)
+        return resolved
+
+    def stat(self, path):
+        self.counts["stat"] += 1
+        resolved = self.resolve(path)
+        stamp = self._stamp(resolved)
+        entry = self._stat.get(resolved)
+        if entry is not None and entry[1] == stamp:
+            return entry[0]
+        self.counts["os_stat"] += 1
+        try:
+            result = os.stat(resolved)
+        except (OSError, ValueError):
+            result = None
+        self._stat[resolved] = (result, stamp)
+        return result
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    """handles one client connection, which may send several requests."""
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line.decode("utf-8"))
+                response = self.server.plan(request)
+            except ValueError as err:
+                response = {"error": f"bad request: {err}"}
+            self.wfile.write((json.dumps(response) + "\n").encode("utf-8"))
+
+
+class PlanServer(socketserver.UnixStreamServer):
+    """Unix socket server that plans docker run commands. Requests are handled one at a
+    time, since planning changes into the client's working directory."""
+
+    def __init__(self, socket_path):
+        self.socket_path = socket_path
+        self.bound = False
+        try:
+            is_socket = stat.S_ISSOCK(os.lstat(socket_path).st_mode)
+        except FileNotFoundError:
+            is_socket = False
+        if is_socket:
+            # left behind by a daemon that did not shut down cleanly (anything else is
+            # left alone, and binding fails)
+            os.unlink(socket_path)
+        super().__init__(socket_path, RequestHandler)
+        self.resolver = ValidatingPathResolver()
+        self.ignore_index = bindit.PathTrie(bindit.IGNORE_PATH)
+        self.arg_cache = bindit.ArgCache()
+        # warm up the docker CLI schema
+        bindit.docker.docker_cli()
+
+    def plan(self, request):
+        """return a response dict for a request dict with runner, args and cwd."""
+        if request.get("runner") != "docker":
+            return {"error": f"unsupported runner: {request.get('runner')}"}
+        old_cwd = os.getcwd()
+        try:
+            os.chdir(request["cwd"])
+            self.resolver.begin_request()
+            plan = bindit.docker.plan_run(
+                request["args"],
+                resolver=self.resolver,
+                ignore_index=self.ignore_index,
+                arg_cache=self.arg_cache,
+            )
+            # the client launches the container, so rebased path lists are kept (see
+            # bindit.cache.clear)
+            bindit.take_rebased_lists()
+            bindit.LOGGER.debug(f"argument cache: {dict(self.arg_cache.counts)}")
+            return {"command": [str(arg) for arg in plan.command()]}
+        except Exception as err:
+            bindit.LOGGER.exception("planning failed")
+            return {"error": f"{type(err).__name__}: {err}"}
+        finally:
+            os.chdir(old_cwd)
+
+    def server_bind(self):
+        super().server_bind()
+        self.bound = True
+
+    def server_close(self):
+        super().server_close()
+        if not self.bound:
+            # binding failed, so the path is not ours to remove
+            return
+        try:
+            os.unlink(self.socket_path)
+        except FileNotFoundError:
+            pass
+
+
+def serve(socket_path):
+    """run a PlanServer on socket_path until interrupted."""
+    with PlanServer(socket_path) as server:
+        bindit.LOGGER.info(f"bindit daemon listening on {socket_path}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    return 0
@@ -1,11 +1,16 @@
 """shell interface routines."""
+import os
 import sys
 import subprocess
 import shlex
 
 
-def run(*arg, interactive=False):
-    """subprocess.run wrapper to handle exceptions, writing to stdout/stderr or not."""
+def run(*arg, interactive=False, check=True, env=None):
+    """subprocess.run wrapper to handle exceptions, writing to stdout/stderr or not. If
+    check, a non-zero exit code exits Python with the same code. env is an optional dict
+    of environment variables to add for the command."""
+    if env:
+        env = dict(os.environ, **env)
     stdout = subprocess.PIPE
     stderr = subprocess.PIPE
     if interactive:
@@ -13,7 +18,13 @@ def run(*arg, interactive=False):
         stderr = None
     try:
         ret = subprocess.run(
-            arg, stdout=stdout, stderr=stderr, check=True, shell=False, encoding="utf-8"
+            arg,
+            stdout=stdout,
+            stderr=stderr,
+            check=check,
+            shell=False,
+            encoding="utf-8",
+            env=env,
         )
     except subprocess.CalledProcessError as ret:
         print(f"command line exception with args: {arg}")
@@ -26,6 +37,19 @@ def run(*arg, interactive=False):
     return ret
 
 
+def execute(*arg, env=None):
+    """replace the current process with the command in arg (os.execvp), so that exit
+    codes and signals pass straight through to it. env is an optional dict of
+    environment variables to add for the command. Does not return."""
+    # exec discards anything still sitting in Python's buffers
+    sys.stdout.flush()
+    sys.stderr.flush()
+    arg = [str(this_arg) for this_arg in arg]
+    if env:
+        os.execvpe(arg[0], arg, dict(os.environ, **env))
+    os.execvp(arg[0], arg)
+
+
 def join_and_quote(arg_list):
     """return a string of appropriately quoted and escaped arguments from list."""
     # need to cast to str because join chokes on pathlib.Path as of python 3.6
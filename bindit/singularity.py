@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import shutil
+import functools
+import pathlib
+import click
+import bindit
+import bindit.shell
+import bindit.docker
+
+"""singularity/apptainer-specific interface for bindit."""
+
+# container runner binary: "apptainer" or "singularity" (None to pick whichever is on
+# path, preferring apptainer)
+RUNNER = None
+# how new binds are passed: "arg" (a single --bind list), "env" (the runner's bind path
+# environment variable) or "auto" (env if the bind list is longer than
+# BIND_ENV_THRESHOLD characters)
+BIND_MODE = "auto"
+BIND_ENV_THRESHOLD = 4096
+BIND_ENV = {"apptainer": "APPTAINER_BIND", "singularity": "SINGULARITY_BINDPATH"}
+
+
+def runner():
+    """return the container runner binary name (see RUNNER)."""
+    if RUNNER:
+        return RUNNER
+    if shutil.which("apptainer") is None and shutil.which("singularity") is not None:
+        return "singularity"
+    return "apptainer"
+
+
+@functools.lru_cache(maxsize=None)
+def singularity_cli(runner_name, subcommand):
+    """return memoized (valid_args, valid_letters) for runner_name subcommand (e.g.,
+    apptainer exec), parsed from its --help output (which has the same format as docker
+    run --help, see bindit.docker.parse_docker_help) and cached on disk (see
+    bindit.cache)."""
+    import bindit.cache
+
+    binary = shutil.which(runner_name)
+    if binary is None:
+        bindit.LOGGER.warning(
+            f"WARNING: {runner_name} not on path, functionality will be limited."
+        )
+        return {}, set()
+    binary = pathlib.Path(binary).resolve()
+    key = {
+        "binary": str(binary),
+        "mtime_ns": os.stat(binary).st_mtime_ns,
+        "version": bindit.shell.run(str(binary), "--version").stdout.strip(),
+        "subcommand": subcommand,
+    }
+    cached = bindit.cache.load("singularity_cli", key)
+    if cached is not None:
+        return cached["args"], set(cached["letters"])
+    ret = bindit.shell.run(str(binary), subcommand, "--help")
+    valid_args, letters = bindit.docker.parse_docker_help(ret.stdout)
+    if valid_args:
+        bindit.cache.store(
+            "singularity_cli", key, {"args": valid_args, "letters": sorted(letters)}
+        )
+    return valid_args, letters
+
+
+def parse_bind_list(bind_arg, resolver=None):
+    """unpack a bind list bind_arg (e.g., /foo:/bar,/baz:/qux:ro,/data) to dict where the
+    key is a resolved pathlib.Path and the value is an unresolved (in-container)
+    pathlib.PosixPath. Binds without a destination are mounted at the source path."""
+    if resolver is None:
+        resolver = bindit.PathResolver()
+    binds = {}
+    for spec in bind_arg.split(","):
+        if not spec:
+            continue
+        # up to three fields (src[:dest[:opts]]), but we only want the first two
+        fields = spec.split(":")
+        assert len(fields) < 4, "unexpected number of bind_arg fields"
+        dest = fields[1] if len(fields) > 1 else fields[0]
+        binds[resolver.resolve(fields[0])] = pathlib.PosixPath(dest)
+    return binds
+
+
+def bind_list(new_binds):
+    """return new_binds as a single comma-separated src:dest bind list."""
+    return ",".join(f"{source}:{dest}" for source, dest in new_binds.items())
+
+
+BIND_PARSER = {
+    "-B": parse_bind_list,
+    "--bind": parse_bind_list,
+    "--mount": bindit.docker.parse_bind_mount,
+}
+
+
+def plan_run(
+    subcommand, run_args, resolver=None, ignore_index=None, arg_cache=None
+):
+    """plan a singularity/apptainer invocation (e.g., subcommand exec): parse run_args,
+    detect paths in the image arguments and rebase them onto new bind mounts as
+    necessary. New binds are coalesced into a single --bind list, or passed through the
+    runner's bind path environment variable (see BIND_MODE).
+
+    Args:
+        subcommand (str): runner subcommand (exec or run)
+        run_args (sequence): arguments to the subcommand (runner arguments, image and
+            image arguments)
+        resolver (bindit.PathResolver): memoizes file system queries (default new
+            instance)
+        ignore_index (bindit.PathTrie): index of paths to ignore (default built from
+            bindit.IGNORE_PATH)
+        arg_cache (bindit.ArgCache): memoizes the paths in image arguments across
+            calls (default None, no memo)
+
+    Returns:
+        bindit.RunPlan: the planned invocation
+
+    """
+    if resolver is None:
+        resolver = bindit.PathResolver()
+    runner_name = runner()
+    args_iter = bindit.arg_pairs(run_args)
+    with bindit.timings.phase("infer_singularity_cli"):
+        valid_args, valid_letters = singularity_cli(runner_name, subcommand)
+    with bindit.timings.phase("parse_container_args", resolver=resolver):
+        container_args, manual_binds, container_name = bindit.parse_container_args(
+            args_iter,
+            bind_parser=BIND_PARSER,
+            valid_args=valid_args,
+            valid_letters=valid_letters,
+            resolver=resolver,
+        )
+    with bindit.timings.phase(
+        "parse_image_args", resolver=resolver, arg_cache=arg_cache
+    ):
+        image_args, new_binds = bindit.parse_image_args(
+            args_iter,
+            manual_binds,
+            resolver=resolver,
+            ignore_index=ignore_index,
+            arg_cache=arg_cache,
+        )
+    bind_args = []
+    env = None
+    binds = bind_list(new_binds)
+    if binds:
+        use_env = BIND_MODE == "env" or (
+            BIND_MODE == "auto" and len(binds) > BIND_ENV_THRESHOLD
+        )
+        if use_env:
+            env_name = BIND_ENV.get(runner_name, "APPTAINER_BIND")
+            # add to (rather than replace) any binds the user already set
+            existing = os.environ.get(env_name)
+            env = {env_name: f"{existing},{binds}" if existing else binds}
+        else:
+            bind_args = ["--bind", binds]
+    return bindit.RunPlan(
+        runner=[runner_name, subcommand],
+        container_args=container_args,
+        bind_args=bind_args,
+        container_name=container_name,
+        image_args=image_args,
+        manual_binds=manual_binds,
+        new_binds=new_binds,
+        env=env,
+    )
+
+
+def launch(plan, exec_=False):
+    """run a planned singularity/apptainer invocation (bindit.RunPlan). If exec_, the
+    current process is replaced with the runner. Returns the exit code."""
+    if exec_:
+        # hand the process over to the runner (does not return, so no exit handlers run)
+        bindit.timings.write()
+        bindit.shell.execute(*plan.command(), env=plan.env)
+    with bindit.timings.phase("launch"):
+        ret = bindit.shell.run(*plan.command(), interactive=True, env=plan.env)
+    return ret.returncode
+
+
+def run_subcommand(subcommand, run_args):
+    """plan and (if not DRY_RUN) run a singularity/apptainer subcommand. If
+    PLAN_OUTPUT, the plan is saved there instead (see bindit.planfile)."""
+    resolver = bindit.PathResolver()
+    try:
+        plan = plan_run(subcommand, run_args, resolver=resolver)
+    except bindit.UnsafeBindError as err:
+        raise click.ClickException(str(err))
+    rebased_lists = bindit.take_rebased_lists()
+    if bindit.PLAN_OUTPUT is not None:
+        from bindit import planfile
+
+        planfile.save(
+            bindit.PLAN_OUTPUT, "singularity", subcommand, run_args, plan, resolver
+        )
+        return 0
+    sys.stdout.write(plan.command_line() + "\n")
+    if bindit.DRY_RUN:
+        return 0
+    sys.stdout.flush()
+    try:
+        return launch(plan, exec_=bindit.EXEC)
+    finally:
+        # the container has exited (or, with exec_, this never runs)
+        bindit.remove_rebased_lists(rebased_lists)
+
+
+@click.command(name="exec", context_settings=dict(ignore_unknown_options=True))
+@click.argument("run_args", nargs=-1, required=True, type=click.UNPROCESSED)
+def exec_(run_args):
+    """run a command in a container (singularity/apptainer exec), adding binds as
+    necessary (and not running it if DRY_RUN)."""
+    return run_subcommand("exec", run_args)
+
+
+@click.command(context_settings=dict(ignore_unknown_options=True))
+@click.argument("run_args", nargs=-1, required=True, type=click.UNPROCESSED)
+def run(run_args):
+    """run a container's runscript (singularity/apptainer run), adding binds as
+    necessary (and not running it if DRY_RUN)."""
+    return run_subcommand("run", run_args)
+
+
+@click.group()
+@click.option(
+    "-r",
+    "--runner",
+    "runner_name",
+    type=click.Choice(["apptainer", "singularity"]),
+    default=None,
+    help="Container runner binary (default apptainer if on path, else singularity)",
+)
+@click.option(
+    "--bind-mode",
+    type=click.Choice(["auto", "arg", "env"]),
+    default="auto",
+    show_default=True,
+    help=f"Pass new binds as a single --bind list (arg), through APPTAINER_BIND or \
+        SINGULARITY_BINDPATH (env), or through the environment only when the list is \
+        longer than {BIND_ENV_THRESHOLD} characters (auto)",
+)
+def singularity(runner_name, bind_mode):
+    global RUNNER, BIND_MODE
+    RUNNER = runner_name
+    BIND_MODE = bind_mode
+
+
+singularity.add_command(exec_)
+singularity.add_command(run)
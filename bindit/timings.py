@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+import sys
+import json
+import time
+import atexit
+import threading
+import contextlib
+
+"""Per-phase wall-clock timings and counters for bindit invocations (see bindit
+--timings). Phases are recorded with the phase context manager, which does nothing
+unless timings are enabled. Imported first by the bindit package, so that the import
+phase covers importing bindit and everything after it (but not interpreter start)."""
+
+IMPORT_START = time.perf_counter()
+# None when disabled, otherwise the output file path ("-" for stderr)
+OUTPUT = None
+# phase name -> dict with seconds, calls and any counters
+PHASES = {}
+_LOCK = threading.Lock()
+_WRITTEN = False
+
+
+def enable(output="-"):
+    """start recording phases, and write them as JSON to output (file path, or - for
+    stderr) when the process exits (or when write is called explicitly, e.g. before
+    replacing the process with the container runner). The import phase runs from the
+    start of the bindit import until this call."""
+    global OUTPUT
+    OUTPUT = output
+    PHASES["import"] = {"seconds": time.perf_counter() - IMPORT_START, "calls": 1}
+    atexit.register(write)
+
+
+@contextlib.contextmanager
+def phase(name, resolver=None, arg_cache=None):
+    """record the duration of the with block under name. Durations and call counts add
+    up over repeated calls. If resolver (bindit.PathResolver) or arg_cache
+    (bindit.ArgCache) are provided, the increase in their counters is recorded too
+    (arg_cache counters with an arg_cache_ prefix)."""
+    if OUTPUT is None:
+        yield
+        return
+    counters = {}
+    if resolver is not None:
+        counters[""] = resolver.counts
+    if arg_cache is not None:
+        counters["arg_cache_"] = arg_cache.counts
+    before = {prefix: dict(counts) for prefix, counts in counters.items()}
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        with _LOCK:
+            record = PHASES.setdefault(name, {"seconds": 0.0, "calls": 0})
+            record["seconds"] += seconds
+            record["calls"] += 1
+            for prefix, counts in counters.items():
+                for key, value in counts.items():
+                    key_before = before[prefix].get(key, 0)
+                    key = prefix + key
+                    record[key] = record.get(key, 0) + value - key_before
+
+
+def report():
+    """return the recorded phases and total time as a dict."""
+    with _LOCK:
+        return {
+            "phases": {name: dict(record) for name, record in PHASES.items()},
+            "total_seconds": time.perf_counter() - IMPORT_START,
+        }
+
+
+def write():
+    """write the report as JSON to OUTPUT (only once, and only if enabled)."""
+    global _WRITTEN
+    if OUTPUT is None or _WRITTEN:
+        return
+    _WRITTEN = True
+    text = json.dumps(report(), indent=2) + "\n"
+    if OUTPUT == "-":
+        sys.stderr.write(text)
+        sys.stderr.flush()
+    else:
+        with open(OUTPUT, "w") as file_handle:
+            file_handle.write(text)
@@ -31,12 +31,14 @@ setup(
         "Programming Language :: Python :: 3.7",
     ],
     description="Takes the drudgery out of bind-mounting volumes on Docker and Singularity",
-    entry_points={"console_scripts": ["bindit=bindit.cli:main",
-        "bindit_partial=bindit.partial:main"]},
+    entry_points={"console_scripts": ["bindit=bindit.fast:main",
+        "bindit_partial=bindit.partial:main",
+        "bindit_client=bindit.client:main"]},
     install_requires=requirements,
     license="MIT license",
     long_description=readme + "\n\n" + history,
     include_package_data=True,
+    package_data={"bindit": ["data/*.json"]},
     keywords="bindit",
     name="bindit",
     packages=find_packages(include=["bindit"]),
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+"""shared fixtures for `bindit` tests."""
+import os
+import pytest
+
+# stub docker that echoes its arguments, and fails with exit code 4 for commands that
+# contain 'fail'
+ECHO_DOCKER = 'echo "ran $*"\ncase "$*" in *fail*) exit 4;; esac'
+
+
+@pytest.fixture
+def fake_docker(tmp_path, monkeypatch):
+    """factory that puts a stub docker executable that runs the shell script body
+    (default ECHO_DOCKER) first on PATH, and returns its path."""
+    bin_dir = tmp_path / "bin"
+
+    def make(body=ECHO_DOCKER):
+        bin_dir.mkdir(exist_ok=True)
+        path = bin_dir / "docker"
+        path.write_text(f"#!/bin/sh\n{body}\n")
+        path.chmod(0o755)
+        monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+        return path
+
+    return make
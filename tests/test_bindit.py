@@ -1,8 +1,13 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 """tests for main `bindit` package."""
+import os
+import shlex
+import functools
 import pathlib
 import tempfile
+import pytest
+import hypothesis
 import bindit
 
 TEMPFILE_PREFIX = f"bindit_{__name__}_"
@@ -52,3 +57,446 @@ def test_arg_to_file_paths():
             assert t[0] == pathlib.Path(sourcedir)
             assert t[1] == pathlib.Path("/invalid/path")
             assert t[2] == pathlib.Path(sourcedir2)
+
+
+def test_path_resolver_memoizes(monkeypatch):
+    with tempfile.TemporaryDirectory(prefix=TEMPFILE_PREFIX) as sourcedir:
+        sourcefile = pathlib.Path(tempfile.mkstemp(dir=sourcedir)[1])
+        calls = []
+        real_stat = bindit.os.stat
+
+        def counting_stat(path, *arg, **kwarg):
+            calls.append(pathlib.Path(path))
+            return real_stat(path, *arg, **kwarg)
+
+        monkeypatch.setattr(bindit.os, "stat", counting_stat)
+        resolver = bindit.PathResolver()
+        image_args, new_binds = bindit.parse_image_args(
+            bindit.arg_pairs([str(sourcefile), f"--in={sourcefile}", sourcedir]),
+            {},
+            resolver=resolver,
+        )
+        assert resolver.exists(sourcefile)
+        assert not resolver.is_dir(sourcefile)
+        assert resolver.is_dir(sourcedir)
+        # each distinct path stat'ed at most once
+        assert len(calls) == len(set(calls))
+        assert list(new_binds) == [pathlib.Path(sourcedir).resolve()]
+
+
+def test_path_trie_longest_prefix():
+    index = bindit.PathTrie()
+    index.add("/a", "shallow")
+    index.add("/a/b/c", "deep")
+    assert len(index) == 2
+    assert index.longest_prefix("/a") == (pathlib.Path("/a"), "shallow")
+    assert index.longest_prefix("/a/b") == (pathlib.Path("/a"), "shallow")
+    assert index.longest_prefix("/a/b/c/d") == (pathlib.Path("/a/b/c"), "deep")
+    # no partial component matches
+    assert index.longest_prefix("/ab") is None
+    assert index.longest_prefix("/") is None
+
+
+def test_arg_to_file_paths_ignore_index():
+    with tempfile.TemporaryDirectory(prefix=TEMPFILE_PREFIX) as sourcedir:
+        ignore_index = bindit.PathTrie([pathlib.Path(sourcedir).resolve()])
+        t = list(
+            bindit.arg_to_file_paths(
+                f"{sourcedir}/file,/not/ignored", ignore_index=ignore_index
+            )
+        )
+        assert t == [pathlib.Path("/not/ignored")]
+
+
+def remove_redundant_binds_reference(binds):
+    """the original quadratic implementation of remove_redundant_binds."""
+    sources = set(binds.keys())
+    for candidate in sources:
+        remaining = sources ^ set([candidate])
+        if any([test in candidate.parents for test in remaining]):
+            del binds[candidate]
+    return
+
+
+@hypothesis.given(
+    hypothesis.strategies.lists(
+        hypothesis.strategies.lists(
+            hypothesis.strategies.sampled_from(["a", "b", "ab", "a.b"]), max_size=5
+        ),
+        max_size=30,
+    )
+)
+def test_remove_redundant_binds_matches_reference(path_parts):
+    binds = {pathlib.Path("/", *parts): None for parts in path_parts}
+    expected = binds.copy()
+    remove_redundant_binds_reference(expected)
+    bindit.remove_redundant_binds(binds)
+    assert binds == expected
+
+
+def test_remove_redundant_binds_inconsistent_destination():
+    binds = {
+        pathlib.Path("/a"): pathlib.Path("/bindit/a"),
+        pathlib.Path("/a/b"): pathlib.Path("/a/b"),
+        pathlib.Path("/a/c"): pathlib.Path("/bindit/a/c"),
+    }
+    bindit.remove_redundant_binds(binds)
+    assert binds == {
+        pathlib.Path("/a"): pathlib.Path("/bindit/a"),
+        pathlib.Path("/a/b"): pathlib.Path("/a/b"),
+    }
+
+
+def test_parse_container_args_bind_parsers():
+    """test that custom bind parsers only get a resolver if they take one."""
+    resolver = bindit.PathResolver()
+    received = {}
+
+    def single(bind_arg):
+        return {pathlib.Path(bind_arg): pathlib.Path("/single")}
+
+    def with_resolver(bind_arg, resolver=None):
+        received["resolver"] = resolver
+        return {pathlib.Path(bind_arg): pathlib.Path("/resolver")}
+
+    def with_kwargs(bind_arg, **kwargs):
+        received["kwargs"] = kwargs
+        return {pathlib.Path(bind_arg): pathlib.Path("/kwargs")}
+
+    _, manual_binds, container_name = bindit.parse_container_args(
+        bindit.arg_pairs(["-a", "/a", "-b", "/b", "-c", "/c", "image", "ls"]),
+        bind_parser={"-a": single, "-b": with_resolver, "-c": with_kwargs},
+        valid_args={"-a": str, "-b": str, "-c": str},
+        resolver=resolver,
+    )
+    assert container_name == "image"
+    assert manual_binds == {
+        pathlib.Path("/a"): pathlib.Path("/single"),
+        pathlib.Path("/b"): pathlib.Path("/resolver"),
+        pathlib.Path("/c"): pathlib.Path("/kwargs"),
+    }
+    assert received == {"resolver": resolver, "kwargs": {"resolver": resolver}}
+    # other callables are inspected
+    assert not bindit.accepts_resolver(dict)
+    assert bindit.accepts_resolver(functools.partial(with_resolver))
+
+
+def scan_lists_setup(sourcedir):
+    """write a path list with two listed files in sub-directories of sourcedir, and
+    return its path."""
+    sourcedir = pathlib.Path(sourcedir).resolve()
+    for name in ["x", "y"]:
+        (sourcedir / name).mkdir()
+        (sourcedir / name / "file.dat").write_text("")
+    list_path = sourcedir / "inputs.txt"
+    list_path.write_text(
+        f"{sourcedir}/x/file.dat\n--weight=2,{sourcedir}/y/file.dat\nno path 'here\n"
+    )
+    return list_path
+
+
+def test_scan_path_list_identity(monkeypatch):
+    monkeypatch.setattr(bindit, "SCAN_LISTS", ["*.txt"])
+    monkeypatch.setattr(bindit, "REBASE_LISTS", False)
+    with tempfile.TemporaryDirectory(prefix=TEMPFILE_PREFIX) as sourcedir:
+        monkeypatch.setenv("BINDIT_CACHE_DIR", str(pathlib.Path(sourcedir) / "cache"))
+        list_path = scan_lists_setup(sourcedir)
+        image_args, new_binds = bindit.parse_image_args(
+            bindit.arg_pairs(["--filelist", str(list_path)]), {}
+        )
+        parent = list_path.parent
+        # the listed directories are bound at their host paths
+        assert new_binds[parent / "x"] == parent / "x"
+        assert new_binds[parent / "y"] == parent / "y"
+        # and the list itself as usual
+        assert new_binds[parent] == pathlib.Path("/bindit") / parent.relative_to("/")
+        assert image_args == ["--filelist", str(new_binds[parent] / "inputs.txt")]
+        assert not (pathlib.Path(sourcedir) / "cache").exists()
+
+
+def scan_rebased_list(list_path):
+    """scan the path list list_path, and return the image arguments, the new binds and
+    the host path of the rebased copy."""
+    image_args, new_binds = bindit.parse_image_args(
+        bindit.arg_pairs(["--filelist", str(list_path)]), {}
+    )
+    container_path = pathlib.Path(image_args[1])
+    rebased = next(
+        source / container_path.name
+        for source, dest in new_binds.items()
+        if dest == container_path.parent
+    )
+    return image_args, new_binds, rebased
+
+
+def test_scan_path_list_rebase(monkeypatch):
+    monkeypatch.setattr(bindit, "SCAN_LISTS", ["*.txt"])
+    monkeypatch.setattr(bindit, "REBASE_LISTS", True)
+    monkeypatch.setattr(bindit, "REBASED_LISTS", [])
+    with tempfile.TemporaryDirectory(prefix=TEMPFILE_PREFIX) as sourcedir:
+        cache_dir = pathlib.Path(sourcedir).resolve() / "cache"
+        monkeypatch.setenv("BINDIT_CACHE_DIR", str(cache_dir))
+        list_path = scan_lists_setup(sourcedir)
+        image_args, new_binds, rebased = scan_rebased_list(list_path)
+        parent = list_path.parent
+        new_parent = pathlib.Path("/bindit") / parent.relative_to("/")
+        # the listed directories and the rebased copy in the cache are bound under
+        # /bindit
+        assert new_binds == {
+            path: pathlib.Path("/bindit") / path.relative_to("/")
+            for path in [parent / "x", parent / "y", cache_dir / "lists"]
+        }
+        assert rebased.parent == cache_dir / "lists"
+        assert rebased.name.startswith("inputs.")
+        assert rebased.name.endswith(".bindit.txt")
+        assert rebased.read_text() == (
+            f"{new_parent}/x/file.dat\n--weight=2,{new_parent}/y/file.dat\n"
+            "no path 'here\n"
+        )
+        # the original is untouched, and there are no temporary files left over
+        assert sorted(p.name for p in parent.iterdir()) == [
+            "cache",
+            "inputs.txt",
+            "x",
+            "y",
+        ]
+        assert list(rebased.parent.iterdir()) == [rebased]
+        # a second scan of the same list writes a new copy
+        _, _, rebased_again = scan_rebased_list(list_path)
+        assert rebased_again != rebased
+        assert rebased_again.read_text() == rebased.read_text()
+        # the copies are removed once their containers have exited
+        assert bindit.take_rebased_lists() == [rebased, rebased_again]
+        assert bindit.take_rebased_lists() == []
+        bindit.remove_rebased_lists([rebased, rebased_again])
+        assert not list(rebased.parent.iterdir())
+
+
+def test_scan_path_list_rebase_dryrun(monkeypatch, caplog):
+    monkeypatch.setattr(bindit, "SCAN_LISTS", ["*.txt"])
+    monkeypatch.setattr(bindit, "REBASE_LISTS", True)
+    monkeypatch.setattr(bindit, "DRY_RUN", True)
+    with tempfile.TemporaryDirectory(prefix=TEMPFILE_PREFIX) as sourcedir:
+        cache_dir = pathlib.Path(sourcedir).resolve() / "cache"
+        monkeypatch.setenv("BINDIT_CACHE_DIR", str(cache_dir))
+        list_path = scan_lists_setup(sourcedir)
+        image_args, new_binds = bindit.parse_image_args(
+            bindit.arg_pairs(["--filelist", str(list_path)]), {}
+        )
+        # the listed directories are still rebased, but nothing is written
+        x_dir = list_path.parent / "x"
+        assert new_binds[x_dir] == pathlib.Path("/bindit") / x_dir.relative_to("/")
+        assert image_args[1].endswith(".bindit.txt")
+        assert not cache_dir.exists()
+        # so the command can't be run later
+        assert "refers to a file that does not exist" in caplog.text
+
+
+def test_scan_path_list_system_paths(monkeypatch):
+    monkeypatch.setattr(bindit, "SCAN_LISTS", ["*.txt"])
+    with tempfile.TemporaryDirectory(prefix=TEMPFILE_PREFIX) as sourcedir:
+        list_path = scan_lists_setup(sourcedir)
+        with open(list_path, "a") as file_handle:
+            file_handle.write("/x\n/etc/hosts\n")
+        args = ["--filelist", str(list_path)]
+        # binding / or /etc at their host paths would shadow the container's own
+        monkeypatch.setattr(bindit, "REBASE_LISTS", False)
+        with pytest.raises(bindit.UnsafeBindError, match="can't bind /"):
+            bindit.parse_image_args(bindit.arg_pairs(args), {})
+        # so lists are rebased by default
+        monkeypatch.setattr(bindit, "REBASE_LISTS", True)
+        _, new_binds = bindit.parse_image_args(bindit.arg_pairs(args), {})
+        assert new_binds == {pathlib.Path("/"): pathlib.PosixPath("/bindit")}
+
+
+def test_scan_path_list_no_match():
+    with tempfile.TemporaryDirectory(prefix=TEMPFILE_PREFIX) as sourcedir:
+        list_path = scan_lists_setup(sourcedir)
+        image_args, new_binds = bindit.parse_image_args(
+            bindit.arg_pairs([str(list_path)]), {}
+        )
+        assert list(new_binds) == [list_path.parent]
+
+
+@hypothesis.given(
+    hypothesis.strategies.text(alphabet="ab '\"\\\t=,:", max_size=12)
+)
+def test_shell_tokens_matches_shlex(arg):
+    try:
+        expected = shlex.split(arg)
+    except ValueError as err:
+        with pytest.raises(ValueError, match=str(err)):
+            list(bindit.shell_tokens(arg))
+        return
+    tokens = list(bindit.shell_tokens(arg))
+    assert [token for token, _ in tokens] == expected
+    for token, positions in tokens:
+        assert "".join(arg[ind] for ind in positions) == token
+
+
+def test_rebase_arg_substring_paths():
+    # /data/a is a substring of /data/ab, and of the differently spelled /data//a
+    in_arg = "--in=/data/ab,/data/a:/data//a"
+    new_binds = {}
+    out_arg = bindit.rebase_arg(in_arg, bindit.PathTrie(), new_binds)
+    assert out_arg == "--in=/bindit/data/ab,/bindit/data/a:/bindit/data/a"
+    assert new_binds == {pathlib.Path("/data"): pathlib.Path("/bindit/data")}
+
+
+def test_rebase_arg_trailing_slash():
+    index = bindit.PathTrie()
+    # rsync and cp treat src/ and src differently
+    assert bindit.rebase_arg("/data/src/", index, {}) == "/bindit/data/src/"
+    assert bindit.rebase_arg("--in=/data/src/", index, {}) == "--in=/bindit/data/src/"
+    assert bindit.rebase_arg("/data/src", index, {}) == "/bindit/data/src"
+    # and for directories that exist
+    with tempfile.TemporaryDirectory(prefix=TEMPFILE_PREFIX) as sourcedir:
+        sourcedir = pathlib.Path(sourcedir).resolve()
+        assert bindit.rebase_arg(f"{sourcedir}/", index, {}) == f"/bindit{sourcedir}/"
+
+
+def test_rebase_arg_quoted_paths():
+    index = bindit.PathTrie()
+    # quotes around the path stay
+    assert bindit.rebase_arg('"/my data/a"', index, {}) == '"/bindit/my data/a"'
+    # quotes inside the path are replaced by quoting the new path
+    assert bindit.rebase_arg("x=/my' data'/a", index, {}) == "x='/bindit/my data/a'"
+
+
+def test_arg_cache(monkeypatch):
+    with tempfile.TemporaryDirectory(prefix=TEMPFILE_PREFIX) as sourcedir:
+        monkeypatch.chdir(sourcedir)
+        arg_cache = bindit.ArgCache(maxsize=2)
+        # relative paths that don't exist are not detected
+        assert arg_cache.classify("--in=data.txt") == ()
+        assert arg_cache.classify("--in=data.txt") == ()
+        assert arg_cache.counts["hits"] == 1
+        # until they are created (which changes the parent directory mtime)
+        pathlib.Path("data.txt").write_text("")
+        os.utime(sourcedir, ns=(0, 0))
+        ((start, end, path, full_path, is_dir),) = arg_cache.classify("--in=data.txt")
+        assert (start, end) == (5, 13)
+        assert path == pathlib.Path("data.txt")
+        assert full_path == pathlib.Path(sourcedir).resolve() / "data.txt"
+        assert not is_dir
+        assert arg_cache.counts["stale"] == 1
+        # settings are part of the key
+        monkeypatch.setattr(bindit, "IGNORE_PATH", [pathlib.Path(sourcedir).resolve()])
+        assert arg_cache.classify("--in=data.txt") == ()
+        assert len(arg_cache) == 2
+        arg_cache.classify("/other")
+        assert len(arg_cache) == 2
+        assert arg_cache.counts["evictions"] == 1
+        assert arg_cache.counts["misses"] == 4
+
+
+def test_parse_image_args_arg_cache():
+    with tempfile.TemporaryDirectory(prefix=TEMPFILE_PREFIX) as sourcedir:
+        args = [f"{sourcedir}/a.txt,{sourcedir}", "plain"]
+        expected = bindit.parse_image_args(bindit.arg_pairs(args), {})
+        arg_cache = bindit.ArgCache()
+        for _ in range(2):
+            assert (
+                bindit.parse_image_args(
+                    bindit.arg_pairs(args), {}, arg_cache=arg_cache
+                )
+                == expected
+            )
+        assert arg_cache.counts == {"misses": 2, "hits": 2}
+
+
+def test_path_trie_has_subtree():
+    index = bindit.PathTrie(["/a/b/c"])
+    assert index.has_subtree("/a")
+    assert index.has_subtree("/a/b/c")
+    assert not index.has_subtree("/a/b/c/d")
+    assert not index.has_subtree("/a/bb")
+
+
+def bindit_dest(source):
+    return pathlib.PosixPath("/bindit") / source.relative_to("/")
+
+
+def test_coalesce_binds():
+    sources = ["/data/a/x", "/data/a/y", "/data/b/z", "/home/u/q"]
+    binds = {source: bindit_dest(source) for source in map(pathlib.Path, sources)}
+    bindit.coalesce_binds(binds, 3, bindit.PathTrie())
+    # the deepest common parent goes first
+    assert list(binds)[-1] == pathlib.Path("/data/a")
+    bindit.coalesce_binds(binds, 2, bindit.PathTrie())
+    assert binds == {
+        pathlib.Path("/data"): pathlib.PosixPath("/bindit/data"),
+        pathlib.Path("/home/u/q"): pathlib.PosixPath("/bindit/home/u/q"),
+    }
+    # never the root, or parents of ignored paths
+    bindit.coalesce_binds(binds, 1, bindit.PathTrie())
+    assert len(binds) == 2
+    binds = {source: bindit_dest(source) for source in map(pathlib.Path, sources)}
+    bindit.coalesce_binds(binds, 2, bindit.PathTrie(["/data/b/other"]))
+    assert pathlib.Path("/data/b/z") in binds and len(binds) == 3
+
+
+def test_coalesce_binds_inconsistent_destination():
+    binds = {
+        pathlib.Path("/a/b"): pathlib.PosixPath("/a/b"),
+        pathlib.Path("/a/c"): pathlib.PosixPath("/bindit/a/c"),
+        pathlib.Path("/a/d/e"): pathlib.PosixPath("/bindit/a/d/e"),
+    }
+    bindit.coalesce_binds(binds, 1, bindit.PathTrie())
+    assert binds == {
+        pathlib.Path("/a/b"): pathlib.PosixPath("/a/b"),
+        pathlib.Path("/a/c"): pathlib.PosixPath("/bindit/a/c"),
+        pathlib.Path("/a/d/e"): pathlib.PosixPath("/bindit/a/d/e"),
+    }
+
+
+@hypothesis.given(
+    hypothesis.strategies.lists(
+        hypothesis.strategies.lists(
+            hypothesis.strategies.sampled_from(["a", "b", "ab"]),
+            min_size=1,
+            max_size=4,
+        ),
+        max_size=30,
+    ),
+    hypothesis.strategies.integers(min_value=1, max_value=10),
+)
+def test_coalesce_binds_keeps_destinations(path_parts, max_binds):
+    sources = {pathlib.Path("/", *parts) for parts in path_parts}
+    binds = {source: bindit_dest(source) for source in sources}
+    bindit.remove_redundant_binds(binds)
+    bindit.coalesce_binds(binds, max_binds, bindit.PathTrie(["/b"]))
+    index = bindit.PathTrie()
+    for source, dest in binds.items():
+        index.add(source, dest)
+    for source in sources:
+        # every source is still available at the same destination
+        parent, dest = index.longest_prefix(source)
+        assert dest / source.relative_to(parent) == bindit_dest(source)
+    # only the root and the ignored /b stand in the way of the budget
+    under_b = [source for source in binds if source.parts[1] == "b"]
+    top_level = {source.parts[1] for source in binds} - {"b"}
+    assert len(binds) <= max(max_binds, len(top_level) + len(under_b))
+
+
+def test_output_dirs(tmp_path, monkeypatch):
+    monkeypatch.setattr(bindit, "OUTPUT_FLAGS", ["-o"])
+    tmp_path = tmp_path.resolve()
+    for name in ["in", "out", "flagged"]:
+        (tmp_path / name).mkdir()
+        (tmp_path / name / "file.txt").write_text("")
+    args = [
+        f"{tmp_path}/in/file.txt",
+        f"{tmp_path}/out/new.txt",
+        "-o",
+        f"{tmp_path}/flagged/file.txt",
+        f"--in={tmp_path}/in/file.txt",
+    ]
+    output_dirs = set()
+    _, new_binds = bindit.parse_image_args(
+        bindit.arg_pairs(args), {}, output_dirs=output_dirs
+    )
+    assert output_dirs == {tmp_path / "out", tmp_path / "flagged"}
+    bindit.coalesce_binds(new_binds, 1, bindit.PathTrie())
+    # merged binds are writable if any part of them is
+    assert bindit.writable_binds(new_binds, output_dirs) == {tmp_path}
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""tests for the on-disk cache in `bindit.cache`."""
+import os
+import time
+import multiprocessing
+from click.testing import CliRunner
+import bindit.cache
+import bindit.cli
+
+KEY = {"binary": "/usr/bin/docker", "mtime_ns": 1, "version": "Docker version 1.0"}
+DATA = {"args": {"--volume": "list", "-v": "list"}, "letters": ["-", "i", "t"]}
+
+
+def _store_many(cache_dir):
+    import os
+
+    os.environ["BINDIT_CACHE_DIR"] = cache_dir
+    for _ in range(50):
+        bindit.cache.store("docker_cli", KEY, DATA)
+
+
+def test_roundtrip(tmp_path, monkeypatch):
+    monkeypatch.setenv("BINDIT_CACHE_DIR", str(tmp_path))
+    assert bindit.cache.load("docker_cli", KEY) is None
+    path = bindit.cache.store("docker_cli", KEY, DATA)
+    assert path.parent == tmp_path
+    assert bindit.cache.load("docker_cli", KEY) == DATA
+    # a new docker binary version gives a new key, so a cache miss
+    assert bindit.cache.load("docker_cli", dict(KEY, version="2.0")) is None
+
+
+def test_corrupt_entry(tmp_path, monkeypatch):
+    monkeypatch.setenv("BINDIT_CACHE_DIR", str(tmp_path))
+    path = bindit.cache.entry_path("docker_cli", KEY)
+    path.write_text("{not json")
+    assert bindit.cache.load("docker_cli", KEY) is None
+
+
+def test_concurrent_store(tmp_path, monkeypatch):
+    """concurrent writers never leave a partial entry or temporary files behind."""
+    monkeypatch.setenv("BINDIT_CACHE_DIR", str(tmp_path))
+    procs = [
+        multiprocessing.Process(target=_store_many, args=(str(tmp_path),))
+        for _ in range(4)
+    ]
+    for proc in procs:
+        proc.start()
+    for _ in range(50):
+        assert bindit.cache.load("docker_cli", KEY) in (None, DATA)
+    for proc in procs:
+        proc.join()
+    assert bindit.cache.load("docker_cli", KEY) == DATA
+    assert [p.name for p in tmp_path.iterdir()] == [
+        bindit.cache.entry_path("docker_cli", KEY).name
+    ]
+
+
+def test_cli_show_clear(tmp_path, monkeypatch):
+    monkeypatch.setenv("BINDIT_CACHE_DIR", str(tmp_path))
+    bindit.cache.store("docker_cli", KEY, DATA)
+    bindit.cache.lists_dir().mkdir()
+    old_list = bindit.cache.lists_dir() / "inputs.k2x8f1qz.bindit.txt"
+    old_list.write_text("")
+    old_time = time.time() - bindit.cache.LISTS_MAX_AGE - 60
+    os.utime(old_list, (old_time, old_time))
+    # running containers may still read this one
+    new_list = bindit.cache.lists_dir() / "inputs.p9r3m7wd.bindit.txt"
+    new_list.write_text("")
+    runner = CliRunner()
+    result = runner.invoke(bindit.cli.main, ["cache", "show"])
+    assert result.exit_code == 0
+    assert "docker_cli" in result.output
+    result = runner.invoke(bindit.cli.main, ["cache", "clear"])
+    assert result.exit_code == 0
+    assert "removed 2" in result.output
+    assert not bindit.cache.entries()
+    assert list(bindit.cache.lists_dir().iterdir()) == [new_list]
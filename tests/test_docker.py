@@ -2,6 +2,7 @@
 # -*- coding: utf-8 -*-
 """Docker tests for `bindit` package."""
 
+import sys
 import json
 import pathlib
 import tempfile
@@ -9,6 +10,7 @@ import bindit.shell
 import bindit.docker
 from click.testing import CliRunner
 import subprocess
+import pytest
 
 IMAGE = "alpine:latest"
 IMAGE_SHELL_PREFIX = ["/bin/sh", "-c"]
@@ -116,6 +118,18 @@ class DockerRun(object):
         return destpath.name in files
 
 
+@pytest.fixture
+def bundled_cli(monkeypatch):
+    """use the bundled docker run table, so tests can dryrun without docker."""
+    monkeypatch.setenv("BINDIT_DOCKER_VERSION", "20.10")
+    monkeypatch.setattr(bindit, "DRY_RUN", True)
+    bindit.docker.docker_version.cache_clear()
+    bindit.docker.docker_cli.cache_clear()
+    yield
+    bindit.docker.docker_version.cache_clear()
+    bindit.docker.docker_cli.cache_clear()
+
+
 def test_cli_inference():
     """check that we have FLAGS, LETTERS, and the correct keys in BIND_PARSER."""
     assert bindit.docker.ARGS
@@ -124,6 +138,50 @@ def test_cli_inference():
         assert bind in bindit.docker.ARGS
 
 
+def test_lazy_cli_inference():
+    """check that commands which never parse runner arguments do not infer the docker
+    CLI."""
+    import bindit.cli
+
+    bindit.docker.docker_cli.cache_clear()
+    result = CliRunner().invoke(bindit.cli.main, ["--version"])
+    assert result.exit_code == 0
+    assert bindit.docker.docker_cli.cache_info().currsize == 0
+
+
+def test_bundled_cli(monkeypatch):
+    """check that bundled tables are used for known docker versions, without running
+    any subprocess."""
+
+    def no_subprocess(*arg, **kwarg):
+        raise AssertionError(f"unexpected subprocess: {arg}")
+
+    monkeypatch.setattr(bindit.shell, "run", no_subprocess)
+    monkeypatch.setenv("BINDIT_DOCKER_VERSION", "Docker version 20.10.17, build 100c701")
+    bindit.docker.docker_version.cache_clear()
+    bindit.docker.docker_cli.cache_clear()
+    try:
+        assert bindit.docker.docker_version() == "20.10.17"
+        valid_args, valid_letters = bindit.docker.docker_cli()
+        for bind in bindit.docker.BIND_PARSER:
+            assert bind in valid_args
+        assert {"i", "t"} <= valid_letters
+        container_args, manual_binds, container_name = bindit.parse_container_args(
+            bindit.arg_pairs(["-it", "--rm", "-v", "/a:/b", IMAGE, "ls"]),
+            bind_parser=bindit.docker.BIND_PARSER,
+            valid_args=valid_args,
+            valid_letters=valid_letters,
+        )
+        assert container_args == ["-it", "--rm", "-v", "/a:/b"]
+        assert container_name == IMAGE
+        # major release series lookup
+        assert "--annotation" in bindit.docker.bundled_docker_cli("24.0.7")[0]
+        assert bindit.docker.bundled_docker_cli("1.13.1") is None
+    finally:
+        bindit.docker.docker_version.cache_clear()
+        bindit.docker.docker_cli.cache_clear()
+
+
 def test_parse_bind_mount():
     """test that parse_bind_mount meets docker API requirements."""
     for sourcekey in ["source", "src"]:
@@ -249,3 +307,136 @@ def test_bind_folder():
             mounts = container.get_mounts()
             assert sourcedir_resolved in mounts
             assert pathlib.PosixPath(mounts[sourcedir_resolved]) == destdir_expected
+
+
+def test_batch(bundled_cli):
+    """test that batch plans each manifest line (shell-quoted or JSON)."""
+    with tempfile.TemporaryDirectory(prefix=TEMPFILE_PREFIX) as sourcedir:
+        sourcedir_resolved = pathlib.Path(sourcedir).resolve()
+        sourcefile = pathlib.Path(
+            tempfile.mkstemp(dir=sourcedir, prefix=TEMPFILE_PREFIX)[1]
+        )
+        manifest = "\n".join(
+            [
+                f"-it {IMAGE} ls '{sourcefile}'",
+                "# comments and empty lines are skipped",
+                "",
+                json.dumps(["-v", f"{sourcedir}:/data", IMAGE, "ls", str(sourcefile)]),
+            ]
+        )
+        result = CliRunner().invoke(bindit.docker.batch, ["-"], input=manifest)
+        assert result.exit_code == 0
+        lines = result.output.splitlines()
+        assert len(lines) == 2
+        bind = f"{sourcedir_resolved}:/bindit{sourcedir_resolved}"
+        assert lines[0].startswith(f"docker run -it -v {bind} {IMAGE}")
+        assert lines[1].endswith(f"{IMAGE} ls /data/{sourcefile.name}")
+
+
+def test_batch_planning_errors(bundled_cli, caplog):
+    """test that lines that can't be parsed or planned are reported, and don't stop the
+    batch."""
+    manifest = "\n".join(
+        [f"{IMAGE} echo ok", f"{IMAGE} echo 'oops", "[not json", f"{IMAGE} echo ok2"]
+    )
+    result = CliRunner().invoke(bindit.docker.batch, ["-"], input=manifest)
+    assert result.exit_code == 1
+    assert result.output.splitlines() == [
+        f"docker run {IMAGE} echo ok",
+        f"docker run {IMAGE} echo ok2",
+    ]
+    assert "line 2 failed (ValueError: No closing quotation)" in caplog.text
+    assert "line 3 failed (JSONDecodeError" in caplog.text
+    assert "2 of 4 lines failed: [2, 3]" in caplog.text
+
+
+def test_exec(fake_docker, monkeypatch):
+    """test that --exec replaces bindit with docker, so the exit code passes straight
+    through."""
+    fake_docker('echo "pid=$$"\nexit 3')
+    monkeypatch.setenv("BINDIT_DOCKER_VERSION", "20.10")
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "bindit.cli", "--exec", "docker", "run", IMAGE, "ls"],
+        stdout=subprocess.PIPE,
+        encoding="utf-8",
+    )
+    stdout, _ = proc.communicate()
+    assert proc.returncode == 3
+    # same process, so no lingering python parent
+    assert f"pid={proc.pid}" in stdout.splitlines()
+
+
+def test_run_many(bundled_cli, fake_docker, monkeypatch, caplog):
+    """test that run-many runs every job and reports failures."""
+    fake_docker()
+    monkeypatch.setattr(bindit, "DRY_RUN", False)
+    manifest = "\n".join(
+        [f"{IMAGE} echo ok", f"{IMAGE} fail", f"{IMAGE} echo 'oops", f"{IMAGE} echo ok2"]
+    )
+    result = CliRunner().invoke(
+        bindit.docker.run_many, ["--jobs", "2", "-"], input=manifest
+    )
+    assert result.exit_code == 1
+    for line in ["ran run alpine:latest echo ok", "ran run alpine:latest fail"]:
+        assert line in result.output.splitlines()
+    # a line that can't be planned doesn't stop the others
+    assert "ran run alpine:latest echo ok2" in result.output
+    assert "line 3 failed (ValueError: No closing quotation)" in caplog.text
+    assert "2 of 4 lines failed: [2, 3]" in caplog.text
+
+
+def test_batch_failures(bundled_cli, fake_docker, monkeypatch, caplog, capfd):
+    """test that batch runs every line past a failed container, reports the failed
+    lines and exits non-zero."""
+    fake_docker()
+    monkeypatch.setattr(bindit, "DRY_RUN", False)
+    manifest = "\n".join(
+        ["# header", f"{IMAGE} echo ok", f"{IMAGE} fail", "", f"{IMAGE} echo ok2"]
+    )
+    result = CliRunner().invoke(bindit.docker.batch, ["-"], input=manifest)
+    assert result.exit_code == 1
+    # the last line still ran after the failed one (containers write to the real
+    # stdout)
+    assert "ran run alpine:latest echo ok2" in capfd.readouterr().out
+    assert f"line 3 failed (exit code 4): docker run {IMAGE} fail" in caplog.text
+    assert "1 of 3 lines failed: [3]" in caplog.text
+
+
+def test_bind_modes(bundled_cli, tmp_path, monkeypatch):
+    """test that new binds that only hold inputs get --input-mode, and binds that hold
+    outputs (new paths, or values of output flags) get --output-mode."""
+    monkeypatch.setattr(bindit.docker, "INPUT_MODE", None)
+    monkeypatch.setattr(bindit.docker, "OUTPUT_MODE", None)
+    monkeypatch.setattr(bindit, "OUTPUT_FLAGS", list(bindit.OUTPUT_FLAGS))
+    tmp_path = tmp_path.resolve()
+    for name in ["ref", "in", "out", "flagged"]:
+        (tmp_path / name).mkdir()
+    (tmp_path / "ref" / "genome.fa").write_text("")
+    (tmp_path / "in" / "reads.fq").write_text("")
+    (tmp_path / "flagged" / "old.txt").write_text("")
+
+    def binds(*args):
+        result = CliRunner().invoke(bindit.docker.docker, list(args))
+        assert result.exit_code == 0, result.output
+        return sorted(result.output.split(f" {IMAGE} ")[0].split(" -v ")[1:])
+
+    assert binds(
+        *["--input-mode", "ro,cached", "--output-mode", "delegated", "run", IMAGE],
+        *[f"--ref={tmp_path}/ref/genome.fa", f"{tmp_path}/in/reads.fq"],
+        *[f"{tmp_path}/out/new.txt", "--save", f"{tmp_path}/flagged/old.txt"],
+    ) == [
+        f"{tmp_path}/flagged:/bindit{tmp_path}/flagged:ro,cached",
+        f"{tmp_path}/in:/bindit{tmp_path}/in:ro,cached",
+        f"{tmp_path}/out:/bindit{tmp_path}/out:delegated",
+        f"{tmp_path}/ref:/bindit{tmp_path}/ref:ro,cached",
+    ]
+    # unless the flag is known to take outputs
+    assert binds(
+        *["--input-mode", "ro", "--output-flag", "--save", "run", IMAGE],
+        *["--save", f"{tmp_path}/flagged/old.txt", f"-o={tmp_path}/in/reads.fq"],
+    ) == [
+        f"{tmp_path}/flagged:/bindit{tmp_path}/flagged",
+        f"{tmp_path}/in:/bindit{tmp_path}/in",
+    ]
+    result = CliRunner().invoke(bindit.docker.docker, ["--input-mode", "ro,bogus"])
+    assert result.exit_code == 2 and "bogus" in result.output
@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""tests for the Docker Engine API backend, against a stub server on a Unix socket."""
+import io
+import json
+import struct
+import pathlib
+import threading
+import socketserver
+import http.server
+import pytest
+from click.testing import CliRunner
+import bindit
+import bindit.docker
+import bindit.docker_api
+
+IMAGE = "alpine:latest"
+
+
+class StubHandler(http.server.BaseHTTPRequestHandler):
+    """minimal stand-in for the docker daemon."""
+
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def log_message(self, *arg):
+        pass
+
+    def reply(self, status, payload=b"", content_type="application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.server.requests.append((self.path, body))
+        path = self.path.partition("?")[0]
+        if path == "/containers/create":
+            config = json.loads(body)
+            self.server.auto_remove = config["HostConfig"].get("AutoRemove", False)
+            self.reply(201, json.dumps({"Id": "abc123"}).encode())
+        elif path == "/containers/abc123/start":
+            self.reply(204)
+        elif path == "/containers/abc123/wait" and not self.server.removed:
+            self.server.waiting.set()
+            self.server.exited.wait(timeout=5)
+            self.reply(200, json.dumps({"StatusCode": 3}).encode())
+        else:
+            self.reply(404, json.dumps({"message": "not found"}).encode())
+
+    def do_GET(self):
+        self.server.requests.append((self.path, b""))
+        frames = b"".join(
+            struct.pack(">BxxxL", stream, len(chunk)) + chunk
+            for stream, chunk in self.server.frames
+        )
+        # the container exits (and is removed, with --rm) as soon as its output has
+        # been read, after any wait requests sent before it started have arrived
+        self.server.waiting.wait(timeout=1)
+        self.server.removed = self.server.auto_remove
+        self.server.exited.set()
+        self.reply(200, frames, content_type="application/vnd.docker.raw-stream")
+
+
+class StubServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+@pytest.fixture
+def stub(tmp_path):
+    socket_path = str(tmp_path / "docker.sock")
+    server = StubServer(socket_path, StubHandler)
+    server.requests = []
+    server.connections = 0
+    server.frames = [(1, b"hello\n"), (2, b"oops\n")]
+    server.auto_remove = False
+    server.removed = False
+    server.waiting = threading.Event()
+    server.exited = threading.Event()
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    yield server, bindit.docker_api.DockerAPI(socket_path)
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+def make_plan(container_args, new_binds=None, mode=None):
+    new_binds = new_binds or {}
+    bind_args = []
+    for source, dest in new_binds.items():
+        bind_args += bindit.docker.volume_bind_args(source, dest, mode=mode)
+    return bindit.RunPlan(
+        runner=["docker", "run"],
+        container_args=container_args,
+        bind_args=bind_args,
+        container_name=IMAGE,
+        image_args=["ls", "/bindit/data"],
+        manual_binds={},
+        new_binds=new_binds,
+    )
+
+
+def test_plan_to_config():
+    plan = make_plan(
+        ["-t", "--rm", "-e", "A=1", "-v", "/host:/manual", "--name", "test"],
+        new_binds={pathlib.Path("/data"): pathlib.PosixPath("/bindit/data")},
+    )
+    config, name, detach = bindit.docker_api.plan_to_config(plan)
+    assert name == "test"
+    assert not detach
+    assert config["Image"] == IMAGE
+    assert config["Cmd"] == ["ls", "/bindit/data"]
+    assert config["Tty"]
+    assert config["Env"] == ["A=1"]
+    assert config["HostConfig"]["AutoRemove"]
+    assert config["HostConfig"]["Binds"] == ["/host:/manual", "/data:/bindit/data"]
+    # new binds keep their options
+    plan = make_plan(
+        [],
+        new_binds={pathlib.Path("/data"): pathlib.PosixPath("/bindit/data")},
+        mode="ro",
+    )
+    config, _, _ = bindit.docker_api.plan_to_config(plan)
+    assert config["HostConfig"]["Binds"] == ["/data:/bindit/data:ro"]
+
+
+def test_plan_to_config_unsupported():
+    with pytest.raises(ValueError):
+        bindit.docker_api.plan_to_config(make_plan(["--cpus", "2"]))
+    with pytest.raises(ValueError):
+        # can't attach stdin through the API backend
+        bindit.docker_api.plan_to_config(make_plan(["-it"]))
+    config, _, detach = bindit.docker_api.plan_to_config(make_plan(["-dit"]))
+    assert detach and config["OpenStdin"] and config["Tty"]
+
+
+def test_run_plan(stub, capsys):
+    server, api = stub
+    plan = make_plan(
+        [], new_binds={pathlib.Path("/data"): pathlib.PosixPath("/bindit/data")}
+    )
+    assert bindit.docker_api.run_plan(plan, api=api) == 3
+    paths = [path for path, _ in server.requests]
+    # the wait is sent before the start, on its own connection
+    assert paths[0] == "/containers/create"
+    assert sorted(paths[1:]) == [
+        "/containers/abc123/logs?follow=1&stdout=1&stderr=1",
+        "/containers/abc123/start",
+        "/containers/abc123/wait?condition=next-exit",
+    ]
+    config = json.loads(server.requests[0][1])
+    assert config["HostConfig"]["Binds"] == ["/data:/bindit/data"]
+    captured = capsys.readouterr()
+    assert captured.out == "hello\n"
+    assert captured.err == "oops\n"
+    # all other requests went over one keep-alive connection
+    assert server.connections == 2
+
+
+def test_run_plan_auto_remove(stub, capsys):
+    server, api = stub
+    assert bindit.docker_api.run_plan(make_plan(["--rm"]), api=api) == 3
+    assert "/containers/abc123/wait?condition=removed" in [
+        path for path, _ in server.requests
+    ]
+    assert capsys.readouterr().out == "hello\n"
+    # the container is gone, so waiting only after the output ends would fail
+    with pytest.raises(bindit.docker_api.DockerAPIError):
+        api.wait("abc123")
+
+
+def test_run_plan_binary(stub):
+    server, api = stub
+    # binary output, and a character that is split across frames
+    accent = "é".encode()
+    server.frames = [(1, b"\x00\xff\xfe"), (1, accent[:1]), (1, accent[1:])]
+    stdout, stderr = io.BytesIO(), io.BytesIO()
+    plan = make_plan([])
+    assert bindit.docker_api.run_plan(plan, api=api, stdout=stdout, stderr=stderr) == 3
+    assert stdout.getvalue() == b"\x00\xff\xfe" + "é".encode()
+    assert stderr.getvalue() == b""
+
+
+def test_decoding_writer():
+    text = io.StringIO()
+    writer = bindit.docker_api.DecodingWriter(text)
+    for byte in "aé€".encode():
+        writer.write(bytes([byte]))
+    writer.write("€".encode()[:2])
+    writer.close()
+    assert text.getvalue() == "aé€\ufffd"
+
+
+def test_run_errors(tmp_path, monkeypatch):
+    """test that api backend errors are reported without a traceback, and unsupported
+    arguments before the command is written out."""
+    monkeypatch.setenv("BINDIT_DOCKER_VERSION", "20.10")
+    monkeypatch.setenv("DOCKER_HOST", f"unix://{tmp_path}/missing.sock")
+    monkeypatch.setattr(bindit, "DRY_RUN", False)
+    monkeypatch.setattr(bindit.docker, "BACKEND", bindit.docker.BACKEND)
+    bindit.docker_api.client.cache_clear()
+    runner = CliRunner()
+    result = runner.invoke(
+        bindit.docker.docker, ["-b", "api", "run", "--cpus", "2", IMAGE, "ls"]
+    )
+    assert result.exit_code == 1
+    assert "--cpus is not supported by the api backend" in result.output
+    # and the command is not written out
+    assert result.output.startswith("Error: ")
+    result = runner.invoke(bindit.docker.docker, ["-b", "api", "run", IMAGE, "ls"])
+    assert result.exit_code == 1
+    assert "Error: " in result.output
+    assert isinstance(result.exception, SystemExit)
+    bindit.docker_api.client.cache_clear()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Fast-start entry point tests for `bindit` package."""
+import os
+import sys
+import subprocess
+import pytest
+import bindit.fast
+
+# modules that the docker run hot path should not import
+HOT_PATH_EXCLUDED = [
+    "click",
+    "bindit.cli",
+    "bindit.cache",
+    "bindit.client",
+    "bindit.server",
+    "bindit.docker_api",
+    "bindit.docker_commands",
+    "bindit.singularity",
+    "bindit.planfile",
+    "concurrent.futures",
+    "http.client",
+    "socketserver",
+]
+# total import time budget for the docker run hot path, in milliseconds (generous, so
+# that slow CI machines pass - override with BINDIT_IMPORT_BUDGET_MS)
+IMPORT_BUDGET_MS = float(os.environ.get("BINDIT_IMPORT_BUDGET_MS", 250))
+
+
+@pytest.mark.parametrize(
+    "argv,expected",
+    [
+        (
+            ["docker", "run", "alpine", "ls"],
+            ({"dryrun": False, "absonly": False}, ["alpine", "ls"]),
+        ),
+        (
+            ["-d", "--absonly", "-l", "DEBUG", "docker", "run", "alpine", "-d"],
+            ({"dryrun": True, "absonly": True, "loglevel": "DEBUG"}, ["alpine", "-d"]),
+        ),
+        (["--timings", "-", "docker", "run", "-it", "alpine"], ({}, ["-it", "alpine"])),
+        (
+            ["--scan-lists", "*.txt", "--scan-lists", "*.lst", "--rebase-lists"]
+            + ["docker", "run", "alpine"],
+            ({"scan_lists": ["*.txt", "*.lst"], "rebase_lists": True}, ["alpine"]),
+        ),
+        (
+            ["--no-rebase-lists", "docker", "run", "alpine"],
+            ({"rebase_lists": False}, ["alpine"]),
+        ),
+        (
+            ["--max-binds", "8", "docker", "run", "alpine"],
+            ({"max_binds": 8}, ["alpine"]),
+        ),
+        # handled by bindit.cli
+        (["--max-binds", "0", "docker", "run", "alpine"], None),
+        (["docker", "batch", "manifest.txt"], None),
+        (["docker", "-b", "api", "run", "alpine"], None),
+        (["-da", "docker", "run", "alpine"], None),
+        (["docker", "run", "alpine", "--help"], None),
+        (["--version"], None),
+        (["-i", "/does/not/exist", "docker", "run", "alpine"], None),
+        (["docker", "run"], None),
+    ],
+)
+def test_parse_fast_args(argv, expected):
+    parsed = bindit.fast.parse_fast_args(argv)
+    if expected is None:
+        assert parsed is None
+        return
+    options, run_args = parsed
+    assert run_args == expected[1]
+    for key, value in expected[0].items():
+        assert options[key] == value
+
+
+@pytest.mark.parametrize(
+    "argv,expected",
+    [
+        (["apply", "plan.json"], ("plan.json", False)),
+        (["-d", "apply", "--strict", "-"], ("-", True)),
+        (["apply", "--help"], None),
+        (["apply", "a.json", "b.json"], None),
+        (["apply", "--unknown", "plan.json"], None),
+        (["docker", "run", "alpine"], None),
+    ],
+)
+def test_parse_fast_apply(argv, expected):
+    parsed = bindit.fast.parse_fast_apply(argv)
+    if expected is None:
+        assert parsed is None
+        return
+    assert parsed[1:] == expected
+
+
+def test_hot_path_imports(tmp_path):
+    """test that a dryrun docker run through the fast path stays within the import
+    budget, and does not import modules it does not need."""
+    env = dict(os.environ, BINDIT_DOCKER_VERSION="20.10")
+    ret = subprocess.run(
+        [sys.executable, "-X", "importtime", "-m", "bindit.fast", "--dryrun"]
+        + ["docker", "run", "alpine:latest", "ls", str(tmp_path)],
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        encoding="utf-8",
+        check=True,
+    )
+    assert ret.stdout.startswith("docker run -v")
+    imported = {}
+    for line in ret.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit():
+            imported[name.strip()] = (int(cumulative), not name.startswith("  "))
+    assert not set(HOT_PATH_EXCLUDED) & set(imported)
+    # top-level imports only, since their cumulative times include everything else
+    total_ms = sum(us for us, top_level in imported.values() if top_level) / 1000
+    assert total_ms < IMPORT_BUDGET_MS, f"imports took {total_ms:.0f} ms"
+
+
+def test_fallback(capsys):
+    """test that other commands go to the full command line interface."""
+    with pytest.raises(SystemExit) as err:
+        bindit.fast.main(["--version"])
+    assert err.value.code == 0
+    assert capsys.readouterr().out.strip() == bindit.__version__
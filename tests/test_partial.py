@@ -1,5 +1,6 @@
 """bindit_partial CLI tests."""
 
+import os
 import pathlib
 import bindit.partial
 import bindit.docker
@@ -120,3 +121,77 @@ def test_docker_direct():
         )
         assert lines[1].split(" ")[0] == "docker"
     return
+
+
+def test_fastpath(tmp_path, monkeypatch):
+    """test that --fastpath wrappers rewrite arguments under the embedded binds like
+    bindit does, and call bindit for anything else."""
+    monkeypatch.setenv("BINDIT_DOCKER_VERSION", "20.10")
+    monkeypatch.chdir(tmp_path)
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    # stand-ins for docker and (once the wrapper exists) bindit
+    (bin_dir / "docker").write_text('#!/bin/sh\necho docker "$@"\n')
+    (bin_dir / "docker").chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bin_dir}:{os.environ['PATH']}")
+    data = tmp_path / "data"
+    (data / "sub").mkdir(parents=True)
+    (data / "in.txt").write_text("")
+    (tmp_path / "link").symlink_to(data)
+    bind_args = bindit.docker.volume_bind_args(data.resolve(), pathlib.Path("/data"))
+    bindit.shell.run(
+        "bindit_partial",
+        "--fastpath",
+        "--output_file",
+        "wrap",
+        "bindit",
+        "-i",
+        str(tmp_path / "bin"),
+        "docker",
+        "run",
+        *bind_args,
+        test_docker.IMAGE,
+        "cat",
+        interactive=False,
+    )
+    (bin_dir / "bindit").write_text('#!/bin/sh\necho bindit "$@"\n')
+    (bin_dir / "bindit").chmod(0o755)
+
+    def wrap(*args):
+        return bindit.shell.run("sh", "wrap", *args, interactive=False).stdout
+
+    docker_line = " ".join(["docker", "run", *bind_args, test_docker.IMAGE, "cat"])
+    args = ["data/in.txt", "--out=link/sub,-n", "", f"{data}/new.txt", "bin/docker"]
+    expected = f"{docker_line} /data/in.txt --out=/data/sub,-n {{}} /data/new.txt"
+    expected += " bin/docker\n"
+    # the command is written out first (quoted), like bindit does
+    assert wrap(*args) == expected.format("''") + expected.format("")
+    # new paths, quotes and white space go to bindit
+    for arg in [str(tmp_path), "data/in.txt other", "'data'"]:
+        assert wrap("data/in.txt", arg).startswith("bindit -i")
+
+
+def test_wrapper_lines(tmp_path, monkeypatch):
+    """test that wrappers are planned in-process like bindit --dryrun would, and that
+    one wrapper's options don't leak into the next."""
+    monkeypatch.setenv("BINDIT_DOCKER_VERSION", "20.10")
+    monkeypatch.setattr(bindit, "IGNORE_PATH", list(bindit.IGNORE_PATH))
+    ignore_path = list(bindit.IGNORE_PATH)
+    (tmp_path / "in.txt").write_text("")
+    run_args = ["docker", "run", test_docker.IMAGE, "cat", str(tmp_path / "in.txt")]
+    expected = bindit.shell.run(
+        "bindit", "--dryrun", *run_args, interactive=False
+    ).stdout.splitlines()[-1]
+    assert bindit.partial.wrapper_lines(["bindit", *run_args]) == [
+        "#!/bin/bash\n",
+        f'bindit {expected} "$@"\n',
+    ]
+    lines = bindit.partial.wrapper_lines(
+        ["bindit", "-i", str(tmp_path), "-d", *run_args], vararg_pattern='"$argv"'
+    )
+    assert lines[1] == f"bindit --dryrun {' '.join(run_args)} \"$argv\"\n"
+    assert bindit.IGNORE_PATH == ignore_path
+    assert not bindit.DRY_RUN and bindit.PLAN_OUTPUT is None
+    assert bindit.partial.wrapper_lines(["bindit", *run_args])[1].startswith(
+        f"bindit {expected}"
+    )
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Plan file tests for `bindit` package. These use the bundled docker run table, so no
+docker is needed."""
+import json
+import pathlib
+import pytest
+from click.testing import CliRunner
+import bindit
+import bindit.cli
+import bindit.docker
+import bindit.planfile
+
+IMAGE = "alpine:latest"
+
+
+@pytest.fixture
+def planning(monkeypatch, tmp_path):
+    """plan in tmp_path (with a data/in.txt file), with the bundled docker run table and
+    all the settings that apply changes restored afterwards."""
+    monkeypatch.setenv("BINDIT_DOCKER_VERSION", "20.10")
+    for name in ["DRY_RUN", "EXEC", "ABS_ONLY", "PLAN_OUTPUT"]:
+        monkeypatch.setattr(bindit, name, getattr(bindit, name))
+    for name in ["IGNORE_PATH", "SCAN_LISTS", "REBASE_LISTS", "MAX_BINDS"]:
+        monkeypatch.setattr(bindit, name, getattr(bindit, name))
+    monkeypatch.setattr(bindit.docker, "BACKEND", bindit.docker.BACKEND)
+    bindit.docker.docker_version.cache_clear()
+    bindit.docker.docker_cli.cache_clear()
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "data").mkdir()
+    (tmp_path / "data" / "in.txt").write_text("bindit\n")
+    yield tmp_path.resolve()
+    bindit.docker.docker_version.cache_clear()
+    bindit.docker.docker_cli.cache_clear()
+
+
+def make_plan(tmp_path, *image_args, options=()):
+    result = CliRunner().invoke(
+        bindit.cli.main,
+        list(options)
+        + ["plan", "-o", "plan.json", "docker", "run", IMAGE]
+        + list(image_args),
+    )
+    assert result.exit_code == 0, result.output
+    return json.loads((tmp_path / "plan.json").read_text())
+
+
+def test_plan_dependencies(planning):
+    record = make_plan(planning, "cat", "data/in.txt", f"{planning}/data/out.txt")
+    kinds = {path: kind for path, kind, *_ in record["dependencies"]}
+    assert kinds[f"{planning}/data/in.txt"] == "file"
+    assert kinds[f"{planning}/data"] == "dir"
+    assert kinds[f"{planning}/data/out.txt"] == "missing"
+    # relative paths that don't exist must stay that way
+    assert kinds[f"{planning}/cat"] == "absent"
+    plan = bindit.planfile.plan_from_dict(record["plan"])
+    assert plan.new_binds == {
+        planning / "data": pathlib.PosixPath(f"/bindit{planning}/data")
+    }
+
+
+def test_apply(planning, monkeypatch, capsys):
+    record = make_plan(planning, "cat", "data/in.txt", f"{planning}/data/out.txt")
+    monkeypatch.setattr(bindit, "DRY_RUN", True)
+    expected = bindit.planfile.plan_from_dict(record["plan"]).command_line()
+    bindit.planfile.apply("plan.json", strict=True)
+    assert capsys.readouterr().out == expected + "\n"
+    # outputs from earlier runs don't invalidate the plan
+    (planning / "data" / "out.txt").write_text("")
+    bindit.planfile.apply("plan.json", strict=True)
+    assert capsys.readouterr().out == expected + "\n"
+
+
+def test_apply_out_of_date(planning, monkeypatch, capsys):
+    make_plan(planning, "cat", "data/in.txt", "cat")
+    monkeypatch.setattr(bindit, "DRY_RUN", True)
+    # a relative path that now exists has to be bound
+    (planning / "cat").write_text("")
+    with pytest.raises(ValueError, match="out of date"):
+        bindit.planfile.apply("plan.json", strict=True)
+    bindit.planfile.apply("plan.json")
+    command = capsys.readouterr().out.split()
+    assert command[-1] == f"/bindit{planning}/cat"
+    # and replaced files count as changes too
+    make_plan(planning, "cat", "data/in.txt")
+    (planning / "data" / "new.txt").write_text("replaced\n")
+    (planning / "data" / "new.txt").rename(planning / "data" / "in.txt")
+    changed = bindit.planfile.changed_dependency(
+        bindit.planfile.load("plan.json")["dependencies"]
+    )
+    assert changed[:2] == [f"{planning}/data/in.txt", "file"]
+
+
+def test_changed_dependency_other_host(planning, monkeypatch):
+    """test that plans still hold where the same files have another device number (e.g.,
+    a network file system mounted on another host)."""
+    record = make_plan(planning, "cat", "data/in.txt")
+    real_stat = bindit.planfile.os.stat
+
+    def other_host_stat(path):
+        result = list(real_stat(path))
+        result[2] += 1  # st_dev
+        return bindit.planfile.os.stat_result(result)
+
+    monkeypatch.setattr(bindit.planfile.os, "stat", other_host_stat)
+    assert bindit.planfile.changed_dependency(record["dependencies"]) is None
+    assert bindit.planfile.check(record, strict=True).command_line()
+
+
+def test_plan_max_binds(planning):
+    for name in ["a", "b"]:
+        (planning / "data" / name).mkdir()
+        (planning / "data" / name / "in.txt").write_text("")
+    args = ["cat", "data/a/in.txt", "data/b/in.txt"]
+    assert len(make_plan(planning, *args)["plan"]["new_binds"]) == 2
+    record = make_plan(planning, *args, options=["--max-binds", "1"])
+    assert record["settings"]["max_binds"] == 1
+    plan = bindit.planfile.plan_from_dict(record["plan"])
+    assert plan.new_binds == {
+        planning / "data": pathlib.PosixPath(f"/bindit{planning}/data")
+    }
+    # the image arguments are rebased onto the merged bind
+    assert plan.image_args[1:] == [
+        f"/bindit{planning}/data/a/in.txt",
+        f"/bindit{planning}/data/b/in.txt",
+    ]
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""tests for the bindit daemon and client."""
+import os
+import pathlib
+import tempfile
+import threading
+import pytest
+import bindit
+import bindit.client
+import bindit.docker
+import bindit.server
+
+TEMPFILE_PREFIX = f"bindit_{__name__}_"
+IMAGE = "alpine:latest"
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    monkeypatch.setenv("BINDIT_DOCKER_VERSION", "20.10")
+    bindit.docker.docker_version.cache_clear()
+    bindit.docker.docker_cli.cache_clear()
+    socket_path = str(tmp_path / "bindit.sock")
+    with bindit.server.PlanServer(socket_path) as plan_server:
+        thread = threading.Thread(target=plan_server.serve_forever)
+        thread.start()
+        yield socket_path
+        plan_server.shutdown()
+        thread.join()
+    assert not os.path.exists(socket_path)
+    bindit.docker.docker_version.cache_clear()
+    bindit.docker.docker_cli.cache_clear()
+
+
+def test_request_plan(server):
+    with tempfile.TemporaryDirectory(prefix=TEMPFILE_PREFIX) as sourcedir:
+        sourcedir_resolved = pathlib.Path(sourcedir).resolve()
+        response = bindit.client.request_plan(
+            "docker", [IMAGE, "ls", "subdir"], socket_path=server, cwd=sourcedir
+        )
+        # relative paths that don't exist are left alone
+        assert response["command"] == ["docker", "run", IMAGE, "ls", "subdir"]
+        (sourcedir_resolved / "subdir").mkdir()
+        # so the daemon must notice that the path now exists
+        response = bindit.client.request_plan(
+            "docker", [IMAGE, "ls", "subdir"], socket_path=server, cwd=sourcedir
+        )
+        dest = f"/bindit{sourcedir_resolved}/subdir"
+        assert response["command"] == [
+            "docker",
+            "run",
+            "-v",
+            f"{sourcedir_resolved}/subdir:{dest}",
+            IMAGE,
+            "ls",
+            dest,
+        ]
+
+
+def test_request_other_user(server, monkeypatch):
+    uid = os.getuid()
+    monkeypatch.setattr(bindit.client.os, "getuid", lambda: uid + 1)
+    with pytest.raises(PermissionError, match="another user"):
+        bindit.client.request_plan("docker", [IMAGE, "ls"], socket_path=server)
+
+
+def test_server_keeps_other_files(tmp_path):
+    """test that the daemon only replaces stale sockets, not other files."""
+    socket_path = tmp_path / "bindit.sock"
+    socket_path.write_text("not a socket")
+    with pytest.raises(OSError):
+        bindit.server.PlanServer(str(socket_path))
+    assert socket_path.read_text() == "not a socket"
+
+
+def test_request_error(server):
+    response = bindit.client.request_plan("podman", [IMAGE], socket_path=server)
+    assert "unsupported runner" in response["error"]
+
+
+def test_validating_resolver():
+    resolver = bindit.server.ValidatingPathResolver()
+    with tempfile.TemporaryDirectory(prefix=TEMPFILE_PREFIX) as sourcedir:
+        path = pathlib.Path(sourcedir) / "file"
+        assert not resolver.exists(path)
+        path.touch()
+        resolver.begin_request()
+        assert resolver.exists(path)
+        assert not resolver.is_dir(path)
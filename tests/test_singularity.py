@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Singularity/apptainer tests for `bindit` package. These use a canned --help output,
+so no container runner is needed."""
+import pathlib
+import tempfile
+import pytest
+from click.testing import CliRunner
+import bindit
+import bindit.cli
+import bindit.docker
+import bindit.singularity
+
+TEMPFILE_PREFIX = f"bindit_{__name__}_"
+IMAGE = "docker://alpine:latest"
+EXEC_HELP = """
+Usage:
+  apptainer exec [exec options...] <container> <command>
+
+Options:
+      --app string          set an application to run inside a container
+  -B, --bind strings        a user-bind path specification.  spec has the format
+                            src[:dest[:opts]], where src and dest are outside and
+                            inside paths.
+  -e, --cleanenv            clean environment before running container
+  -c, --contain             use minimal /dev and empty other directories
+      --env strings         pass environment variable to contained process
+  -h, --help                help for exec
+      --mount stringArray   a mount specification
+      --nv                  enable Nvidia support
+  -W, --workdir string      working directory to be used for /tmp, /var/tmp
+"""
+
+
+@pytest.fixture
+def canned_cli(monkeypatch):
+    """use EXEC_HELP instead of running apptainer exec --help."""
+    monkeypatch.setattr(bindit.singularity, "RUNNER", "apptainer")
+    monkeypatch.setattr(bindit.singularity, "BIND_MODE", "auto")
+    monkeypatch.setattr(bindit, "DRY_RUN", True)
+    monkeypatch.delenv("APPTAINER_BIND", raising=False)
+    monkeypatch.setattr(
+        bindit.singularity,
+        "singularity_cli",
+        lambda runner_name, subcommand: bindit.docker.parse_docker_help(EXEC_HELP),
+    )
+
+
+def test_parse_bind_list():
+    binds = bindit.singularity.parse_bind_list("/a:/b,/c,/d:/e:ro")
+    assert binds == {
+        pathlib.Path("/a").resolve(): pathlib.PosixPath("/b"),
+        pathlib.Path("/c").resolve(): pathlib.PosixPath("/c"),
+        pathlib.Path("/d").resolve(): pathlib.PosixPath("/e"),
+    }
+
+
+def test_plan_bind_list(canned_cli):
+    """new binds are coalesced into a single --bind list."""
+    with tempfile.TemporaryDirectory(prefix=TEMPFILE_PREFIX) as sourcedir:
+        sourcedir = pathlib.Path(sourcedir).resolve()
+        (sourcedir / "one").mkdir()
+        (sourcedir / "two").mkdir()
+        plan = bindit.singularity.plan_run(
+            "exec",
+            [
+                "--cleanenv",
+                "-B",
+                "/data:/mnt",
+                IMAGE,
+                "ls",
+                str(sourcedir / "one"),
+                str(sourcedir / "two"),
+            ],
+        )
+        assert plan.runner == ["apptainer", "exec"]
+        assert plan.container_args == ["--cleanenv", "-B", "/data:/mnt"]
+        assert plan.container_name == IMAGE
+        assert plan.bind_args == [
+            "--bind",
+            f"{sourcedir}/one:/bindit{sourcedir}/one,"
+            f"{sourcedir}/two:/bindit{sourcedir}/two",
+        ]
+        assert plan.image_args == [
+            "ls",
+            f"/bindit{sourcedir}/one",
+            f"/bindit{sourcedir}/two",
+        ]
+        assert plan.env is None
+
+
+def test_plan_bind_env(canned_cli, monkeypatch):
+    """long bind lists go through the bind path environment variable."""
+    monkeypatch.setattr(bindit.singularity, "BIND_ENV_THRESHOLD", 0)
+    monkeypatch.setenv("APPTAINER_BIND", "/existing")
+    with tempfile.TemporaryDirectory(prefix=TEMPFILE_PREFIX) as sourcedir:
+        sourcedir = pathlib.Path(sourcedir).resolve()
+        plan = bindit.singularity.plan_run("run", [IMAGE, str(sourcedir)])
+        assert plan.bind_args == []
+        assert plan.env == {
+            "APPTAINER_BIND": f"/existing,{sourcedir}:/bindit{sourcedir}"
+        }
+        assert plan.command_line().startswith(
+            f"APPTAINER_BIND=/existing,{sourcedir}:/bindit{sourcedir} apptainer run"
+        )
+
+
+def test_cli_dryrun(canned_cli):
+    with tempfile.TemporaryDirectory(prefix=TEMPFILE_PREFIX) as sourcedir:
+        sourcedir = pathlib.Path(sourcedir).resolve()
+        result = CliRunner().invoke(
+            bindit.cli.main,
+            ["--dryrun", "singularity", "exec", IMAGE, "ls", str(sourcedir)],
+        )
+        assert result.exit_code == 0
+        assert result.output == (
+            f"apptainer exec --bind {sourcedir}:/bindit{sourcedir} {IMAGE} ls "
+            f"/bindit{sourcedir}\n"
+        )
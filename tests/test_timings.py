@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Timing tests for `bindit` package."""
+import os
+import sys
+import json
+import subprocess
+import bindit
+import bindit.timings
+
+
+def test_phase_disabled(monkeypatch):
+    monkeypatch.setattr(bindit.timings, "OUTPUT", None)
+    monkeypatch.setattr(bindit.timings, "PHASES", {})
+    with bindit.timings.phase("nothing"):
+        pass
+    assert bindit.timings.PHASES == {}
+
+
+def test_phase_counts(monkeypatch, tmp_path):
+    monkeypatch.setattr(bindit.timings, "OUTPUT", str(tmp_path / "timings.json"))
+    monkeypatch.setattr(bindit.timings, "PHASES", {})
+    resolver = bindit.PathResolver()
+    for _ in range(2):
+        with bindit.timings.phase("lookups", resolver=resolver):
+            resolver.exists(tmp_path)
+    record = bindit.timings.report()["phases"]["lookups"]
+    assert record["calls"] == 2
+    assert record["seconds"] > 0
+    # the second lookup is memoized
+    assert record["stat"] == 2
+    assert record["os_stat"] == 1
+
+
+def test_cli_timings_exec(tmp_path, fake_docker):
+    """test that timings are written before bindit hands over to docker."""
+    fake_docker("exit 3")
+    output = tmp_path / "timings.json"
+    env = dict(os.environ, BINDIT_DOCKER_VERSION="20.10")
+    ret = subprocess.run(
+        [sys.executable, "-m", "bindit.cli", "--exec", "--timings", str(output)]
+        + ["docker", "run", "alpine:latest", "ls", str(tmp_path)],
+        env=env,
+        stdout=subprocess.DEVNULL,
+    )
+    assert ret.returncode == 3
+    phases = json.loads(output.read_text())["phases"]
+    for name in ["import", "infer_docker_cli", "parse_container_args"]:
+        assert phases[name]["calls"] == 1
+    assert phases["parse_image_args"]["realpath"] > 0